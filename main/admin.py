@@ -1,14 +1,18 @@
 import csv
 import datetime
-import io
+import itertools
+from typing import Iterable, List
 
 from django.contrib import admin
-from django.contrib.auth.models import User
-from django.http import HttpResponse
+from django.contrib.admin.views.main import ChangeList
+from django.db.models import Count, Exists, OuterRef
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 
-from main.models.util import get_next_event_year
+from main.images import schedule_processing
+from main.models.util import get_next_event_year, iterate_in_chunks
 from .models import (AttendanceProfile,
+                     DailyHeadcount,
                      FoodRestriction,
                      HousingGroup,
                      Job,
@@ -21,6 +25,23 @@ from .models import (AttendanceProfile,
                      UserProfile)
 
 
+class Echo:
+    """A file-like object that returns whatever is written to it, for streaming `csv.writer` output."""
+
+    def write(self, value: str) -> str:  # pylint: disable=no-self-use
+        return value
+
+
+def stream_csv(filename_prefix: str, columns: List[str], rows: Iterable[List]) -> StreamingHttpResponse:
+    writer = csv.writer(Echo())
+    lines = (writer.writerow(row) for row in itertools.chain([columns], rows))
+    now = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    filename = '{}-{}.csv'.format(filename_prefix, now)
+    response = StreamingHttpResponse(lines, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename={}'.format(filename)
+    return response
+
+
 @admin.register(TeamMembership)
 class TeamMembershipAdmin(admin.ModelAdmin):
     list_display = ('team', 'member', 'is_lead')
@@ -36,8 +57,11 @@ class TeamAdmin(admin.ModelAdmin):
     list_display = ('name', 'description', 'size', 'max_size', 'is_full')
     inlines = (TeamMembershipInline,)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(num_members=Count('members'))
+
     def size(self, obj: Team) -> str:
-        return str(obj.members.count())
+        return str(obj.member_count)
 
 
 class IsAttendingListFilter(admin.SimpleListFilter):
@@ -51,13 +75,12 @@ class IsAttendingListFilter(admin.SimpleListFilter):
         ]
 
     def queryset(self, request, queryset):
-        current_year = get_next_event_year()
-        attending_users = User.objects.filter(attendanceprofile__year=current_year)
-        if self.value() == 'yes':
-            return queryset.filter(pk__in=[u.pk for u in attending_users])
+        if self.value() not in ('yes', 'no'):
+            return None
 
-        if self.value() == 'no':
-            return queryset.exclude(pk__in=[u.pk for u in attending_users])
+        attendances = AttendanceProfile.objects.filter(user=OuterRef('user'), year=get_next_event_year())
+        return queryset.annotate(has_current_attendance=Exists(attendances))\
+            .filter(has_current_attendance=self.value() == 'yes')
 
 
 class PaidDuesListFilter(admin.SimpleListFilter):
@@ -74,11 +97,43 @@ class PaidDuesListFilter(admin.SimpleListFilter):
         if self.value() not in ('yes', 'no'):
             return None
 
-        current_year = get_next_event_year()
-        paid_dues = self.value() == 'yes'
-        users = User.objects.filter(attendanceprofile__year=current_year,
-                                    attendanceprofile__paid_dues=paid_dues)
-        return queryset.filter(pk__in=[u.pk for u in users])
+        attendances = AttendanceProfile.objects.filter(user=OuterRef('user'),
+                                                       year=get_next_event_year(),
+                                                       paid_dues=self.value() == 'yes')
+        return queryset.annotate(has_matching_attendance=Exists(attendances))\
+            .filter(has_matching_attendance=True)
+
+
+class ArrivesEarlyListFilter(admin.SimpleListFilter):
+    title = 'Arrives Early'
+    parameter_name = 'arrives_early'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('yes', 'Yes'),
+            ('no', 'No'),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() not in ('yes', 'no'):
+            return None
+        return queryset.arriving_early(self.value() == 'yes')
+
+
+class DepartsLateListFilter(admin.SimpleListFilter):
+    title = 'Departs Late'
+    parameter_name = 'departs_late'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('yes', 'Yes'),
+            ('no', 'No'),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() not in ('yes', 'no'):
+            return None
+        return queryset.departing_late(self.value() == 'yes')
 
 
 class TeamListFilter(admin.SimpleListFilter):
@@ -86,25 +141,32 @@ class TeamListFilter(admin.SimpleListFilter):
     parameter_name = 'teams'
 
     def lookups(self, request, model_admin):
-        teams = Team.objects.all()
-        results = [(team.name, team.name) for team in teams]
+        results = [(name, name) for name in Team.objects.values_list('name', flat=True)]
         results.sort()
         results.insert(0, ('None', 'None'))
         return results
 
     def queryset(self, request, queryset):
         team_name = self.value()
+        if team_name is None:
+            return None
 
         if team_name == 'None':
-            teams = Team.objects.all()
-            users = User.objects.filter(memberships__team__pk__in=[team.pk for team in teams])
-            return queryset.exclude(pk__in=[u.pk for u in users])
+            memberships = TeamMembership.objects.filter(member=OuterRef('user'))
+            return queryset.annotate(has_membership=Exists(memberships)).filter(has_membership=False)
 
-        teams = Team.objects.filter(name=team_name).all()
-        if not teams:
+        # A name that isn't a team leaves the list unfiltered, as it always has.
+        if not Team.objects.filter(name=team_name).exists():
             return None
-        users = User.objects.filter(memberships__team__pk__in=[team.pk for team in teams])
-        return queryset.filter(pk__in=[u.pk for u in users])
+        memberships = TeamMembership.objects.filter(member=OuterRef('user'), team__name=team_name)
+        return queryset.annotate(has_membership=Exists(memberships)).filter(has_membership=True)
+
+
+class UserProfileChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # Every row shows whether the camper is attending and has paid this year.
+        self.result_list = UserProfile.prefetch_current_attendance(self.result_list)
 
 
 @admin.register(UserProfile)
@@ -134,24 +196,22 @@ class UserProfileAdmin(admin.ModelAdmin):
     )
 
     def export_csv(self, request, queryset):
-        csv_stream = io.StringIO()
-        writer = csv.writer(csv_stream)
-        writer.writerow(UserProfile.csv_columns())
-
-        for profile in queryset:
-            writer.writerow(profile.to_csv())
-
-        csv_stream.seek(0)
-        now = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-        filename = 'playacamp-userprofile-csv-export-{}.csv'.format(now)
-        response = HttpResponse(csv_stream, content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename={}'.format(filename)
-        return response
-    
+        return stream_csv('playacamp-userprofile-csv-export',
+                          UserProfile.csv_columns(),
+                          UserProfile.csv_rows(queryset))
+
     export_csv.short_description = "Export to CSV"
 
     actions = [export_csv]
 
+    list_select_related = ('user',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('user__memberships__team')
+
+    def get_changelist(self, request, **kwargs):
+        return UserProfileChangeList
+
     def location(self, obj):
         return obj.city_and_state()
     location.short_description = 'Location'
@@ -188,6 +248,13 @@ class AttendanceProfileAdmin(admin.ModelAdmin):
         'year',
     )
 
+    list_filter = (
+        ArrivesEarlyListFilter,
+        DepartsLateListFilter,
+    )
+
+    list_select_related = ('user', 'to_transportation_method', 'from_transportation_method')
+
     def first_name(self, obj: AttendanceProfile) -> str:
         return obj.user.first_name
     first_name.short_description = 'First Name'
@@ -201,25 +268,23 @@ class AttendanceProfileAdmin(admin.ModelAdmin):
     email.short_description = 'Email'
 
     def export_csv(self, request, queryset):
-        csv_stream = io.StringIO()
-        writer = csv.writer(csv_stream)
-        writer.writerow(AttendanceProfile.csv_columns())
-
-        for profile in queryset:
-            writer.writerow(profile.to_csv())
-
-        csv_stream.seek(0)
-        now = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-        filename = 'playacamp-attendanceprofile-csv-export-{}.csv'.format(now)
-        response = HttpResponse(csv_stream, content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename={}'.format(filename)
-        return response
+        attendances = queryset.select_related('user', 'to_transportation_method', 'from_transportation_method')
+        rows = (attendance.to_csv() for attendance in iterate_in_chunks(attendances))
+        return stream_csv('playacamp-attendanceprofile-csv-export', AttendanceProfile.csv_columns(), rows)
 
     export_csv.short_description = "Export to CSV"
 
     actions = [export_csv]
 
 
+@admin.register(DailyHeadcount)
+class DailyHeadcountAdmin(admin.ModelAdmin):
+    list_display = ('year', 'event_day', 'count')
+    list_filter = ('year',)
+    ordering = ('-year', 'event_day')
+    readonly_fields = ('year', 'event_day', 'count')
+
+
 @admin.register(HousingGroup)
 class HousingGroupAdmin(admin.ModelAdmin):
     pass
@@ -243,6 +308,15 @@ class JobAssignmentAdmin(admin.ModelAdmin):
 @admin.register(Skill)
 class SkillAdmin(admin.ModelAdmin):
     list_display = ('name', 'description')
+    exclude = ('picture', 'picture_processing')
+
+    def save_model(self, request, obj: Skill, form, change: bool) -> None:
+        if 'picture_original' not in form.changed_data or not obj.picture_original:
+            super().save_model(request, obj, form, change)
+            return
+        obj.picture_processing = True
+        super().save_model(request, obj, form, change)
+        schedule_processing(obj, Skill.PICTURE)
 
 
 @admin.register(SocialMediaLink)
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class MainConfig(AppConfig):
+    name = 'main'
+
+    def ready(self):
+        import main.checks  # noqa pylint: disable=unused-variable
+        import main.signals  # noqa pylint: disable=unused-variable
+        from main.middleware import instrument_templates
+        instrument_templates()
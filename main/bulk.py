@@ -0,0 +1,453 @@
+"""
+Bulk import and export of campers, for onboarding a season of signups at once.
+
+Each camper is one flat record of the fields in `FIELDS`, written as CSV (with lists
+joined by `;`) or as JSON Lines. Skills, food restrictions, teams and transportation
+methods are referred to by name, and the attendance fields describe the camper's
+attendance for `year`, if there is one. Exports only include password hashes when
+asked to; imports take either a `password` to hash or a `password_hash` to keep, and
+campers with neither get an unusable password, so that they have to reset it.
+
+Imports check every record before writing anything, hash the passwords in a process
+pool, and then write with `bulk_create` in one transaction per chunk. `bulk_create`
+skips the model signals, so each chunk also does what the handlers in `main.signals`
+would have: indexing the profiles for search, adding the stays to the daily headcounts,
+bumping the stamps of the cached team fragments and dropping the snapshot of open
+teams.
+"""
+import csv
+import json
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, IO, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from main.models import AttendanceProfile, DailyHeadcount, Team, TeamMembership, UserProfile, reference_data
+from main.models.util import iterate_chunks
+from main.search import ProfileDocument, get_search_backend
+
+FIELDS = (
+    'email',
+    'first_name',
+    'last_name',
+    'password_hash',
+    'phone_number',
+    'zipcode',
+    'playa_name',
+    'years_on_playa',
+    'invited_by',
+    'biography',
+    'is_verified_by_admin',
+    'skills',
+    'food_restrictions',
+    'teams',
+    'led_teams',
+    'year',
+    'arrival_date',
+    'departure_date',
+    'to_transportation_method',
+    'from_transportation_method',
+    'has_early_pass',
+    'has_ticket',
+    'has_vehicle_pass',
+    'paid_dues',
+    'bicycle_status',
+)
+ATTENDANCE_FIELDS = FIELDS[FIELDS.index('year'):]
+LIST_FIELDS = frozenset(['skills', 'food_restrictions', 'teams', 'led_teams'])
+TRANSPORTATION_METHOD_FIELDS = frozenset(['to_transportation_method', 'from_transportation_method'])
+LIST_SEPARATOR = ';'
+FORMATS = ('csv', 'jsonl')
+
+# Small enough for the `username__in` lookups to stay under SQLite's 999 parameters.
+DEFAULT_CHUNK_SIZE = 500
+
+BOOLEAN_VALUES = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
+BICYCLE_STATUSES = frozenset(value for value, _ in AttendanceProfile._meta.get_field('bicycle_status').choices)
+
+
+class InvalidRecord(ValueError):
+    def __init__(self, line: int, message: str) -> None:
+        super().__init__('line {}: {}'.format(line, message))
+        self.line = line
+
+
+class CamperRecord(NamedTuple):
+    line: int
+    email: str
+    first_name: str
+    last_name: str
+    password: Optional[str]
+    password_hash: Optional[str]
+    phone_number: Optional[str]
+    zipcode: Optional[str]
+    playa_name: Optional[str]
+    years_on_playa: Optional[int]
+    invited_by: Optional[str]
+    biography: str
+    is_verified_by_admin: Optional[bool]
+    skill_ids: List[int]
+    food_restriction_ids: List[int]
+    team_ids: List[int]
+    led_team_ids: List[int]
+    year: Optional[int]
+    arrival_date: Optional[str]
+    departure_date: Optional[str]
+    to_transportation_method_id: Optional[int]
+    from_transportation_method_id: Optional[int]
+    has_early_pass: Optional[bool]
+    has_ticket: Optional[bool]
+    has_vehicle_pass: Optional[bool]
+    paid_dues: bool
+    bicycle_status: Optional[str]
+
+
+class ImportSummary(NamedTuple):
+    created: int
+    skipped: int
+
+
+class RecordParser:
+    """Checks raw records and resolves the names in them, looking each table up only once."""
+
+    def __init__(self) -> None:
+        self.skill_ids = {skill.name: skill.pk for skill in reference_data.skills.all()}
+        self.food_restriction_ids = {restriction.name: restriction.pk
+                                     for restriction in reference_data.food_restrictions.all()}
+        self.transportation_method_ids = {method.name: method.pk
+                                          for method in reference_data.transportation_methods.all()}
+        self.team_ids = dict(Team.objects.values_list('name', 'pk'))
+
+    def parse(self, line: int, raw: Dict[str, Any]) -> CamperRecord:
+        def text(key: str) -> Optional[str]:
+            value = raw.get(key)
+            if value is None:
+                return None
+            value = str(value).strip()
+            return value or None
+
+        def integer(key: str) -> Optional[int]:
+            value = text(key)
+            if value is None:
+                return None
+            try:
+                return int(value)
+            except ValueError:
+                raise InvalidRecord(line, '{} must be a whole number, not {!r}'.format(key, value))
+
+        def boolean(key: str) -> Optional[bool]:
+            value = raw.get(key)
+            if value is None or isinstance(value, bool):
+                return value
+            value = str(value).strip().lower()
+            if not value:
+                return None
+            if value not in BOOLEAN_VALUES:
+                raise InvalidRecord(line, '{} must be true or false, not {!r}'.format(key, value))
+            return BOOLEAN_VALUES[value]
+
+        def choice(key: str, choices: Iterable[str]) -> Optional[str]:
+            value = text(key)
+            if value is not None and value not in choices:
+                raise InvalidRecord(line, 'unknown {} {!r}'.format(key, value))
+            return value
+
+        def named(key: str, ids_by_name: Dict[str, int]) -> Optional[int]:
+            name = text(key)
+            if name is None:
+                return None
+            if name not in ids_by_name:
+                raise InvalidRecord(line, 'unknown {} {!r}'.format(key, name))
+            return ids_by_name[name]
+
+        def named_list(key: str, ids_by_name: Dict[str, int]) -> List[int]:
+            value = raw.get(key) or []
+            names = value.split(LIST_SEPARATOR) if isinstance(value, str) else value
+            ids = []  # type: List[int]
+            for name in names:
+                name = str(name).strip()
+                if not name:
+                    continue
+                if name not in ids_by_name:
+                    raise InvalidRecord(line, 'unknown {} {!r}'.format(key, name))
+                if ids_by_name[name] not in ids:
+                    ids.append(ids_by_name[name])
+            return ids
+
+        email = text('email')
+        if email is None:
+            raise InvalidRecord(line, 'email is required')
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise InvalidRecord(line, 'invalid email {!r}'.format(email))
+
+        phone_number = text('phone_number')
+        if phone_number is not None:
+            try:
+                phone_number = UserProfile.parse_phone_number(phone_number)
+            except ValidationError as e:
+                raise InvalidRecord(line, e.messages[0])
+
+        team_ids = named_list('teams', self.team_ids)
+        led_team_ids = named_list('led_teams', self.team_ids)
+        paid_dues = boolean('paid_dues')
+        return CamperRecord(
+            line=line,
+            email=email,
+            first_name=text('first_name') or '',
+            last_name=text('last_name') or '',
+            password=text('password'),
+            password_hash=text('password_hash'),
+            phone_number=phone_number,
+            zipcode=text('zipcode'),
+            playa_name=text('playa_name'),
+            years_on_playa=integer('years_on_playa'),
+            invited_by=text('invited_by'),
+            biography=text('biography') or '',
+            is_verified_by_admin=boolean('is_verified_by_admin'),
+            skill_ids=named_list('skills', self.skill_ids),
+            food_restriction_ids=named_list('food_restrictions', self.food_restriction_ids),
+            team_ids=team_ids + [team_id for team_id in led_team_ids if team_id not in team_ids],
+            led_team_ids=led_team_ids,
+            year=integer('year'),
+            arrival_date=choice('arrival_date', AttendanceProfile.ARRIVAL_LABELS),
+            departure_date=choice('departure_date', AttendanceProfile.DEPARTURE_LABELS),
+            to_transportation_method_id=named('to_transportation_method', self.transportation_method_ids),
+            from_transportation_method_id=named('from_transportation_method', self.transportation_method_ids),
+            has_early_pass=boolean('has_early_pass'),
+            has_ticket=boolean('has_ticket'),
+            has_vehicle_pass=boolean('has_vehicle_pass'),
+            paid_dues=bool(paid_dues),
+            bicycle_status=choice('bicycle_status', BICYCLE_STATUSES),
+        )
+
+
+def read_records(file: IO[str], file_format: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yields `(line number, raw record)` for each camper in `file`."""
+    if file_format == 'csv':
+        reader = csv.DictReader(file)
+        for raw in reader:
+            yield reader.line_num, raw
+        return
+    for line, text in enumerate(file, start=1):
+        if not text.strip():
+            continue
+        try:
+            raw = json.loads(text)
+        except ValueError as e:
+            raise InvalidRecord(line, 'invalid JSON: {}'.format(e))
+        if not isinstance(raw, dict):
+            raise InvalidRecord(line, 'expected a JSON object')
+        yield line, raw
+
+
+def write_records(records: Iterable[Dict[str, Any]], file: IO[str], file_format: str) -> int:
+    count = 0
+    if file_format == 'csv':
+        writer = csv.DictWriter(file, fieldnames=FIELDS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow({key: LIST_SEPARATOR.join(value) if key in LIST_FIELDS else value
+                             for key, value in record.items()})
+            count += 1
+        return count
+    for record in records:
+        file.write(json.dumps(record, sort_keys=True))
+        file.write('\n')
+        count += 1
+    return count
+
+
+def hash_passwords(passwords: Sequence[str], workers: Optional[int]=None) -> List[str]:
+    """
+    The hashers are slow on purpose, so anything more than one password is hashed in a
+    pool of `workers` processes.
+    """
+    if len(passwords) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(make_password, passwords, chunksize=16))
+    return [make_password(password) for password in passwords]
+
+
+def import_campers(raw_records: Iterable[Tuple[int, Dict[str, Any]]],
+                   chunk_size: int=DEFAULT_CHUNK_SIZE,
+                   workers: Optional[int]=None) -> ImportSummary:
+    """
+    Creates the campers in `raw_records` whose emails aren't taken yet. Raises
+    `InvalidRecord` before writing anything if any record doesn't check out.
+    """
+    parser = RecordParser()
+    records = []  # type: List[CamperRecord]
+    lines_by_email = {}  # type: Dict[str, int]
+    for line, raw in raw_records:
+        record = parser.parse(line, raw)
+        if record.email in lines_by_email:
+            raise InvalidRecord(line, '{} is already on line {}'.format(record.email, lines_by_email[record.email]))
+        lines_by_email[record.email] = line
+        records.append(record)
+
+    existing_emails = set()  # type: Set[str]
+    for start in range(0, len(records), chunk_size):
+        emails = [record.email for record in records[start:start + chunk_size]]
+        existing_emails.update(User.objects.filter(username__in=emails).values_list('username', flat=True))
+    records = [record for record in records if record.email not in existing_emails]
+
+    # Exported campers keep their hashes, so only new passwords need hashing.
+    hashes = iter(hash_passwords([record.password for record in records
+                                  if record.password_hash is None and record.password is not None],
+                                 workers))
+    passwords = [record.password_hash or (make_password(None) if record.password is None else next(hashes))
+                 for record in records]
+    for start in range(0, len(records), chunk_size):
+        with transaction.atomic():
+            _create_campers(records[start:start + chunk_size], passwords[start:start + chunk_size])
+    return ImportSummary(created=len(records), skipped=len(existing_emails))
+
+
+def _create_campers(records: Sequence[CamperRecord], passwords: Sequence[str]) -> None:
+    User.objects.bulk_create([
+        User(username=record.email,
+             email=record.email,
+             first_name=record.first_name,
+             last_name=record.last_name,
+             password=password)
+        for record, password in zip(records, passwords)
+    ])
+    # SQLite doesn't hand back primary keys from `bulk_create`, so re-read them.
+    user_ids = dict(User.objects.filter(username__in=[record.email for record in records])
+                    .values_list('username', 'pk'))
+
+    UserProfile.objects.bulk_create([
+        UserProfile(user_id=user_ids[record.email],
+                    phone_number=record.phone_number,
+                    zipcode=record.zipcode,
+                    playa_name=record.playa_name,
+                    years_on_playa=record.years_on_playa,
+                    invited_by=record.invited_by,
+                    biography=record.biography,
+                    is_verified_by_admin=record.is_verified_by_admin)
+        for record in records
+    ])
+    attendances = [
+        AttendanceProfile(user_id=user_ids[record.email],
+                          year=record.year,
+                          arrival_date=record.arrival_date,
+                          departure_date=record.departure_date,
+                          to_transportation_method_id=record.to_transportation_method_id,
+                          from_transportation_method_id=record.from_transportation_method_id,
+                          has_early_pass=record.has_early_pass,
+                          has_ticket=record.has_ticket,
+                          has_vehicle_pass=record.has_vehicle_pass,
+                          paid_dues=record.paid_dues,
+                          bicycle_status=record.bicycle_status)
+        for record in records
+        if record.year is not None
+    ]
+    AttendanceProfile.objects.bulk_create(attendances)
+    TeamMembership.objects.bulk_create([
+        TeamMembership(team_id=team_id, member_id=user_ids[record.email], is_lead=team_id in record.led_team_ids)
+        for record in records
+        for team_id in record.team_ids
+    ])
+    skills = UserProfile.skills.through
+    skills.objects.bulk_create([skills(userprofile_id=user_ids[record.email], skill_id=skill_id)
+                                for record in records
+                                for skill_id in record.skill_ids])
+    food_restrictions = UserProfile.food_restrictions.through
+    food_restrictions.objects.bulk_create([
+        food_restrictions(userprofile_id=user_ids[record.email], foodrestriction_id=restriction_id)
+        for record in records
+        for restriction_id in record.food_restriction_ids
+    ])
+
+    # What the signal handlers would have done for each of the rows. The search documents
+    # are built from the records, which is much quicker than prefetching them back.
+    skill_names = {skill.pk: skill.name for skill in reference_data.skills.all()}
+    get_search_backend().index([
+        ProfileDocument(user_id=user_ids[record.email],
+                        name='{} {}'.format(record.first_name, record.last_name).strip(),
+                        playa_name=record.playa_name or '',
+                        email=record.email,
+                        skills=' '.join(skill_names[skill_id] for skill_id in record.skill_ids),
+                        biography=record.biography)
+        for record in records
+        if record.is_verified_by_admin
+    ])
+    stays = Counter(attendance.headcount_stay() for attendance in attendances)
+    for stay, count in stays.items():
+        if stay is not None:
+            DailyHeadcount.apply_stay(*stay, delta=count)
+    team_ids = {team_id for record in records for team_id in record.team_ids}
+    if team_ids:
+        Team.objects.filter(pk__in=team_ids).update(updated_at=timezone.now())
+        Team.forget_open_teams()
+
+
+def export_campers(profiles: QuerySet, year: int, include_password_hashes: bool=False) -> Iterator[Dict[str, Any]]:
+    """
+    Yields a record for each of `profiles`, with their attendance for `year`, in the form
+    `import_campers` reads. The related rows are read as plain values a chunk at a time;
+    `prefetch_related` costs more than the rest of the export put together.
+    """
+    skill_names = {skill.pk: skill.name for skill in reference_data.skills.all()}
+    food_restriction_names = {restriction.pk: restriction.name
+                              for restriction in reference_data.food_restrictions.all()}
+    transportation_method_names = {method.pk: method.name for method in reference_data.transportation_methods.all()}
+    team_names = dict(Team.objects.values_list('pk', 'name'))
+
+    for chunk in iterate_chunks(profiles.select_related('user')):
+        user_ids = [profile.user_id for profile in chunk]
+        skills_by_user_id = defaultdict(list)  # type: Dict[int, List[str]]
+        for user_id, skill_id in UserProfile.skills.through.objects.filter(userprofile_id__in=user_ids)\
+                .values_list('userprofile_id', 'skill_id'):
+            skills_by_user_id[user_id].append(skill_names[skill_id])
+        food_restrictions_by_user_id = defaultdict(list)  # type: Dict[int, List[str]]
+        for user_id, restriction_id in UserProfile.food_restrictions.through.objects\
+                .filter(userprofile_id__in=user_ids).values_list('userprofile_id', 'foodrestriction_id'):
+            food_restrictions_by_user_id[user_id].append(food_restriction_names[restriction_id])
+        teams_by_user_id = defaultdict(list)  # type: Dict[int, List[Tuple[str, bool]]]
+        for user_id, team_id, is_lead in TeamMembership.objects.filter(member_id__in=user_ids)\
+                .values_list('member_id', 'team_id', 'is_lead'):
+            teams_by_user_id[user_id].append((team_names[team_id], is_lead))
+        attendances_by_user_id = {attendance.user_id: attendance
+                                  for attendance in AttendanceProfile.objects.filter(user_id__in=user_ids,
+                                                                                     year=year,
+                                                                                     deleted_at__isnull=True)}
+
+        for profile in chunk:
+            teams = sorted(teams_by_user_id[profile.user_id])
+            record = {
+                'email': profile.user.email,
+                'first_name': profile.user.first_name,
+                'last_name': profile.user.last_name,
+                'password_hash': profile.user.password if include_password_hashes else None,
+                'phone_number': profile.phone_number,
+                'zipcode': profile.zipcode,
+                'playa_name': profile.playa_name,
+                'years_on_playa': profile.years_on_playa,
+                'invited_by': profile.invited_by,
+                'biography': profile.biography,
+                'is_verified_by_admin': profile.is_verified_by_admin,
+                'skills': sorted(skills_by_user_id[profile.user_id]),
+                'food_restrictions': sorted(food_restrictions_by_user_id[profile.user_id]),
+                'teams': [name for name, _ in teams],
+                'led_teams': [name for name, is_lead in teams if is_lead],
+            }  # type: Dict[str, Any]
+            attendance = attendances_by_user_id.get(profile.user_id)
+            for key in ATTENDANCE_FIELDS:
+                if attendance is None:
+                    record[key] = None
+                elif key in TRANSPORTATION_METHOD_FIELDS:
+                    # By id, as reading the related object would load it.
+                    record[key] = transportation_method_names.get(getattr(attendance, key + '_id'))
+                else:
+                    record[key] = getattr(attendance, key)
+            yield record
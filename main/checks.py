@@ -0,0 +1,23 @@
+import os
+
+from django.conf import settings
+from django.core import checks
+
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',
+                        'django.core.cache.backends.dummy.DummyCache')
+
+
+@checks.register('caches')
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The reference data versions and the open teams snapshot are only invalidated in the
+    worker that made the change, unless all the workers share one cache.
+    """
+    if settings.DEBUG or 'DATABASE_URL' not in os.environ:
+        return []
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [checks.Error('The default cache, {}, is not shared between workers'.format(backend),
+                         hint='Leave CACHE_BACKEND unset to use the database cache, or point it at a shared backend.',
+                         id='main.E001')]
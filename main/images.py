@@ -0,0 +1,194 @@
+"""
+Background processing for uploaded pictures.
+
+Uploads are stored untouched as an "original" and the request returns straight away.
+Once the upload's transaction commits, a worker thread decodes the original and stores
+it as a WebP variant for each of the spec's sizes, named `<name>-<token>-<size>.webp`.
+The model's picture field points at the largest variant and the others are found by
+swapping the size in its name, which lets templates offer a `srcset` without any extra
+queries. Until processing finishes the models serve a placeholder.
+
+With `IMAGE_PROCESSING_EAGER` set (as it is under `manage.py test`) pictures are
+processed synchronously instead, since test transactions never commit.
+"""
+import logging
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from typing import Callable, List, NamedTuple, Optional, Tuple, Type
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.db import connection, models, transaction
+from django.db.models.fields.files import FieldFile
+from django.utils.encoding import filepath_to_uri
+from django_resized.forms import normalize_rotation
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+VARIANT_FORMAT = 'WEBP'
+VARIANT_NAME_PATTERN = re.compile(r'-(\d+)\.webp$')
+
+
+class PictureSpec(NamedTuple):
+    original_field: str
+    picture_field: str
+    processing_field: str
+    sizes: Tuple[int, ...]
+    quality: int
+
+    @property
+    def largest_size(self) -> int:
+        return max(self.sizes)
+
+
+_executor = None  # type: Optional[ThreadPoolExecutor]
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                                           thread_name_prefix='image-processing')
+        return _executor
+
+
+def resize_image(file: File, sizes: Tuple[int, ...], quality: int) -> List[Tuple[int, ContentFile]]:
+    """
+    Decodes the image in `file` once and shrinks it to fit within a square of each of
+    `sizes`, returning `(size, WebP content)` pairs, largest first.
+    """
+    image = normalize_rotation(Image.open(file))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    variants = []
+    # Each variant is shrunk from the previous, larger one rather than from the original.
+    for size in sorted(sizes, reverse=True):
+        image = image.copy()
+        image.thumbnail((size, size), Image.ANTIALIAS)
+        buffer = BytesIO()
+        image.save(buffer, format=VARIANT_FORMAT, quality=quality)
+        variants.append((size, ContentFile(buffer.getvalue())))
+    return variants
+
+
+def variant_name(name: str, size: int) -> Optional[str]:
+    """The storage name of the `size` variant of the picture stored as `name`, if it has variants."""
+    if not VARIANT_NAME_PATTERN.search(name):
+        # Pictures processed before there were variants.
+        return None
+    return VARIANT_NAME_PATTERN.sub('-{}.webp'.format(size), name)
+
+
+def media_url(name: str) -> str:
+    """
+    The public URL of the stored file `name`. Media is served from `MEDIA_URL`, so this
+    is computed without going through the storage backend, and memoized: stored names are
+    unique per upload, so a cached URL never goes stale.
+    """
+    return _media_url(settings.MEDIA_URL, name)
+
+
+@lru_cache(maxsize=8192)
+def _media_url(base_url: str, name: str) -> str:
+    return urljoin(base_url, filepath_to_uri(name))
+
+
+def picture_url(picture: FieldFile, spec: PictureSpec, size: Optional[int]=None) -> str:
+    """The URL of the smallest variant of `picture` at least `size` pixels across."""
+    if size is not None:
+        fitting_sizes = [variant_size for variant_size in sorted(spec.sizes) if variant_size >= size]
+        name = variant_name(picture.name, fitting_sizes[0] if fitting_sizes else spec.largest_size)
+        if name is not None:
+            return media_url(name)
+    return media_url(picture.name)
+
+
+def picture_srcset(picture: FieldFile, spec: PictureSpec) -> str:
+    return _picture_srcset(settings.MEDIA_URL, picture.name, spec.sizes)
+
+
+@lru_cache(maxsize=4096)
+def _picture_srcset(base_url: str, name: str, sizes: Tuple[int, ...]) -> str:
+    names = [(size, variant_name(name, size)) for size in sorted(sizes)]
+    return ', '.join('{} {}w'.format(_media_url(base_url, variant), size)
+                     for size, variant in names if variant is not None)
+
+
+def upload_original(instance: models.Model, spec: PictureSpec, upload: File) -> None:
+    """Stores `upload` as the original picture of `instance` and schedules its processing."""
+    getattr(instance, spec.original_field).save(os.path.basename(upload.name), upload, save=False)
+    setattr(instance, spec.processing_field, True)
+    instance.save(update_fields=[spec.original_field, spec.processing_field])
+    schedule_processing(instance, spec)
+
+
+def schedule_processing(instance: models.Model, spec: PictureSpec) -> None:
+    model, pk = type(instance), instance.pk
+
+    def run() -> None:
+        process_picture(model, pk, spec)
+
+    if settings.IMAGE_PROCESSING_EAGER:
+        run()
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run_in_worker, run))
+
+
+def _run_in_worker(task: Callable[[], None]) -> None:
+    try:
+        task()
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Processing a picture failed')
+    finally:
+        # Worker threads get their own connection, which nothing else would close.
+        connection.close()
+
+
+def process_picture(model: Type[models.Model], pk, spec: PictureSpec) -> None:
+    from main.models import reference_data
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    original = getattr(instance, spec.original_field)
+    if not original:
+        return
+    # Only ever write back the result for the original we actually processed, in case a
+    # newer upload has replaced it in the meantime.
+    current = model.objects.filter(pk=pk, **{spec.original_field: original.name})
+
+    try:
+        original.open('rb')
+        try:
+            variants = resize_image(original.file, spec.sizes, spec.quality)
+        finally:
+            original.close()
+    except (IOError, SyntaxError):
+        logger.exception('Could not process %s', original.name)
+        current.update(**{spec.processing_field: False})
+        reference_data.invalidate(model)
+        return
+
+    picture = getattr(instance, spec.picture_field)
+    stem = os.path.splitext(os.path.basename(original.name))[0]
+    token = uuid.uuid4().hex[:8]
+    names = [
+        picture.storage.save(picture.field.generate_filename(instance, '{}-{}-{}.webp'.format(stem, token, size)),
+                             content)
+        for size, content in variants
+    ]
+    if not current.update(**{spec.picture_field: names[0], spec.processing_field: False}):
+        for name in names:
+            picture.storage.delete(name)
+        return
+    # Updating through the queryset skips the signals that refresh cached copies.
+    reference_data.invalidate(model)
@@ -0,0 +1,382 @@
+import csv
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+from io import StringIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+import django
+from django.conf import settings
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.http import HttpResponse
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from uszipcode import ZipcodeSearchEngine
+
+from main.admin import IsAttendingListFilter, PaidDuesListFilter, TeamListFilter
+from main.models import AttendanceProfile, Team, TeamMembership, UserProfile
+from main.models.event_day import EVENT_DAY_BY_ARRIVAL_CHOICES, EVENT_DAY_BY_DEPARTURE_CHOICES, days_between
+from main.models.util import get_next_event_year
+from main.models.zipcode_index import ZipcodeInfo, get_zipcode_index
+from main.search import search_profiles
+from main.synthetic import SyntheticCamp, create_camp, rolled_back
+
+USER_PROFILE_FILTERS = (
+    {'is_attending': 'yes'},
+    {'is_attending': 'no'},
+    {'paid_dues': 'yes'},
+    {'paid_dues': 'no'},
+    {'is_verified_by_admin__exact': '1'},
+    {'is_verified_by_admin__exact': '0'},
+    {'teams': 'None'},
+)
+ATTENDANCE_PROFILE_FILTERS = (
+    {'arrives_early': 'yes'},
+    {'arrives_early': 'no'},
+    {'departs_late': 'yes'},
+    {'departs_late': 'no'},
+)
+SEARCH_QUERIES = ('alice', 'smith', 'grace kim', 'dino 12', 'welding', 'sunrise bikes', 'example', 'zzz')
+SAMPLE_ZIPCODES = ('94103', '10001', '60601', '98101', '89501', '78701', '02139', '80202')
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=settings.BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_response(response: HttpResponse) -> int:
+    # Streamed responses such as the CSV exports do their work as they're read.
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response.status_code
+
+
+def describe(params: Dict[str, str]) -> str:
+    return ' '.join('{}={}'.format(key, value) for key, value in sorted(params.items()))
+
+
+# How the code looked before each of the changes that `bench <comparison>` checks on.
+
+def materialized_is_attending(self, request, queryset):
+    attending_users = User.objects.filter(attendanceprofile__year=get_next_event_year())
+    if self.value() == 'yes':
+        return queryset.filter(pk__in=[u.pk for u in attending_users])
+    if self.value() == 'no':
+        return queryset.exclude(pk__in=[u.pk for u in attending_users])
+
+
+def materialized_paid_dues(self, request, queryset):
+    if self.value() not in ('yes', 'no'):
+        return None
+    users = User.objects.filter(attendanceprofile__year=get_next_event_year(),
+                                attendanceprofile__paid_dues=self.value() == 'yes')
+    return queryset.filter(pk__in=[u.pk for u in users])
+
+
+def materialized_teams(self, request, queryset):
+    team_name = self.value()
+    if team_name == 'None':
+        users = User.objects.filter(memberships__team__pk__in=[team.pk for team in Team.objects.all()])
+        return queryset.exclude(pk__in=[u.pk for u in users])
+    teams = Team.objects.filter(name=team_name).all()
+    if not teams:
+        return None
+    users = User.objects.filter(memberships__team__pk__in=[team.pk for team in teams])
+    return queryset.filter(pk__in=[u.pk for u in users])
+
+
+def count_in_python(year: int) -> Dict[str, int]:
+    """The daily counts as `dailycounts` used to compute them, one attendee at a time."""
+    count_by_day = defaultdict(int)  # type: Dict[str, int]
+    for attendance_profile in AttendanceProfile.objects.filter(year=year, deleted_at__isnull=True):
+        if attendance_profile.arrival_date is None or attendance_profile.departure_date is None:
+            continue
+        arrival_day = EVENT_DAY_BY_ARRIVAL_CHOICES[attendance_profile.arrival_date]
+        departure_day = EVENT_DAY_BY_DEPARTURE_CHOICES[attendance_profile.departure_date]
+        for day in days_between(arrival_day, departure_day):
+            count_by_day[day.name] += 1
+    return count_by_day
+
+
+def count_in_sql(year: int) -> Dict[str, int]:
+    headcount, = AttendanceProfile.headcounts([year])
+    return {day.name: count for day, count in headcount.by_day.items() if count}
+
+
+def contains_search(query: str, limit: int) -> List[int]:
+    """The directory search as it was before the search index."""
+    profiles = UserProfile.objects.filter(Q(playa_name__contains=query) |
+                                          Q(user__email__contains=query) |
+                                          Q(user__first_name__contains=query) |
+                                          Q(user__last_name__contains=query))
+    return list(profiles.filter(is_verified_by_admin=True).values_list('pk', flat=True)[:limit])
+
+
+def create_camper_hashing_twice(data: Dict[str, Any]) -> User:
+    User.objects.create_user(username=data['email'],
+                             email=data['email'],
+                             password=data['password'],
+                             first_name=data['first_name'],
+                             last_name=data['last_name'])
+    user = authenticate(username=data['email'], password=data['password'])
+    profile = UserProfile(user=user,
+                          years_on_playa=data['years_on_playa'],
+                          invited_by=data['invited_by'],
+                          phone_number=data['phone'],
+                          zipcode=data['zipcode'])
+    profile.save()
+    for team in data['interested_teams']:
+        TeamMembership(member=user, team=team).save()
+    return user
+
+
+def search_engine_per_call(profile: UserProfile) -> Optional[ZipcodeInfo]:
+    """How `UserProfile.get_rich_zipcode` used to work: a new search engine per lookup."""
+    if not profile.zipcode:
+        return None
+    zipcode = ZipcodeSearchEngine().by_zipcode(profile.zipcode)
+    if zipcode['Zipcode'] is None:
+        return None
+    return ZipcodeInfo(zipcode=zipcode['Zipcode'],
+                       city=zipcode['City'],
+                       state=zipcode['State'],
+                       latitude=zipcode['Latitude'],
+                       longitude=zipcode['Longitude'])
+
+
+class Command(BaseCommand):
+    help = ('Times the main pages, the admin and the exports against a synthetic camp, or the code from before '
+            'and after one of the optimisations, and writes the results as JSON')
+
+    # Each comparison times the same work twice, first with the old code patched back in.
+    COMPARISONS = {
+        'admin': 'compare_admin',
+        'dailycounts': 'compare_dailycounts',
+        'search': 'compare_search',
+        'signup': 'compare_signup',
+        'zipcodes': 'compare_zipcodes',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('comparison', nargs='?', choices=sorted(self.COMPARISONS),
+                            help='Time the code from before and after this change instead of the entry points')
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--teams', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='-', help="File to write the results to, or '-' for stdout")
+
+    def handle(self, *args, **options):
+        # Lets the captcha through.
+        os.environ['RECAPTCHA_TESTING'] = 'True'
+        # The request metrics are in the results already, and would get mixed up with them on stdout.
+        logging.getLogger('main.middleware').setLevel(logging.ERROR)
+        with rolled_back():
+            camp = create_camp(options['users'], options['teams'], get_next_event_year(), prefix='bench',
+                               seed=options['seed'])
+            if options['comparison'] is None:
+                entry_points = self.entry_points(camp)
+            else:
+                entry_points = getattr(self, self.COMPARISONS[options['comparison']])(camp)
+            results = {}
+            for name, run in entry_points:
+                results[name] = self.measure(run, options['repeat'])
+                self.stderr.write('{}: {:.1f}ms, {} queries\n'.format(name,
+                                                                      results[name]['median_ms'],
+                                                                      results[name]['queries']))
+        # The open teams snapshot lives in the cache, so it would outlast the rollback.
+        Team.forget_open_teams()
+
+        output = json.dumps({
+            'commit': current_commit(),
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'comparison': options['comparison'],
+            'users': options['users'],
+            'teams': options['teams'],
+            'repeat': options['repeat'],
+            'seed': options['seed'],
+            'results': results,
+        }, indent=2, sort_keys=True)
+        if options['output'] == '-':
+            self.stdout.write(output)
+        else:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+
+    def entry_points(self, camp: SyntheticCamp) -> List[Tuple[str, Callable[[], int]]]:
+        client = self.admin_client()
+        camper = camp.users[len(camp.users) // 2]
+        team = camp.teams[0]
+
+        def get(url: str, params: Optional[Dict[str, str]]=None) -> Callable[[], int]:
+            return lambda: read_response(client.get(url, params, secure=True))
+
+        entry_points = [
+            ('list_profiles', get(reverse('user-profile-list'))),
+            ('list_profiles search', get(reverse('user-profile-list'), {'search': 'dino welding'})),
+            ('user_profile.get', get(reverse('user-profile', args=[camper.pk]))),
+            ('team.list', get(reverse('team-list'))),
+            ('team.get', get(reverse('team-detail', args=[team.pk]))),
+            ('signup.post', self.signup(camp, 'bench-signup')),
+        ]
+        for name, filters in (('userprofile', ({},) + USER_PROFILE_FILTERS + ({'teams': team.name},)),
+                              ('attendanceprofile', ({},) + ATTENDANCE_PROFILE_FILTERS)):
+            url = reverse('admin:main_{}_changelist'.format(name))
+            for params in filters:
+                entry_points.append((' '.join(filter(None, ['admin', name, describe(params)])), get(url, params)))
+            entry_points.append(('admin {} export_csv'.format(name), self.export_csv(client, url)))
+        entry_points.append(('dailycounts', self.dailycounts(camp.year)))
+        return entry_points
+
+    def compare_admin(self, camp: SyntheticCamp) -> List[Tuple[str, Callable[[], int]]]:
+        """The `UserProfile` changelist with list filters that load the matching pks into Python."""
+        client = self.admin_client()
+        url = reverse('admin:main_userprofile_changelist')
+
+        def get(params: Dict[str, str], patched: bool) -> Callable[[], int]:
+            def run() -> int:
+                if not patched:
+                    return read_response(client.get(url, params, secure=True))
+                with mock.patch.object(IsAttendingListFilter, 'queryset', materialized_is_attending), \
+                        mock.patch.object(PaidDuesListFilter, 'queryset', materialized_paid_dues), \
+                        mock.patch.object(TeamListFilter, 'queryset', materialized_teams):
+                    return read_response(client.get(url, params, secure=True))
+            return run
+
+        filters = ({},) + USER_PROFILE_FILTERS + ({'teams': camp.teams[0].name},)
+        return [('{} {}'.format(when, describe(params) or 'unfiltered'), get(params, when == 'before'))
+                for when in ('before', 'after')
+                for params in filters]
+
+    @staticmethod
+    def compare_dailycounts(camp: SyntheticCamp) -> List[Tuple[str, Callable[[], int]]]:
+        """`dailycounts` walking every attendee in Python against grouping them in SQL."""
+        assert count_in_python(camp.year) == count_in_sql(camp.year)
+
+        def run(count: Callable[[int], Dict[str, int]]) -> Callable[[], int]:
+            return lambda: len(count(camp.year))
+        return [('before dailycounts', run(count_in_python)), ('after dailycounts', run(count_in_sql))]
+
+    @staticmethod
+    def compare_search(camp: SyntheticCamp) -> List[Tuple[str, Callable[[], int]]]:
+        """The directory search with `__contains` lookups against the search index, over `SEARCH_QUERIES`."""
+        def run(search: Callable[[str, int], List[int]]) -> Callable[[], int]:
+            return lambda: sum(len(search(query, 48)) for query in SEARCH_QUERIES)
+        return [('before search', run(contains_search)), ('after search', run(search_profiles))]
+
+    def compare_signup(self, camp: SyntheticCamp) -> List[Tuple[str, Callable[[], int]]]:
+        """A signup that hashes the password twice, once to create the camper and again to log them in."""
+        signup = self.signup(camp, 'bench-signup-before')
+
+        def hashing_twice() -> int:
+            with mock.patch('main.views.signup.create_camper', create_camper_hashing_twice):
+                return signup()
+        return [('before signup.post', hashing_twice), ('after signup.post', self.signup(camp, 'bench-signup-after'))]
+
+    @staticmethod
+    def compare_zipcodes(camp: SyntheticCamp) -> List[Tuple[str, Callable[[], int]]]:
+        """The rows of the `UserProfile` CSV export, with a zipcode search engine per row against the index."""
+        index = get_zipcode_index()
+        zipcodes = [zipcode for zipcode in SAMPLE_ZIPCODES if zipcode in index]
+        profiles = list(UserProfile.objects.filter(user__in=camp.users)
+                        .select_related('user')
+                        .prefetch_related('skills', 'food_restrictions'))
+        for i, profile in enumerate(profiles):
+            profile.zipcode = zipcodes[i % len(zipcodes)]
+
+        def write_rows() -> int:
+            writer = csv.writer(StringIO())
+            for profile in profiles:
+                writer.writerow(profile.to_csv())
+            return 0
+
+        def search_engine_per_row() -> int:
+            with mock.patch.object(UserProfile, 'get_rich_zipcode', search_engine_per_call):
+                return write_rows()
+        return [('before export_csv rows', search_engine_per_row), ('after export_csv rows', write_rows)]
+
+    @staticmethod
+    def admin_client() -> Client:
+        admin = User.objects.create_superuser('bench-admin@example.com', 'bench-admin@example.com', None)
+        UserProfile(user=admin, is_verified_by_admin=True).save()
+        client = Client()
+        client.force_login(admin)
+        return client
+
+    @staticmethod
+    def measure(run: Callable[[], int], repeat: int) -> Dict[str, Any]:
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                status = run()
+                timings.append((time.perf_counter() - start) * 1000)
+        return {
+            'status': status,
+            'queries': len(queries),
+            'min_ms': round(min(timings), 2),
+            'median_ms': round(statistics.median(timings), 2),
+            'max_ms': round(max(timings), 2),
+        }
+
+    @staticmethod
+    def signup(camp: SyntheticCamp, prefix: str) -> Callable[[], int]:
+        client = Client()
+        url = reverse('signup-submit')
+        team_ids = [team.pk for team in camp.teams[:3]]
+        signups = iter(range(10 ** 9))
+
+        def post() -> int:
+            i = next(signups)
+            # Signing up logs the camper in, so start each one afresh.
+            client.cookies.clear()
+            return read_response(client.post(url, {
+                'first_name': 'Bench',
+                'last_name': str(i),
+                'years_on_playa': 1,
+                'invited_by': 'bench',
+                'email': '{}{}@example.com'.format(prefix, i),
+                'password': 'benchmark-password',
+                'duplicate_password': 'benchmark-password',
+                'phone': '415-555-0123',
+                'zipcode': '94110',
+                'g-recaptcha-response': 'PASSED',
+                'interested_teams': team_ids[:1 + i % len(team_ids)],
+            }, secure=True))
+        return post
+
+    @staticmethod
+    def export_csv(client: Client, url: str) -> Callable[[], int]:
+        # The admin wants a row ticked even when the action applies to all of them.
+        data = {'action': 'export_csv', 'select_across': '1', 'index': '0', ACTION_CHECKBOX_NAME: '0'}
+        return lambda: read_response(client.post(url, data, secure=True))
+
+    @staticmethod
+    def dailycounts(year: int) -> Callable[[], int]:
+        def run() -> int:
+            call_command('dailycounts', str(year), format='json', stdout=StringIO())
+            return 0
+        return run
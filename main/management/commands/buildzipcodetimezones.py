@@ -0,0 +1,35 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models.zipcode_index import TIMEZONE_TABLE_PATH, ZipcodeIndex, write_timezone_table
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the zipcode -> timezone table used by UserProfile.get_timezone_offset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=TIMEZONE_TABLE_PATH)
+
+    def handle(self, *args, **options):
+        output = options['output']
+        if not os.path.isdir(os.path.dirname(os.path.abspath(output))):
+            raise CommandError('Directory for {} does not exist'.format(output))
+
+        # Build a fresh index without a table so that every zipcode is actually searched.
+        index = ZipcodeIndex.load()
+        index = ZipcodeIndex({info.zipcode: info for info in index})
+
+        timezone_names = []
+        missing = 0
+        for info in index:
+            timezone_name = index.find_timezone_name(info)
+            if timezone_name is None:
+                missing += 1
+                continue
+            timezone_names.append((info.zipcode, timezone_name))
+
+        write_timezone_table(output, timezone_names)
+        self.stdout.write('Wrote {} zipcodes to {} ({} without a timezone)\n'.format(len(timezone_names),
+                                                                                    output,
+                                                                                    missing))
@@ -1,34 +1,60 @@
-from collections import defaultdict
-from typing import Dict
+import csv
+import json
+from typing import List
 
 from django.core.management.base import BaseCommand, CommandError
 
 from main.models import AttendanceProfile
-from main.models.event_day import EVENT_DAY_BY_ARRIVAL_CHOICES, EVENT_DAY_BY_DEPARTURE_CHOICES, days_between, EventDay
+from main.models.attendance_profile import Headcount
+from main.models.event_day import EventDay
+
+
+def parse_years(value: str) -> List[int]:
+    """Parses either a single year or an inclusive range like `2016-2018`."""
+    try:
+        if '-' in value:
+            first, last = (int(year) for year in value.split('-', 1))
+        else:
+            first = last = int(value)
+    except ValueError:
+        raise CommandError('Invalid year: {}'.format(value))
+    if first > last:
+        raise CommandError('Invalid year range: {}'.format(value))
+    return list(range(first, last + 1))
 
 
 class Command(BaseCommand):
     help = 'Prints attendance counts by day'
 
     def add_arguments(self, parser):
-        parser.add_argument('year', type=int)
+        parser.add_argument('years', nargs='+', help='Years or inclusive year ranges, e.g. 2018 or 2016-2018')
+        parser.add_argument('--format', choices=('text', 'json', 'csv'), default='text')
 
     def handle(self, *args, **options):
-        year = options['year']
-        attendance_profiles = AttendanceProfile.objects.filter(year=year, deleted_at__isnull=True)
-        count_by_day = defaultdict(int)  # type: Dict[str, int]
-        total_count = 0
-        for attendance_profile in attendance_profiles:
-            if attendance_profile.arrival_date is None or attendance_profile.departure_date is None:
-                continue
-            total_count += 1
-            arrival_day = EVENT_DAY_BY_ARRIVAL_CHOICES[attendance_profile.arrival_date]
-            departure_day = EVENT_DAY_BY_DEPARTURE_CHOICES[attendance_profile.departure_date]
-
-            for day in days_between(arrival_day, departure_day):
-                count_by_day[day.name] += 1
-
-        for day in EventDay:
-            count = count_by_day.get(day.name, 0)
-            self.stdout.write("{}: {}\n".format(day.name, count))
-        self.stdout.write("Total attendees: {}\n".format(total_count))
+        years = [year for value in options['years'] for year in parse_years(value)]
+        headcounts = AttendanceProfile.headcounts(years)
+        getattr(self, 'write_{}'.format(options['format']))(headcounts)
+
+    def write_text(self, headcounts: List[Headcount]) -> None:
+        for headcount in headcounts:
+            if len(headcounts) > 1:
+                self.stdout.write("{}\n".format(headcount.year))
+            for day in EventDay:
+                self.stdout.write("{}: {}\n".format(day.name, headcount.by_day[day]))
+            self.stdout.write("Total attendees: {}\n".format(headcount.total))
+
+    def write_json(self, headcounts: List[Headcount]) -> None:
+        self.stdout.write(json.dumps([
+            {
+                'year': headcount.year,
+                'total': headcount.total,
+                'days': {day.name: headcount.by_day[day] for day in EventDay},
+            }
+            for headcount in headcounts
+        ], indent=2) + '\n')
+
+    def write_csv(self, headcounts: List[Headcount]) -> None:
+        writer = csv.writer(self.stdout)
+        writer.writerow(['Year'] + [day.name for day in EventDay] + ['Total'])
+        for headcount in headcounts:
+            writer.writerow([headcount.year] + [headcount.by_day[day] for day in EventDay] + [headcount.total])
@@ -0,0 +1,36 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.bulk import FORMATS, export_campers, write_records
+from main.models import UserProfile
+from main.models.util import get_next_event_year
+
+
+class Command(BaseCommand):
+    help = 'Writes every camper, with their attendance for a year, as CSV or JSON Lines for importcampers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Where to write, or - for standard output')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the extension of the file')
+        parser.add_argument('--year', type=int, help='Defaults to the next event')
+        parser.add_argument('--include-password-hashes', action='store_true',
+                            help='So that imported campers keep their passwords')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError('Pass --format, the format of {} is unclear'.format(path))
+
+        records = export_campers(UserProfile.objects.all(),
+                                 options['year'] or get_next_event_year(),
+                                 include_password_hashes=options['include_password_hashes'])
+        if path == '-':
+            # The records bring their own line endings.
+            self.stdout.ending = ''
+            count = write_records(records, self.stdout, file_format)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                count = write_records(records, file, file_format)
+        self.stderr.write('Exported {} campers'.format(count))
@@ -0,0 +1,34 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.bulk import DEFAULT_CHUNK_SIZE, FORMATS, InvalidRecord, import_campers, read_records
+
+
+class Command(BaseCommand):
+    help = 'Creates campers, with their profiles, attendances and teams, from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the extension of the file')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Campers written per transaction')
+        parser.add_argument('--workers', type=int, help='Processes hashing passwords; defaults to one per CPU')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError('Pass --format, the format of {} is unclear'.format(path))
+
+        start = time.perf_counter()
+        with open(path, newline='', encoding='utf-8') as file:
+            try:
+                summary = import_campers(read_records(file, file_format),
+                                         chunk_size=options['chunk_size'],
+                                         workers=options['workers'])
+            except InvalidRecord as e:
+                raise CommandError('{}, {}'.format(path, e))
+        self.stdout.write('Imported {} campers, skipped {} already signed up, in {:.1f}s\n'.format(
+            summary.created, summary.skipped, time.perf_counter() - start))
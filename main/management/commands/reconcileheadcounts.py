@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from main.models import AttendanceProfile, DailyHeadcount
+from main.models.event_day import EventDay
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily headcounts from scratch and reports (or fixes) any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('years', type=int, nargs='*',
+                            help='Years to check; defaults to every year with attendances or headcounts')
+        parser.add_argument('--fix', action='store_true', help='Overwrite the headcounts with the recomputed ones')
+
+    def handle(self, *args, **options):
+        years = options['years']
+        if not years:
+            years = set(AttendanceProfile.objects.values_list('year', flat=True).distinct())
+            years |= set(DailyHeadcount.objects.values_list('year', flat=True).distinct())
+
+        expected_by_year = {headcount.year: headcount.by_day for headcount in AttendanceProfile.headcounts(years)}
+        mismatched_years = []
+        for year, expected in sorted(expected_by_year.items()):
+            actual = DailyHeadcount.for_year(year)
+            mismatched_days = [day for day in EventDay if actual[day] != expected[day]]
+            if not mismatched_days:
+                self.stdout.write('{}: OK\n'.format(year))
+                continue
+            mismatched_years.append(year)
+            for day in mismatched_days:
+                self.stdout.write('{} {}: stored {}, expected {}\n'.format(year, day.name, actual[day], expected[day]))
+
+        if mismatched_years and options['fix']:
+            DailyHeadcount.replace_years({year: expected_by_year[year] for year in mismatched_years})
+            self.stdout.write('Rebuilt headcounts for {}\n'.format(', '.join(str(year) for year in mismatched_years)))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from main.images import process_picture, variant_name
+from main.models import Skill, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Regenerates the size variants of pictures processed before variants existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess every picture, not only old ones')
+
+    def handle(self, *args, **options):
+        for model, spec in ((UserProfile, UserProfile.PROFILE_PICTURE), (Skill, Skill.PICTURE)):
+            has_picture = Q(**{'{}__gt'.format(spec.original_field): ''}) | \
+                Q(**{'{}__gt'.format(spec.picture_field): ''})
+            count = 0
+            for instance in model.objects.filter(has_picture).iterator():
+                picture = getattr(instance, spec.picture_field)
+                if not options['all'] and picture and variant_name(picture.name, spec.largest_size):
+                    continue
+                if not getattr(instance, spec.original_field):
+                    # Pictures uploaded before originals were kept are the best we've got.
+                    model.objects.filter(pk=instance.pk).update(**{spec.original_field: picture.name})
+                process_picture(model, instance.pk, spec)
+                count += 1
+            self.stdout.write('Reprocessed {} {} pictures\n'.format(count, model._meta.verbose_name))
@@ -0,0 +1,197 @@
+"""
+Per-request instrumentation, to spot N+1 queries and slow pages in production.
+
+`RequestMetricsMiddleware` records the number of queries, the time spent in the
+database and in rendering templates, and the wall time of every request. It logs
+them as one `key=value` line per request through the `main` logger, at WARNING when
+the view goes over its entry in `VIEW_BUDGETS`, and attaches them to the response as
+`response.metrics` so that tests can assert on them.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from django.db import connections
+from django.template.base import Template
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+
+class Budget(NamedTuple):
+    queries: int
+    total_ms: Optional[float] = None
+
+
+# Keyed by URL name, with the namespace for the admin. The query budgets hold for any
+# amount of data, as none of these pages should query per row.
+VIEW_BUDGETS = {
+    'user-profile': Budget(queries=15, total_ms=500),
+    'user-profile-me': Budget(queries=15, total_ms=500),
+    'user-profile-list': Budget(queries=10, total_ms=500),
+    'team-list': Budget(queries=10, total_ms=500),
+    'team-detail': Budget(queries=12, total_ms=500),
+    'signup': Budget(queries=5, total_ms=300),
+    'signup-submit': Budget(queries=20, total_ms=1000),
+    'admin:main_userprofile_changelist': Budget(queries=15, total_ms=2000),
+    'admin:main_attendanceprofile_changelist': Budget(queries=10, total_ms=2000),
+}  # type: Dict[str, Budget]
+
+
+class RequestMetrics(NamedTuple):
+    view_name: str
+    status: int
+    queries: int
+    db_ms: float
+    template_ms: float
+    total_ms: float
+
+    @property
+    def budget(self) -> Optional[Budget]:
+        return VIEW_BUDGETS.get(self.view_name)
+
+    def over_budget(self) -> List[str]:
+        """Describes each way in which this request went over its view's budget."""
+        budget = self.budget
+        if budget is None:
+            return []
+        problems = []
+        if self.queries > budget.queries:
+            problems.append('{} queries, budget {}'.format(self.queries, budget.queries))
+        if budget.total_ms is not None and self.total_ms > budget.total_ms:
+            problems.append('{:.1f}ms, budget {:.0f}ms'.format(self.total_ms, budget.total_ms))
+        return problems
+
+    def log_line(self) -> str:
+        return 'view={} status={} queries={} db_ms={:.1f} template_ms={:.1f} total_ms={:.1f} over_budget={}'.format(
+            self.view_name, self.status, self.queries, self.db_ms, self.template_ms, self.total_ms,
+            'yes' if self.over_budget() else 'no')
+
+
+class _RenderTimer(threading.local):
+    def __init__(self) -> None:
+        self.active = False
+        self.depth = 0
+        self.seconds = 0.0
+
+
+_render_timer = _RenderTimer()
+
+
+def instrument_templates() -> None:
+    """
+    Wraps `Template.render` so that `RequestMetricsMiddleware` can time rendering.
+    Called once from `MainConfig.ready()`; outside of a measured request the wrapper
+    only passes the call through.
+    """
+    render = Template.render
+    if getattr(render, 'times_requests', False):
+        return
+
+    def timed_render(self, context):
+        if not _render_timer.active or _render_timer.depth:
+            # Includes and nested renders are counted as part of the outermost template.
+            return render(self, context)
+        _render_timer.depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            _render_timer.seconds += time.perf_counter() - start
+            _render_timer.depth -= 1
+
+    timed_render.times_requests = True
+    Template.render = timed_render
+
+
+class _QueryTimer:
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+
+class _TimedCursor:
+    """Counts and times the queries run through `cursor`, without keeping their SQL."""
+
+    def __init__(self, cursor, timer: _QueryTimer) -> None:
+        self.cursor = cursor
+        self.timer = timer
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.cursor.__exit__(exc_type, exc_value, traceback)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.timer.count += 1
+            self.timer.seconds += time.perf_counter() - start
+
+    def execute(self, sql, params=None):
+        return self._timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(self.cursor.executemany, sql, param_list)
+
+    def callproc(self, procname, params=None):
+        return self._timed(self.cursor.callproc, procname, params)
+
+
+def _time_queries(connection, timer: _QueryTimer) -> None:
+    # Django picks `make_debug_cursor` instead while it logs queries, e.g. under DEBUG or
+    # `assertNumQueries`, so wrap both. These shadow the methods on this connection only,
+    # until `_stop_timing_queries`. A request that raised never got to stop, so start
+    # from the connection's own methods.
+    _stop_timing_queries(connection)
+    for name in ('make_cursor', 'make_debug_cursor'):
+        make = getattr(connection, name)
+        setattr(connection, name, lambda cursor, make=make: _TimedCursor(make(cursor), timer))
+
+
+def _stop_timing_queries(connection) -> None:
+    for name in ('make_cursor', 'make_debug_cursor'):
+        connection.__dict__.pop(name, None)
+
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+    def process_request(self, request) -> None:
+        request._metrics_timers = [(connection, _QueryTimer()) for connection in connections.all()]
+        for connection, timer in request._metrics_timers:
+            _time_queries(connection, timer)
+        _render_timer.active, _render_timer.depth, _render_timer.seconds = True, 0, 0.0
+        request._metrics_start = time.perf_counter()
+
+    def process_response(self, request, response):
+        # Streamed responses, such as the CSV exports, do most of their work after this,
+        # while the body is sent, so only the work done up to here is measured for them.
+        if not hasattr(request, '_metrics_start'):
+            return response
+        total = time.perf_counter() - request._metrics_start
+        for connection, _ in request._metrics_timers:
+            _stop_timing_queries(connection)
+        _render_timer.active = False
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        metrics = RequestMetrics(view_name=resolver_match.view_name if resolver_match else 'unresolved',
+                                 status=response.status_code,
+                                 queries=sum(timer.count for _, timer in request._metrics_timers),
+                                 db_ms=sum(timer.seconds for _, timer in request._metrics_timers) * 1000,
+                                 template_ms=_render_timer.seconds * 1000,
+                                 total_ms=total * 1000)
+        response.metrics = metrics
+        if metrics.over_budget():
+            logger.warning('%s (%s)', metrics.log_line(), '; '.join(metrics.over_budget()))
+        else:
+            logger.info(metrics.log_line())
+        return response
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# The schema and backfill as of this migration, written out rather than imported from
+# `main.search` so that later changes to that module don't change what this does.
+
+SQLITE_CREATE = [
+    '''
+    CREATE VIRTUAL TABLE main_profilesearch USING fts5(
+        name, playa_name, email, skills, biography,
+        tokenize = 'unicode61 remove_diacritics 1',
+        prefix = '2 3'
+    )
+    ''',
+    '''
+    INSERT INTO main_profilesearch (rowid, name, playa_name, email, skills, biography)
+    SELECT profile.user_id,
+           trim(u.first_name || ' ' || u.last_name),
+           coalesce(profile.playa_name, ''),
+           u.email,
+           coalesce((SELECT group_concat(skill.name, ' ')
+                     FROM main_userprofile_skills profile_skill
+                     JOIN main_skill skill ON skill.id = profile_skill.skill_id
+                     WHERE profile_skill.userprofile_id = profile.user_id), ''),
+           coalesce(profile.biography, '')
+    FROM main_userprofile profile
+    JOIN auth_user u ON u.id = profile.user_id
+    WHERE profile.is_verified_by_admin
+    ''',
+]
+
+POSTGRES_CREATE = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    '''
+    CREATE TABLE main_profilesearch (
+        user_id integer PRIMARY KEY,
+        document tsvector NOT NULL,
+        names text NOT NULL
+    )
+    ''',
+    'CREATE INDEX main_profilesearch_document ON main_profilesearch USING gin (document)',
+    'CREATE INDEX main_profilesearch_names_trgm ON main_profilesearch USING gin (names gin_trgm_ops)',
+    '''
+    INSERT INTO main_profilesearch (user_id, document, names)
+    SELECT user_id,
+           setweight(to_tsvector('simple', name || ' ' || playa_name), 'A') ||
+           setweight(to_tsvector('simple', email), 'B') ||
+           setweight(to_tsvector('simple', skills), 'C') ||
+           setweight(to_tsvector('simple', biography), 'D'),
+           trim(name || ' ' || playa_name)
+    FROM (
+        SELECT profile.user_id,
+               trim(u.first_name || ' ' || u.last_name) AS name,
+               coalesce(profile.playa_name, '') AS playa_name,
+               u.email,
+               coalesce((SELECT string_agg(skill.name, ' ')
+                         FROM main_userprofile_skills profile_skill
+                         JOIN main_skill skill ON skill.id = profile_skill.skill_id
+                         WHERE profile_skill.userprofile_id = profile.user_id), '') AS skills,
+               coalesce(profile.biography, '') AS biography
+        FROM main_userprofile profile
+        JOIN auth_user u ON u.id = profile.user_id
+        WHERE profile.is_verified_by_admin
+    ) documents
+    ''',
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS main_profilesearch')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_auto_20180922_2033'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
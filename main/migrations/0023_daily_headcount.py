@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 11:19
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# The event days as of this migration, written out rather than imported from
+# `main.models.event_day` so that later changes to that module don't change what this does.
+EVENT_DAYS = range(1, 15)  # Wednesday1 to Tuesday2
+EVENT_DAY_BY_ARRIVAL_CHOICES = {
+    'wednesday1': 1, 'thursday1': 2, 'friday1': 3, 'saturday': 4, 'sunday': 5,
+    'monday': 6, 'tuesday': 7, 'wednesday2': 8, 'thursday2': 9, 'friday2': 10,
+}
+EVENT_DAY_BY_DEPARTURE_CHOICES = {
+    'wednesday': 8, 'thursday': 9, 'friday': 10, 'saturday': 11, 'sunday': 12, 'monday': 13, 'tuesday': 14,
+}
+
+
+def count_by_day(stays):
+    """How many people are on playa each day, given `(arrival day, departure day, count)` stays."""
+    counts = dict.fromkeys(EVENT_DAYS, 0)
+    for arrival, departure, count in stays:
+        for day in range(arrival, departure):
+            counts[day] += count
+    return counts
+
+
+def backfill_headcounts(apps, schema_editor):
+    AttendanceProfile = apps.get_model('main', 'AttendanceProfile')
+    DailyHeadcount = apps.get_model('main', 'DailyHeadcount')
+    db_alias = schema_editor.connection.alias
+
+    stays_by_year = defaultdict(list)
+    stays = AttendanceProfile.objects.using(db_alias)\
+        .filter(deleted_at__isnull=True, arrival_date__isnull=False, departure_date__isnull=False)\
+        .values_list('year', 'arrival_date', 'departure_date')\
+        .annotate(count=Count('id'))\
+        .order_by()
+    for year, arrival_date, departure_date, count in stays:
+        # Dates that aren't among the choices don't count towards any day.
+        if arrival_date in EVENT_DAY_BY_ARRIVAL_CHOICES and departure_date in EVENT_DAY_BY_DEPARTURE_CHOICES:
+            stays_by_year[year].append((EVENT_DAY_BY_ARRIVAL_CHOICES[arrival_date],
+                                        EVENT_DAY_BY_DEPARTURE_CHOICES[departure_date],
+                                        count))
+
+    DailyHeadcount.objects.using(db_alias).bulk_create([
+        DailyHeadcount(year=year, event_day=day, count=counts[day])
+        for year, counts in ((year, count_by_day(stays)) for year, stays in stays_by_year.items())
+        for day in EVENT_DAYS
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_profile_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyHeadcount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('event_day', models.IntegerField(choices=[(1, 'Wednesday1'), (2, 'Thursday1'), (3, 'Friday1'), (4, 'Saturday1'), (5, 'Sunday1'), (6, 'Monday1'), (7, 'Tuesday1'), (8, 'Wednesday2'), (9, 'Thursday2'), (10, 'Friday2'), (11, 'Saturday2'), (12, 'Sunday2'), (13, 'Monday2'), (14, 'Tuesday2')])),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyheadcount',
+            unique_together=set([('year', 'event_day')]),
+        ),
+        migrations.RunPython(backfill_headcounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 11:24
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_daily_headcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='skill',
+            name='picture_original',
+            field=models.FileField(blank=True, null=True, upload_to='skill_pictures/originals'),
+        ),
+        migrations.AddField(
+            model_name='skill',
+            name='picture_processing',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_picture_original',
+            field=models.FileField(blank=True, null=True, upload_to='profile_pictures/originals'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_picture_processing',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='skill',
+            name='picture',
+            field=models.ImageField(blank=True, null=True, upload_to='skill_pictures'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, upload_to='profile_pictures'),
+        ),
+    ]
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 12:04
+from __future__ import unicode_literals
+
+import logging
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+# Live attendances by year with their travel dates, for the headcounts, the attendee
+# lists and the admin filters. Partial, so the soft-deleted rows stay out of it.
+LIVE_STAYS_INDEX = 'main_attendance_live_stays_idx'
+
+logger = logging.getLogger('main.migrations')
+
+# The event days as of this migration, written out rather than imported from
+# `main.models.event_day` so that later changes to that module don't change what this does.
+EVENT_DAYS = range(1, 15)  # Wednesday1 to Tuesday2
+EVENT_DAY_BY_ARRIVAL_CHOICES = {
+    'wednesday1': 1, 'thursday1': 2, 'friday1': 3, 'saturday': 4, 'sunday': 5,
+    'monday': 6, 'tuesday': 7, 'wednesday2': 8, 'thursday2': 9, 'friday2': 10,
+}
+EVENT_DAY_BY_DEPARTURE_CHOICES = {
+    'wednesday': 8, 'thursday': 9, 'friday': 10, 'saturday': 11, 'sunday': 12, 'monday': 13, 'tuesday': 14,
+}
+
+
+def count_by_day(stays):
+    """How many people are on playa each day, given `(arrival day, departure day, count)` stays."""
+    counts = dict.fromkeys(EVENT_DAYS, 0)
+    for arrival, departure, count in stays:
+        for day in range(arrival, departure):
+            counts[day] += count
+    return counts
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Keeps one membership per team and camper, and one attendance per camper and year,
+    so that the unique constraints can be added.
+    """
+    TeamMembership = apps.get_model('main', 'TeamMembership')
+    AttendanceProfile = apps.get_model('main', 'AttendanceProfile')
+    DailyHeadcount = apps.get_model('main', 'DailyHeadcount')
+    db_alias = schema_editor.connection.alias
+
+    duplicated_memberships = TeamMembership.objects.using(db_alias).values_list('team_id', 'member_id')\
+        .annotate(count=Count('id')).filter(count__gt=1).order_by()
+    for team_id, member_id, _ in duplicated_memberships:
+        memberships = list(TeamMembership.objects.using(db_alias)
+                           .filter(team_id=team_id, member_id=member_id).order_by('pk'))
+        # Anybody who led the team in any of the copies still does.
+        kept = memberships[0]
+        if any(membership.is_lead for membership in memberships) and not kept.is_lead:
+            kept.is_lead = True
+            kept.save(update_fields=['is_lead'])
+        removed = [membership.pk for membership in memberships[1:]]
+        # Logged so that the removal can be audited, and undone by hand if need be.
+        logger.warning('Removing duplicate memberships of user %s in team %s: kept %s, removed %s',
+                       member_id, team_id, kept.pk, removed)
+        TeamMembership.objects.using(db_alias).filter(pk__in=removed).delete()
+
+    affected_years = set()
+    duplicated_attendances = AttendanceProfile.objects.using(db_alias).values_list('user_id', 'year')\
+        .annotate(count=Count('id')).filter(count__gt=1).order_by()
+    for user_id, year, _ in duplicated_attendances:
+        # The live one wins over soft-deleted ones, as in `UserProfile._cache_attendance`.
+        attendances = sorted(AttendanceProfile.objects.using(db_alias).filter(user_id=user_id, year=year),
+                             key=lambda attendance: (attendance.deleted_at is not None, attendance.pk))
+        removed = [attendance.pk for attendance in attendances[1:]]
+        logger.warning('Removing duplicate attendances of user %s in %s: kept %s, removed %s',
+                       user_id, year, attendances[0].pk, removed)
+        AttendanceProfile.objects.using(db_alias).filter(pk__in=removed).delete()
+        affected_years.add(year)
+
+    # Deleting through the historical models skips the signal handlers that keep the
+    # daily headcounts up to date, so recount the years that lost attendances.
+    for year in affected_years:
+        stays = AttendanceProfile.objects.using(db_alias)\
+            .filter(year=year, deleted_at__isnull=True, arrival_date__isnull=False, departure_date__isnull=False)\
+            .values_list('arrival_date', 'departure_date')\
+            .annotate(count=Count('id'))\
+            .order_by()
+        counts = count_by_day([(EVENT_DAY_BY_ARRIVAL_CHOICES[arrival_date],
+                                EVENT_DAY_BY_DEPARTURE_CHOICES[departure_date],
+                                count)
+                               for arrival_date, departure_date, count in stays
+                               # Dates that aren't among the choices don't count towards any day.
+                               if arrival_date in EVENT_DAY_BY_ARRIVAL_CHOICES
+                               and departure_date in EVENT_DAY_BY_DEPARTURE_CHOICES])
+        DailyHeadcount.objects.using(db_alias).filter(year=year).delete()
+        DailyHeadcount.objects.using(db_alias).bulk_create([
+            DailyHeadcount(year=year, event_day=day, count=counts[day]) for day in EVENT_DAYS
+        ])
+
+
+def create_partial_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    schema_editor.execute('CREATE INDEX {} ON main_attendanceprofile (year, arrival_date, departure_date) '
+                          'WHERE deleted_at IS NULL'.format(LIVE_STAYS_INDEX))
+
+
+def drop_partial_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS {}'.format(LIVE_STAYS_INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0025_fragment_cache_stamps'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='attendanceprofile',
+            unique_together=set([('user', 'year')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='teammembership',
+            unique_together=set([('team', 'member')]),
+        ),
+        migrations.AddIndex(
+            model_name='teammembership',
+            index=models.Index(fields=['member', 'team'], name='main_teamme_member__a33a77_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teammembership',
+            index=models.Index(fields=['team', 'is_lead'], name='main_teamme_team_id_c63a4c_idx'),
+        ),
+        migrations.RunPython(create_partial_indexes, drop_partial_indexes),
+    ]
@@ -1,4 +1,5 @@
 from main.models.attendance_profile import AttendanceProfile
+from main.models.daily_headcount import DailyHeadcount
 from main.models.food_restriction import FoodRestriction
 from main.models.housing_group import HousingGroup
 from main.models.job import Job
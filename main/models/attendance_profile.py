@@ -1,13 +1,54 @@
-from typing import List, Optional
+import datetime
+from collections import defaultdict
+from types import MappingProxyType
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 from django.db import models
+from django.db.models import BooleanField, Case, Count, Value, When
 from django.contrib.auth.models import User
 from django.forms import ModelForm, CheckboxSelectMultiple
 
+from main.models.event_day import (EVENT_DAY_BY_ARRIVAL_CHOICES,
+                                   EVENT_DAY_BY_DEPARTURE_CHOICES,
+                                   EventDay,
+                                   count_by_day)
 from main.models.housing_group import HousingGroup
+from main.models.reference_data import ReferenceChoiceField
 from main.models.transportation_method import TransportationMethod
 
 
+class Headcount(NamedTuple):
+    year: int
+    total: int
+    by_day: Dict[EventDay, int]
+
+
+class AttendanceProfileQuerySet(models.QuerySet):
+    """Early and late travel in SQL, matching `arrives_early` and `departs_late`."""
+
+    def arriving_early(self, early: bool=True) -> 'AttendanceProfileQuerySet':
+        if early:
+            return self.filter(arrival_date__in=AttendanceProfile.EARLY_ARRIVAL_DATES)
+        return self.exclude(arrival_date__in=AttendanceProfile.EARLY_ARRIVAL_DATES)
+
+    def departing_late(self, late: bool=True) -> 'AttendanceProfileQuerySet':
+        if late:
+            return self.filter(departure_date__in=AttendanceProfile.LATE_DEPARTURE_DATES)
+        return self.exclude(departure_date__in=AttendanceProfile.LATE_DEPARTURE_DATES)
+
+    def with_travel_flags(self) -> 'AttendanceProfileQuerySet':
+        """Annotates `is_early_arrival` and `is_late_departure`."""
+        return self.annotate(
+            is_early_arrival=Case(When(arrival_date__in=AttendanceProfile.EARLY_ARRIVAL_DATES, then=Value(True)),
+                                  default=Value(False),
+                                  output_field=BooleanField()),
+            is_late_departure=Case(When(departure_date__in=AttendanceProfile.LATE_DEPARTURE_DATES,
+                                        then=Value(True)),
+                                   default=Value(False),
+                                   output_field=BooleanField()),
+        )
+
+
 class AttendanceProfile(models.Model):
     deleted_at = models.DateTimeField(blank=True, null=True)
 
@@ -38,6 +79,10 @@ class AttendanceProfile(models.Model):
         ('thursday2', 'Thursday'),
         ('friday2', 'Friday'),
     )
+    # Frozen lookups built once from the choices, as the properties below run per row in
+    # the admin and the CSV exports.
+    EARLY_ARRIVAL_DATES = frozenset(value for value, _ in EARLY_ARRIVAL_CHOICES)
+    ARRIVAL_LABELS = MappingProxyType(dict(ARRIVAL_CHOICES))
     arrival_date = models.CharField(
         max_length=16,
         choices=ARRIVAL_CHOICES,
@@ -56,6 +101,8 @@ class AttendanceProfile(models.Model):
         ('saturday', 'Saturday (Man Burn)'),
         ('sunday', 'Sunday (Temple Burn)'),
     ) + LATE_DEPARTURE_CHOICES
+    LATE_DEPARTURE_DATES = frozenset(value for value, _ in LATE_DEPARTURE_CHOICES)
+    DEPARTURE_LABELS = MappingProxyType(dict(DEPARTURE_CHOICES))
     departure_date = models.CharField(
         max_length=16,
         choices=DEPARTURE_CHOICES,
@@ -79,25 +126,76 @@ class AttendanceProfile(models.Model):
         blank=True
     )
 
+    objects = AttendanceProfileQuerySet.as_manager()
+
+    class Meta:
+        # Cancelling an attendance only soft-deletes it, and attending again revives the
+        # same row. Lookups of the current attendance go through this unique index, while
+        # the per-year queries over live attendances use the partial
+        # `main_attendance_live_stays_idx` added in migration 0026.
+        unique_together = ('user', 'year')
+
     @property
     def arrives_early(self) -> bool:
-        return self.arrival_date in dict(AttendanceProfile.EARLY_ARRIVAL_CHOICES)
+        return self.arrival_date in AttendanceProfile.EARLY_ARRIVAL_DATES
 
     @property
     def departs_late(self) -> bool:
-        return self.departure_date in dict(AttendanceProfile.LATE_DEPARTURE_CHOICES)
+        return self.departure_date in AttendanceProfile.LATE_DEPARTURE_DATES
+
+    def headcount_stay(self) -> Optional[Tuple[int, EventDay, EventDay]]:
+        """The `(year, arrival, departure)` this attendance adds to the daily headcounts, if any."""
+        return AttendanceProfile.stay_for(self.year, self.arrival_date, self.departure_date, self.deleted_at)
+
+    @staticmethod
+    def stay_for(year: int, arrival_date: Optional[str], departure_date: Optional[str],
+                 deleted_at: Optional[datetime.datetime]) -> Optional[Tuple[int, EventDay, EventDay]]:
+        # Dates that aren't among the choices, e.g. from old data, don't count towards any day.
+        if deleted_at is not None:
+            return None
+        arrival = EVENT_DAY_BY_ARRIVAL_CHOICES.get(arrival_date)
+        departure = EVENT_DAY_BY_DEPARTURE_CHOICES.get(departure_date)
+        if arrival is None or departure is None:
+            return None
+        return year, arrival, departure
 
     @property
     def pretty_arrival(self) -> Optional[str]:
-        return dict(AttendanceProfile.ARRIVAL_CHOICES).get(self.arrival_date)
+        return AttendanceProfile.ARRIVAL_LABELS.get(self.arrival_date)
 
     @property
     def pretty_departure(self) -> Optional[str]:
-        return dict(AttendanceProfile.DEPARTURE_CHOICES).get(self.departure_date)
+        return AttendanceProfile.DEPARTURE_LABELS.get(self.departure_date)
 
     def __str__(self) -> str:
         return '{}[{}]'.format(self.user, self.year)
 
+    @classmethod
+    def headcounts(cls, years: Iterable[int]) -> List[Headcount]:
+        """
+        Counts the attendees with known travel dates on each day of each of `years`. The
+        database groups the attendances by year and travel dates, so only one row per
+        distinct stay comes back rather than one per attendee.
+        """
+        years = sorted(set(years))
+        stays_by_year = defaultdict(list)  # type: Dict[int, List[Tuple[EventDay, EventDay, int]]]
+        totals_by_year = defaultdict(int)  # type: Dict[int, int]
+        stays = cls.objects.filter(year__in=years,
+                                   deleted_at__isnull=True,
+                                   arrival_date__isnull=False,
+                                   departure_date__isnull=False) \
+            .values_list('year', 'arrival_date', 'departure_date') \
+            .annotate(count=Count('id')) \
+            .order_by()
+        for year, arrival_date, departure_date, count in stays:
+            totals_by_year[year] += count
+            stay = cls.stay_for(year, arrival_date, departure_date, None)
+            if stay is not None:
+                stays_by_year[year].append(stay[1:] + (count,))
+
+        return [Headcount(year=year, total=totals_by_year[year], by_day=count_by_day(stays_by_year[year]))
+                for year in years]
+
     @classmethod
     def csv_columns(cls) -> List[str]:
         return [
@@ -125,8 +223,8 @@ class AttendanceProfile(models.Model):
             'Unknown' if self.paid_dues is None else self.paid_dues,
             self.pretty_arrival,
             self.pretty_departure,
-            self.to_transportation_method.name,
-            self.from_transportation_method.name,
+            'Unknown' if self.to_transportation_method is None else self.to_transportation_method.name,
+            'Unknown' if self.from_transportation_method is None else self.from_transportation_method.name,
         ]
 
 
@@ -144,6 +242,11 @@ class AttendanceProfileForm(ModelForm):
             'bicycle_status',
         ]
 
+        field_classes = {
+            'to_transportation_method': ReferenceChoiceField,
+            'from_transportation_method': ReferenceChoiceField,
+        }
+
         labels = {
             'arrival_date': 'What day do you plan to arrive?',
             'departure_date': 'What day do you plan to leave?',
@@ -0,0 +1,58 @@
+from typing import Dict
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+from main.models.event_day import EventDay
+
+
+class DailyHeadcount(models.Model):
+    """
+    How many attendees are on playa each day of a year. The rows are kept up to date
+    incrementally by the `AttendanceProfile` signal handlers in `main.signals`; the
+    `reconcileheadcounts` command rebuilds them from scratch.
+    """
+    year = models.IntegerField()
+    event_day = models.IntegerField(choices=[(day.value, day.name) for day in EventDay])
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('year', 'event_day')
+
+    def __str__(self) -> str:
+        return '{} {}: {}'.format(self.year, EventDay(self.event_day).name, self.count)
+
+    @classmethod
+    def for_year(cls, year: int) -> Dict[EventDay, int]:
+        counts = {day: 0 for day in EventDay}
+        for event_day, count in cls.objects.filter(year=year).values_list('event_day', 'count'):
+            counts[EventDay(event_day)] = count
+        return counts
+
+    @classmethod
+    def apply_stay(cls, year: int, arrival: EventDay, departure: EventDay, delta: int) -> None:
+        """Adds `delta` to every day from `arrival` up to, but not including, `departure`."""
+        if arrival.value >= departure.value:
+            return
+        days = cls.objects.filter(year=year, event_day__gte=arrival.value, event_day__lt=departure.value)
+        # A year's days are always created together, so nothing updated means a new year.
+        if not days.update(count=F('count') + delta):
+            cls.create_year(year)
+            days.update(count=F('count') + delta)
+
+    @classmethod
+    def create_year(cls, year: int) -> None:
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create([cls(year=year, event_day=day.value) for day in EventDay])
+        except IntegrityError:
+            # Somebody else created the missing days first.
+            pass
+
+    @classmethod
+    def replace_years(cls, counts_by_year: Dict[int, Dict[EventDay, int]]) -> None:
+        with transaction.atomic():
+            cls.objects.filter(year__in=counts_by_year).delete()
+            cls.objects.bulk_create([cls(year=year, event_day=day.value, count=counts[day])
+                                     for year, counts in counts_by_year.items()
+                                     for day in EventDay])
@@ -1,5 +1,6 @@
 from enum import Enum
-from typing import List
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Tuple
 
 
 class EventDay(Enum):
@@ -19,7 +20,7 @@ class EventDay(Enum):
     Tuesday2 = 14
 
 
-EVENT_DAY_BY_ARRIVAL_CHOICES = {
+EVENT_DAY_BY_ARRIVAL_CHOICES = MappingProxyType({
     'wednesday1': EventDay.Wednesday1,
     'thursday1': EventDay.Thursday1,
     'friday1': EventDay.Friday1,
@@ -30,9 +31,9 @@ EVENT_DAY_BY_ARRIVAL_CHOICES = {
     'wednesday2': EventDay.Wednesday2,
     'thursday2': EventDay.Thursday2,
     'friday2': EventDay.Friday2,
-}
+})
 
-EVENT_DAY_BY_DEPARTURE_CHOICES = {
+EVENT_DAY_BY_DEPARTURE_CHOICES = MappingProxyType({
     'wednesday': EventDay.Wednesday2,
     'thursday': EventDay.Thursday2,
     'friday': EventDay.Friday2,
@@ -40,8 +41,28 @@ EVENT_DAY_BY_DEPARTURE_CHOICES = {
     'sunday': EventDay.Sunday2,
     'monday': EventDay.Monday2,
     'tuesday': EventDay.Tuesday2,
-}
+})
 
 
 def days_between(start_day: EventDay, end_day: EventDay) -> List[EventDay]:
     return [day for day in EventDay if start_day.value <= day.value < end_day.value]
+
+
+def count_by_day(stays: Iterable[Tuple[EventDay, EventDay, int]]) -> Dict[EventDay, int]:
+    """
+    Counts how many people are on playa each day, given `(arrival, departure, count)`
+    stays. Each stay only marks its two ends in a difference array, and a single prefix
+    sum over the days turns those marks into headcounts.
+    """
+    deltas = [0] * (len(EventDay) + 1)
+    for arrival, departure, count in stays:
+        if arrival.value < departure.value:
+            deltas[arrival.value - 1] += count
+            deltas[departure.value - 1] -= count
+
+    counts = {}  # type: Dict[EventDay, int]
+    headcount = 0
+    for day in EventDay:
+        headcount += deltas[day.value - 1]
+        counts[day] = headcount
+    return counts
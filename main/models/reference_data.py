@@ -0,0 +1,146 @@
+"""
+Process-local caches of the small lookup tables that profiles and forms refer to.
+
+Skills, food restrictions and transportation methods are edited a handful of times a
+year through the admin, yet were read in full on every profile view. Each table is now
+loaded once per process and reused until its version changes. Versions live in the
+Django cache and are bumped by the save and delete signal handlers in `main.signals`
+once the change is committed. A change made in one worker reaches the others because
+production shares that cache between them (see CACHES in the settings and
+`main.checks`). As reading the version is itself a round trip to that cache, each
+process only checks it every `VERSION_CHECK_SECONDS`.
+"""
+import threading
+import time
+from typing import Dict, Generic, Iterable, List, Optional, Type, TypeVar
+
+from django import forms
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+
+from main.models.food_restriction import FoodRestriction
+from main.models.skill import Skill
+from main.models.transportation_method import TransportationMethod
+
+M = TypeVar('M', bound=models.Model)
+
+# How long a process reuses its rows before checking the shared version again, and so
+# how long a change made in another worker can take to show up in this one.
+VERSION_CHECK_SECONDS = 5
+
+
+class ReferenceTable(Generic[M]):
+    def __init__(self, model: Type[M]) -> None:
+        self.model = model
+        self.version_key = 'reference-data:{}:version'.format(model._meta.label_lower)
+        self._lock = threading.Lock()
+        self._version = None  # type: Optional[int]
+        self._checked_at = 0.0
+        self._rows = []  # type: List[M]
+        self._rows_by_id = {}  # type: Dict[int, M]
+
+    def _current_version(self) -> int:
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, 1, timeout=None)
+            version = cache.get(self.version_key, 1)
+        return version
+
+    def _load(self) -> None:
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        version = self._current_version()
+        with self._lock:
+            if version != self._version:
+                rows = list(self.model.objects.order_by('pk'))
+                self._rows, self._rows_by_id = rows, {row.pk: row for row in rows}
+                self._version = version
+            self._checked_at = now
+
+    def all(self) -> List[M]:
+        """Every row, in primary key order. The instances are shared, so don't modify them."""
+        self._load()
+        return self._rows
+
+    def get(self, pk: int) -> Optional[M]:
+        self._load()
+        return self._rows_by_id.get(pk)
+
+    def existing_ids(self, ids: Iterable[int]) -> List[int]:
+        """The ones among `ids` that exist, for passing straight to a related manager's `set()`."""
+        self._load()
+        return [pk for pk in ids if pk in self._rows_by_id]
+
+    def invalidate(self) -> None:
+        # This process reloads straight away. The other workers only hear of it once the
+        # change is committed, so that a rolled-back save doesn't make them all reload.
+        self._forget()
+        transaction.on_commit(self._bump_version)
+
+    def _forget(self) -> None:
+        with self._lock:
+            self._version = None
+
+    def _bump_version(self) -> None:
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            # Nobody has read the table since the cache was cleared.
+            cache.add(self.version_key, 1, timeout=None)
+        # Rows read between the save and the commit may predate it.
+        self._forget()
+
+
+skills = ReferenceTable(Skill)
+food_restrictions = ReferenceTable(FoodRestriction)
+transportation_methods = ReferenceTable(TransportationMethod)
+
+TABLES_BY_MODEL = {table.model: table for table in (skills, food_restrictions, transportation_methods)}
+
+
+def invalidate(model: Type[models.Model]) -> None:
+    """Marks the cached copy of `model`'s table as stale, if there is one."""
+    table = TABLES_BY_MODEL.get(model)
+    if table is not None:
+        table.invalidate()
+
+
+class ReferenceChoiceIterator:
+    """Lazily lists the choices, like `ModelChoiceIterator`, so that defining forms doesn't query."""
+
+    def __init__(self, field: 'ReferenceChoiceField') -> None:
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for row in self.field.table.all():
+            yield (self.field.prepare_value(row), self.field.label_from_instance(row))
+
+    def __len__(self) -> int:
+        return len(self.field.table.all()) + (self.field.empty_label is not None)
+
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+    """A `ModelChoiceField` whose choices and lookups come from the reference-data cache."""
+
+    @property
+    def table(self) -> ReferenceTable:
+        return TABLES_BY_MODEL[self.queryset.model]
+
+    iterator = ReferenceChoiceIterator
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            row = self.table.get(int(value))
+        except (TypeError, ValueError):
+            row = None
+        if row is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        # The cached rows are shared by every request in the process, so hand out a copy.
+        field_names = [field.attname for field in row._meta.concrete_fields]
+        return type(row).from_db(row._state.db, field_names, [getattr(row, name) for name in field_names])
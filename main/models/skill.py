@@ -1,19 +1,40 @@
+from typing import Optional
+
 from django.db import models
 from django.contrib.staticfiles.templatetags.staticfiles import static
-from django_resized import ResizedImageField
+
+from main.images import PictureSpec, picture_srcset, picture_url
 
 
 class Skill(models.Model):
     name = models.CharField(max_length=64)
     description = models.TextField()
-    picture = ResizedImageField(size=[256, 256], quality=100, upload_to='skill_pictures', null=True, blank=True)
+    picture = models.ImageField(upload_to='skill_pictures', null=True, blank=True)
+    picture_original = models.FileField(upload_to='skill_pictures/originals', null=True, blank=True)
+    picture_processing = models.BooleanField(default=False)
+
+    PICTURE = PictureSpec(original_field='picture_original',
+                          picture_field='picture',
+                          processing_field='picture_processing',
+                          sizes=(64, 128, 256),
+                          quality=80)
 
     def __str__(self):
         # type: () -> str
         return self.name
 
-    def picture_url(self):
-        # type: () -> Optional[str]
-        if self.picture:
-            return self.picture.url
+    def has_processed_picture(self):
+        # type: () -> bool
+        return bool(self.picture) and not self.picture_processing
+
+    def picture_url(self, size=None):
+        # type: (Optional[int]) -> str
+        if self.has_processed_picture():
+            return picture_url(self.picture, self.PICTURE, size)
         return static('default-merit-badge.jpg')
+
+    def picture_srcset(self):
+        # type: () -> str
+        if self.has_processed_picture():
+            return picture_srcset(self.picture, self.PICTURE)
+        return ''
@@ -1,9 +1,25 @@
-from typing import Type
+from typing import Dict, Iterable, List, NamedTuple, Type
 
-from django.db import models
+from django.core.cache import cache
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
-from django.db.models import QuerySet, Count, F
+from django.db.models import QuerySet, Count, F, Prefetch
 
+OPEN_TEAMS_CACHE_KEY = 'open-teams'
+# Kept short, as only the signal handlers in `main.signals` drop the snapshot, bulk
+# writes elsewhere can slip past them, and a process-local cache only drops the
+# snapshot of the worker that made the change.
+OPEN_TEAMS_TIMEOUT = 60
+
+
+class OpenTeam(NamedTuple):
+    id: int
+    name: str
+    member_count: int
+    max_size: int
+
+    def __str__(self) -> str:
+        return '{} ({}/{})'.format(self.name, self.member_count, self.max_size)
 
 
 class Team(models.Model):
@@ -13,18 +29,38 @@ class Team(models.Model):
     max_size = models.IntegerField(blank=False, null=False, default=1)
     is_early_crew = models.BooleanField(default=False)
     is_late_crew = models.BooleanField(default=False)
+    # Bumped by `main.signals` whenever anything shown in a cached team fragment changes.
+    updated_at = models.DateTimeField(auto_now=True)
 
     @property
     def leads(self):
-        return self.members.filter(memberships__is_lead=True).all()
+        if hasattr(self, 'lead_memberships'):
+            return [membership.member for membership in self.lead_memberships]
+        if hasattr(self, 'all_memberships'):
+            return [membership.member for membership in self.all_memberships if membership.is_lead]
+        return self.members.filter(memberships__is_lead=True).select_related('profile')
 
     @property
     def non_leads(self):
-        return self.members.filter(memberships__is_lead=False).all()
+        if hasattr(self, 'all_memberships'):
+            return [membership.member for membership in self.all_memberships if not membership.is_lead]
+        return self.members.filter(memberships__is_lead=False).select_related('profile')
+
+    @property
+    def member_list(self):
+        if hasattr(self, 'all_memberships'):
+            return [membership.member for membership in self.all_memberships]
+        return self.members.all()
+
+    @property
+    def member_count(self) -> int:
+        if hasattr(self, 'num_members'):
+            return self.num_members
+        return self.members.count()
 
     @property
     def is_full(self) -> bool:
-        return len(self.members.all()) >= self.max_size
+        return self.member_count >= self.max_size
 
     def ensure_membership(self, user: User, member: bool) -> bool:
         """
@@ -35,11 +71,10 @@ class Team(models.Model):
         :return: `True` if successfully ensured, `False` otherwise (e.g. if `member == True` but
             the `Team` was full).
         """
-        user_team = user.teams.filter(pk=self.pk).first()
-        is_on_team = user_team is not None
-        if is_on_team == member:
-            return True
-        return self.toggle_membership(user)
+        if member:
+            return self.join(user)
+        self.leave(user)
+        return True
 
     def toggle_membership(self, user: User) -> bool:
         """Toggles the membership of a `User` for this `Team`.
@@ -48,24 +83,55 @@ class Team(models.Model):
         :return: `True` if the `User`'s membership was successfully toggled,
             `False` otherwise (e.g. if the `Team` is full)
         """
-        try:
-            my_team = user.teams.get(pk=self.id)
-        except Team.DoesNotExist:
-            my_team = None
+        if self.leave(user):
+            return True
+        return self.join(user)
+
+    def join(self, user: User) -> bool:
+        """Adds a `User` to this `Team` if it has space left.
 
-        if my_team is not None:
-            user.memberships.filter(team__id=self.id).delete()
+        Concurrent joins of the same `Team` are serialized, so `max_size` holds even when
+        many people join at once: on Postgres by locking the `Team` row, and on SQLite
+        (which has no row locks) by taking the database write lock up front.
+
+        :param user: The `User` to add.
+        :return: `True` if the `User` is now on the `Team`, `False` if the `Team` is full.
+        """
+        from main.models import TeamMembership
+        with transaction.atomic():
+            max_size = Team.lock_for_joining([self.pk])[self.pk]
+
+            memberships = TeamMembership.objects.filter(team=self)
+            if memberships.filter(member=user).exists():
+                return True
+            if memberships.count() >= max_size:
+                return False
+            TeamMembership.objects.create(team=self, member=user)
             return True
 
-        if self.is_full:
-            return False
+    @classmethod
+    def lock_for_joining(cls, team_ids: Iterable[int]) -> Dict[int, int]:
+        """Locks the `Team`s with `team_ids` until the end of the transaction, in one statement.
 
+        :param team_ids: The primary keys of the `Team`s to lock. Must be inside `transaction.atomic()`.
+        :return: The `max_size` of each of the `Team`s, by primary key, leaving out any that don't exist.
+        """
+        # Always locked in primary key order, so that concurrent joins can't deadlock.
+        teams = cls.objects.filter(pk__in=team_ids).order_by('pk')
+        if connection.features.has_select_for_update:
+            return dict(teams.select_for_update().values_list('pk', 'max_size'))
+        teams.update(max_size=F('max_size'))
+        return dict(teams.values_list('pk', 'max_size'))
+
+    def leave(self, user: User) -> bool:
+        """Removes a `User` from this `Team`.
+
+        :param user: The `User` to remove.
+        :return: `True` if the `User` was on the `Team`, `False` otherwise.
+        """
         from main.models import TeamMembership
-        membership = TeamMembership()
-        membership.member = user
-        membership.team = self
-        membership.save()
-        return True
+        num_deleted, _ = TeamMembership.objects.filter(team=self, member=user).delete()
+        return num_deleted > 0
 
     @classmethod
     def objects_ordered_by_remaining_space(cls) -> QuerySet:
@@ -74,6 +140,54 @@ class Team(models.Model):
                       needed_members=F('num_members')-F('max_size'))\
             .order_by(F('needed_members'))
 
+    @classmethod
+    def open_teams(cls) -> List[OpenTeam]:
+        """
+        The teams with space left, most room first, for the signup form. This is a
+        snapshot kept in the default cache, which production shares between workers
+        (see CACHES in the settings); with a process-local cache, as in development,
+        each worker keeps its own copy and only forgets it when it made the change
+        itself or after `OPEN_TEAMS_TIMEOUT`. Either way, check a team's capacity again
+        before adding anybody to it.
+        """
+        teams = cache.get(OPEN_TEAMS_CACHE_KEY)
+        if teams is None:
+            teams = [OpenTeam(id=team.pk, name=team.name, member_count=team.num_members, max_size=team.max_size)
+                     for team in cls.objects_ordered_by_remaining_space().filter(num_members__lt=F('max_size'))]
+            cache.set(OPEN_TEAMS_CACHE_KEY, teams, OPEN_TEAMS_TIMEOUT)
+        return teams
+
+    @classmethod
+    def forget_open_teams(cls) -> None:
+        cache.delete(OPEN_TEAMS_CACHE_KEY)
+
+    @classmethod
+    def objects_with_member_stats(cls) -> QuerySet:
+        """
+        Teams ordered by remaining space, along with everything the team list needs: the
+        member count (which `member_count`, `is_full` and `__str__` reuse) and the leads
+        with their profiles, all loaded in a fixed number of queries.
+        """
+        from main.models import TeamMembership
+        lead_memberships = TeamMembership.objects.filter(is_lead=True).select_related('member__profile')
+        return cls.objects_ordered_by_remaining_space()\
+            .prefetch_related(Prefetch('teammembership_set',
+                                       queryset=lead_memberships,
+                                       to_attr='lead_memberships'))
+
+    @classmethod
+    def objects_with_members(cls) -> QuerySet:
+        """
+        Teams along with everything the team page needs: the member count and every
+        membership with the member's profile, so that `leads` and `non_leads` don't query.
+        """
+        from main.models import TeamMembership
+        memberships = TeamMembership.objects.select_related('member__profile').order_by('pk')
+        return cls.objects_ordered_by_remaining_space()\
+            .prefetch_related(Prefetch('teammembership_set',
+                                       queryset=memberships,
+                                       to_attr='all_memberships'))
+
     def __str__(self):
-        return '{} ({}/{})'.format(self.name, self.members.count(), self.max_size)
+        return '{} ({}/{})'.format(self.name, self.member_count, self.max_size)
 
@@ -8,6 +8,15 @@ class TeamMembership(models.Model):
     member = models.ForeignKey(User, related_name='memberships')
     is_lead = models.BooleanField(default=False)
 
+    class Meta:
+        unique_together = ('team', 'member')
+        indexes = [
+            # A camper's teams, e.g. the admin's team filter and the leads' fragment stamps.
+            models.Index(fields=['member', 'team']),
+            # The leads of a page of teams.
+            models.Index(fields=['team', 'is_lead']),
+        ]
+
     def __str__(self):
         return '<{}, {}>'.format(self.team, self.member)
 
@@ -1,25 +1,23 @@
-from typing import Optional, List
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional
 
 from django.contrib.auth.decorators import user_passes_test
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import models
+from django.db.models import QuerySet
 from django.contrib.auth.models import User
 from django.contrib.staticfiles.templatetags.staticfiles import static
 from django.urls import reverse
-from django_resized import ResizedImageField
 
-import datetime
-import pytz
 import phonenumbers
-from uszipcode import ZipcodeSearchEngine
-from timezonefinder import TimezoneFinder
-from uszipcode.searchengine import Zipcode
 
+from main.images import PictureSpec, picture_srcset, picture_url
 from main.models import AttendanceProfile
+from main.models import reference_data
 from main.models.food_restriction import FoodRestriction
 from main.models.skill import Skill
-from main.models.util import get_next_event_year
-from playacamp import settings
+from main.models.util import get_next_event_year, iterate_chunks, update_related_ids
+from main.models.zipcode_index import ZipcodeInfo, get_zipcode_index, utc_offset
 
 
 def requires_verified_by_admin(func):
@@ -35,7 +33,9 @@ def requires_verified_by_admin(func):
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, primary_key=True, related_name='profile')
-    profile_picture = ResizedImageField(size=[512, 512], quality=100, upload_to='profile_pictures', null=True, blank=True)
+    profile_picture = models.ImageField(upload_to='profile_pictures', null=True, blank=True)
+    profile_picture_original = models.FileField(upload_to='profile_pictures/originals', null=True, blank=True)
+    profile_picture_processing = models.BooleanField(default=False)
     phone_number = models.CharField(max_length=12, null=True, blank=True)
     zipcode = models.CharField(max_length=5, null=True, blank=True)
     biography = models.TextField(blank=True)
@@ -45,6 +45,14 @@ class UserProfile(models.Model):
     years_on_playa = models.IntegerField(blank=True, null=True)
     invited_by = models.CharField(max_length=64, null=True, blank=True)
     is_verified_by_admin = models.NullBooleanField('Verified')
+    # Bumped by `main.signals` whenever anything shown in a cached profile fragment changes.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    PROFILE_PICTURE = PictureSpec(original_field='profile_picture_original',
+                                  picture_field='profile_picture',
+                                  processing_field='profile_picture_processing',
+                                  sizes=(64, 128, 256, 512),
+                                  quality=80)
 
     @property
     def username(self) -> str:
@@ -62,18 +70,54 @@ class UserProfile(models.Model):
     def email(self) -> str:
         return self.user.email
 
+    def save(self, *args, **kwargs) -> None:
+        super().save(*args, **kwargs)
+        self.clear_cached_attendance()
+
+    def refresh_from_db(self, *args, **kwargs) -> None:
+        super().refresh_from_db(*args, **kwargs)
+        self.clear_cached_attendance()
+
     def try_fetch_current_attendance(self, include_soft_deleted=False) -> Optional[AttendanceProfile]:
-        current_year = get_next_event_year()
-        try:
-            if include_soft_deleted:
-                return AttendanceProfile.objects.get(user=self.user,
-                                                     year=current_year)
-            else:
-                return AttendanceProfile.objects.get(user=self.user,
-                                                     year=current_year,
-                                                     deleted_at=None)
-        except AttendanceProfile.DoesNotExist:
+        """
+        Returns this year's attendance, looking it up at most once per instance. Call
+        `clear_cached_attendance` after changing the attendance so the next call sees it.
+        """
+        if not hasattr(self, '_current_attendance'):
+            attendances = AttendanceProfile.objects.filter(user_id=self.user_id, year=get_next_event_year())
+            self._cache_attendance(attendances)
+        attendance = self._current_attendance
+        if attendance is not None and attendance.deleted_at is not None and not include_soft_deleted:
             return None
+        return attendance
+
+    def clear_cached_attendance(self) -> None:
+        if hasattr(self, '_current_attendance'):
+            del self._current_attendance
+
+    def _cache_attendance(self, attendances: Iterable[AttendanceProfile]) -> None:
+        # Prefer a live attendance over a soft-deleted one for the same year.
+        self._current_attendance = None
+        for attendance in attendances:
+            if self._current_attendance is None or self._current_attendance.deleted_at is not None:
+                self._current_attendance = attendance
+
+    @classmethod
+    def prefetch_current_attendance(cls, profiles: Iterable['UserProfile']) -> List['UserProfile']:
+        """
+        Fetches the current year's attendance for all of `profiles` in a single query, so
+        that `try_fetch_current_attendance`, `is_attending` and `paid_dues` don't query per
+        profile.
+        """
+        profiles = list(profiles)
+        attendances = AttendanceProfile.objects.filter(user_id__in=[profile.user_id for profile in profiles],
+                                                       year=get_next_event_year())
+        attendances_by_user_id = defaultdict(list)  # type: Dict[int, List[AttendanceProfile]]
+        for attendance in attendances:
+            attendances_by_user_id[attendance.user_id].append(attendance)
+        for profile in profiles:
+            profile._cache_attendance(attendances_by_user_id[profile.user_id])
+        return profiles
 
     @property
     def is_attending(self) -> bool:
@@ -86,41 +130,60 @@ class UserProfile(models.Model):
             return False
         return attendance.paid_dues
 
-    def profile_pic_url(self) -> str:
-        if self.profile_picture:
-            assert settings.AWS_STORAGE_BUCKET_NAME
-            return self.profile_picture.url
+    def has_processed_profile_picture(self) -> bool:
+        return bool(self.profile_picture) and not self.profile_picture_processing
+
+    def profile_pic_url(self, size: Optional[int]=None) -> str:
+        """The picture URL, or that of the smallest variant at least `size` pixels across."""
+        if self.has_processed_profile_picture():
+            return picture_url(self.profile_picture, self.PROFILE_PICTURE, size)
         return static('default-profile-pic.png')
 
-    def get_rich_zipcode(self) -> Optional[Zipcode]:
-        if not self.zipcode:
-            return None
-        search = ZipcodeSearchEngine()
-        return search.by_zipcode(self.zipcode)
+    def profile_pic_srcset(self) -> str:
+        if self.has_processed_profile_picture():
+            return picture_srcset(self.profile_picture, self.PROFILE_PICTURE)
+        return ''
+
+    def get_rich_zipcode(self) -> Optional[ZipcodeInfo]:
+        return get_zipcode_index().get(self.zipcode)
 
     def city_and_state(self) -> Optional[str]:
         zipcode = self.get_rich_zipcode()
         if zipcode is None:
             return None
-        return '{}, {}'.format(zipcode['City'], zipcode['State'])
+        return '{}, {}'.format(zipcode.city, zipcode.state)
 
     def get_timezone_offset(self) -> Optional[str]:
-        zipcode = self.get_rich_zipcode()
-        if zipcode is None:
-            return None
-        tf = TimezoneFinder()
-        longitude = zipcode['Longitude']
-        latitude = zipcode['Latitude']
-        timezone_name = tf.timezone_at(lng=longitude, lat=latitude)
+        timezone_name = get_zipcode_index().timezone_name(self.zipcode)
         if timezone_name is None:
             return None
-        return datetime.datetime.now(pytz.timezone(timezone_name)).strftime('%z')
+        return utc_offset(timezone_name)
 
     def missing_social_media_link_types(self) -> List[str]:
         from main.models import SocialMediaLink
         existing_links = {(link.account_type, link.get_account_type_display()) for link in self.social_media_links.all()}
         return list(set(SocialMediaLink.ACCOUNT_TYPES) - existing_links)
 
+    def other_skills(self) -> List[Skill]:
+        """The skills this profile doesn't have, in catalog order."""
+        skill_ids = {skill.id for skill in self.skills.all()}
+        return [skill for skill in reference_data.skills.all() if skill.id not in skill_ids]
+
+    def other_food_restrictions(self) -> List[FoodRestriction]:
+        restriction_ids = {restriction.id for restriction in self.food_restrictions.all()}
+        return [restriction for restriction in reference_data.food_restrictions.all()
+                if restriction.id not in restriction_ids]
+
+    def update_skills(self, skill_ids: Iterable[int]) -> bool:
+        """Sets the skills to those of `skill_ids` that exist. Returns whether anything changed."""
+        added, removed = update_related_ids(self.skills, reference_data.skills.existing_ids(skill_ids))
+        return bool(added or removed)
+
+    def update_food_restrictions(self, restriction_ids: Iterable[int]) -> bool:
+        added, removed = update_related_ids(self.food_restrictions,
+                                            reference_data.food_restrictions.existing_ids(restriction_ids))
+        return bool(added or removed)
+
     def formatted_phone_number(self) -> Optional[str]:
         if self.phone_number:
             try:
@@ -134,7 +197,7 @@ class UserProfile(models.Model):
         return None
 
     def get_absolute_url(self) -> str:
-        return reverse('user-profile', kwargs={'user_id': self.user.id})
+        return reverse('user-profile', kwargs={'user_id': self.user_id})
 
     def get_formatted_name(self) -> str:
         full_name = self.user.get_full_name()
@@ -175,6 +238,17 @@ class UserProfile(models.Model):
             "Invited By"
         ]
 
+    @classmethod
+    def csv_rows(cls, queryset: QuerySet) -> Iterator[List[str]]:
+        """
+        Yields `to_csv()` for every profile in `queryset` using a constant number of queries
+        per chunk of profiles, rather than several per profile.
+        """
+        profiles = queryset.select_related('user').prefetch_related('food_restrictions', 'skills')
+        for chunk in iterate_chunks(profiles):
+            for profile in cls.prefetch_current_attendance(chunk):
+                yield profile.to_csv()
+
     def to_csv(self) -> List[str]:
         food_restrictions = ','.join([fr.name for fr in self.food_restrictions.all()])
         skills = ','.join([skill.name for skill in self.skills.all()])
@@ -1,5 +1,7 @@
 from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Tuple
 
+from django.db.models import QuerySet
 from django.utils import timezone
 
 
@@ -20,3 +22,46 @@ def get_next_event_year() -> int:
     if now > labor_day:
         year += 1
     return year
+
+
+def iterate_chunks(queryset: QuerySet, chunk_size: int=500) -> Iterator[List]:
+    """
+    Iterates over a queryset in primary key order, fetching `chunk_size` rows at a time.
+
+    Unlike `QuerySet.iterator()` this keeps `select_related` and `prefetch_related` working,
+    with the prefetches running once per chunk, while never holding more than one chunk in
+    memory.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_queryset[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+def iterate_in_chunks(queryset: QuerySet, chunk_size: int=500) -> Iterator:
+    """Like `iterate_chunks`, but yields the individual rows."""
+    for chunk in iterate_chunks(queryset, chunk_size):
+        yield from chunk
+
+
+def update_related_ids(manager, ids: Iterable[int]) -> Tuple[List[int], List[int]]:
+    """
+    Makes the many-to-many `manager` relate to exactly `ids`. Only the current ids are
+    read, and only the difference is written, so the cost follows the size of the change
+    rather than that of either side. Returns the `(added, removed)` ids.
+    """
+    wanted = set(ids)
+    current = set(manager.values_list('pk', flat=True))
+    added, removed = sorted(wanted - current), sorted(current - wanted)
+    if removed:
+        manager.remove(*removed)
+    if added:
+        manager.add(*added)
+    return added, removed
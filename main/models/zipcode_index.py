@@ -0,0 +1,156 @@
+import datetime
+import functools
+import gzip
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import pytz
+from timezonefinder import TimezoneFinder
+from uszipcode import ZipcodeSearchEngine
+
+TIMEZONE_TABLE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'zipcode_timezones.txt.gz')
+
+
+class ZipcodeInfo(NamedTuple):
+    zipcode: str
+    city: str
+    state: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+
+class ZipcodeIndex:
+    """
+    A read-only, in-memory table of the standard US zipcodes.
+
+    `ZipcodeSearchEngine` opens its SQLite file every time it's constructed, so instead of
+    building one per lookup we read the handful of columns we use once per process and
+    answer every lookup from a dict.
+    """
+    SQL = '''
+        SELECT Zipcode, City, State, Latitude, Longitude
+        FROM zipcode
+        WHERE ZipcodeType = 'Standard'
+    '''
+
+    def __init__(self, rows: Dict[str, ZipcodeInfo], timezone_table_path: Optional[str]=None) -> None:
+        self._rows = rows
+        self._timezone_table_path = timezone_table_path
+        self._timezone_table = None  # type: Optional[Dict[str, str]]
+        self._timezone_names = {}  # type: Dict[str, Optional[str]]
+        self._timezone_finder = None  # type: Optional[TimezoneFinder]
+
+    @classmethod
+    def load(cls) -> 'ZipcodeIndex':
+        rows = {}  # type: Dict[str, ZipcodeInfo]
+        with ZipcodeSearchEngine() as search:
+            for zipcode, city, state, latitude, longitude in search.cursor.execute(cls.SQL):
+                rows[zipcode] = ZipcodeInfo(zipcode=zipcode,
+                                            city=city,
+                                            state=state,
+                                            latitude=latitude,
+                                            longitude=longitude)
+        return cls(rows, timezone_table_path=TIMEZONE_TABLE_PATH)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self) -> Iterator[ZipcodeInfo]:
+        return iter(self._rows.values())
+
+    def __contains__(self, zipcode: str) -> bool:
+        return self.get(zipcode) is not None
+
+    def get(self, zipcode: Optional[str]) -> Optional[ZipcodeInfo]:
+        if not zipcode:
+            return None
+        return self._rows.get(zipcode.zfill(5))
+
+    def timezone_name(self, zipcode: Optional[str]) -> Optional[str]:
+        """
+        Looks up the IANA timezone name (e.g. `America/Los_Angeles`) for a zipcode.
+
+        Zipcodes are answered from the precomputed table written by the
+        `buildzipcodetimezones` command. `TimezoneFinder` is only used for zipcodes missing
+        from it, and those results are memoized.
+        """
+        info = self.get(zipcode)
+        if info is None:
+            return None
+        timezone_name = self._load_timezone_table().get(info.zipcode)
+        if timezone_name is not None:
+            return timezone_name
+        if info.zipcode not in self._timezone_names:
+            self._timezone_names[info.zipcode] = self.find_timezone_name(info)
+        return self._timezone_names[info.zipcode]
+
+    def find_timezone_name(self, info: ZipcodeInfo) -> Optional[str]:
+        """Runs the (slow) point-in-polygon search for a zipcode's timezone."""
+        if info.latitude is None or info.longitude is None:
+            return None
+        if self._timezone_finder is None:
+            self._timezone_finder = TimezoneFinder()
+        return self._timezone_finder.timezone_at(lng=info.longitude, lat=info.latitude)
+
+    def _load_timezone_table(self) -> Dict[str, str]:
+        if self._timezone_table is None:
+            if self._timezone_table_path and os.path.exists(self._timezone_table_path):
+                self._timezone_table = read_timezone_table(self._timezone_table_path)
+            else:
+                self._timezone_table = {}
+        return self._timezone_table
+
+
+def read_timezone_table(path: str) -> Dict[str, str]:
+    """
+    Reads a zipcode -> timezone table. Each line holds a timezone name followed by a tab
+    and a comma-separated list of the zipcodes in it.
+    """
+    table = {}  # type: Dict[str, str]
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            timezone_name, zipcodes = line.rstrip('\n').split('\t')
+            for zipcode in zipcodes.split(','):
+                table[zipcode] = timezone_name
+    return table
+
+
+def write_timezone_table(path: str, timezone_names: Iterable[Tuple[str, str]]) -> None:
+    """Writes `(zipcode, timezone_name)` pairs in the format `read_timezone_table` expects."""
+    zipcodes_by_timezone = defaultdict(list)  # type: Dict[str, List[str]]
+    for zipcode, timezone_name in timezone_names:
+        zipcodes_by_timezone[timezone_name].append(zipcode)
+    # A fixed mtime keeps the output byte-for-byte reproducible.
+    with open(path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+        for timezone_name in sorted(zipcodes_by_timezone):
+            line = '{}\t{}\n'.format(timezone_name, ','.join(sorted(zipcodes_by_timezone[timezone_name])))
+            f.write(line.encode('utf-8'))
+
+
+def utc_offset(timezone_name: str) -> str:
+    """Returns the current UTC offset of a timezone, formatted like `-0700`."""
+    now = datetime.datetime.now(pytz.utc)
+    return _utc_offset_for_hour(timezone_name, now.replace(minute=0, second=0, microsecond=0))
+
+
+@functools.lru_cache(maxsize=256)
+def _utc_offset_for_hour(timezone_name: str, hour: datetime.datetime) -> str:
+    # US timezones only change their offset on the hour, so the offset is constant within
+    # any given UTC hour.
+    return hour.astimezone(pytz.timezone(timezone_name)).strftime('%z')
+
+
+_index = None  # type: Optional[ZipcodeIndex]
+_index_lock = threading.Lock()
+
+
+def get_zipcode_index() -> ZipcodeIndex:
+    """Returns the process-wide `ZipcodeIndex`, loading it on first use."""
+    global _index  # pylint: disable=global-statement
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ZipcodeIndex.load()
+    return _index
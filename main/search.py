@@ -0,0 +1,211 @@
+"""
+Full-text search over the camper directory.
+
+Verified profiles are copied into a dedicated search table that the signal handlers in
+`main.signals` keep up to date. On SQLite that table is an FTS5 virtual table; on
+Postgres it holds a weighted `tsvector` plus the names under a trigram index, so that
+slightly misspelled names still match.
+"""
+import re
+from typing import Iterable, List, NamedTuple
+
+from django.db import connection as default_connection
+from django.db.models import Q
+
+SEARCH_TABLE = 'main_profilesearch'
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+class ProfileDocument(NamedTuple):
+    user_id: int
+    name: str
+    playa_name: str
+    email: str
+    skills: str
+    biography: str
+
+
+def tokenize(query: str) -> List[str]:
+    return TOKEN_PATTERN.findall(query.lower())
+
+
+def build_documents(profiles: Iterable) -> List[ProfileDocument]:
+    """
+    Builds the searchable text for each profile. Callers should `select_related('user')`
+    and `prefetch_related('skills')` to keep this to a constant number of queries.
+    """
+    return [
+        ProfileDocument(user_id=profile.user_id,
+                        name='{} {}'.format(profile.user.first_name, profile.user.last_name).strip(),
+                        playa_name=profile.playa_name or '',
+                        email=profile.user.email,
+                        skills=' '.join(skill.name for skill in profile.skills.all()),
+                        biography=profile.biography or '')
+        for profile in profiles
+    ]
+
+
+class ProfileSearchBackend:
+    """Fallback for databases without a full-text index: a plain substring search."""
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+
+    def create_table(self) -> None:
+        pass
+
+    def drop_table(self) -> None:
+        pass
+
+    def index(self, documents: Iterable[ProfileDocument]) -> None:
+        pass
+
+    def remove(self, user_ids: Iterable[int]) -> None:
+        pass
+
+    def search(self, query: str, limit: int) -> List[int]:
+        from main.models import UserProfile
+        profiles = UserProfile.objects.filter(is_verified_by_admin=True)
+        for token in tokenize(query):
+            profiles = profiles.filter(Q(playa_name__icontains=token) |
+                                       Q(user__email__icontains=token) |
+                                       Q(user__first_name__icontains=token) |
+                                       Q(user__last_name__icontains=token))
+        return list(profiles.order_by('pk').values_list('pk', flat=True)[:limit])
+
+
+class SqliteProfileSearchBackend(ProfileSearchBackend):
+    # Column weights for bm25(), in table column order.
+    WEIGHTS = (10.0, 10.0, 4.0, 2.0, 1.0)
+
+    def create_table(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE {} USING fts5(
+                    name, playa_name, email, skills, biography,
+                    tokenize = 'unicode61 remove_diacritics 1',
+                    prefix = '2 3'
+                )
+            '''.format(SEARCH_TABLE))
+
+    def drop_table(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(SEARCH_TABLE))
+
+    def index(self, documents: Iterable[ProfileDocument]) -> None:
+        documents = list(documents)
+        if not documents:
+            return
+        self.remove(document.user_id for document in documents)
+        with self.connection.cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO {} (rowid, name, playa_name, email, skills, biography)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            '''.format(SEARCH_TABLE), documents)
+
+    def remove(self, user_ids: Iterable[int]) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM {} WHERE rowid = %s'.format(SEARCH_TABLE),
+                               [(user_id,) for user_id in user_ids])
+
+    def search(self, query: str, limit: int) -> List[int]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        # Every token has to match, and the last one may be partially typed.
+        match = ' '.join('"{}"'.format(token) for token in tokens[:-1])
+        match += ' "{}"*'.format(tokens[-1])
+        with self.connection.cursor() as cursor:
+            cursor.execute('''
+                SELECT rowid FROM {table}
+                WHERE {table} MATCH %s
+                ORDER BY bm25({table}, {weights}), rowid
+                LIMIT %s
+            '''.format(table=SEARCH_TABLE, weights=', '.join(str(w) for w in self.WEIGHTS)),
+                           [match.strip(), limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresProfileSearchBackend(ProfileSearchBackend):
+    def create_table(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute('''
+                CREATE TABLE {table} (
+                    user_id integer PRIMARY KEY,
+                    document tsvector NOT NULL,
+                    names text NOT NULL
+                )
+            '''.format(table=SEARCH_TABLE))
+            cursor.execute('CREATE INDEX {table}_document ON {table} USING gin (document)'.format(
+                table=SEARCH_TABLE))
+            cursor.execute('CREATE INDEX {table}_names_trgm ON {table} USING gin (names gin_trgm_ops)'.format(
+                table=SEARCH_TABLE))
+
+    def drop_table(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(SEARCH_TABLE))
+
+    def index(self, documents: Iterable[ProfileDocument]) -> None:
+        rows = [
+            (document.user_id,
+             document.name, document.playa_name, document.email, document.skills, document.biography,
+             '{} {}'.format(document.name, document.playa_name).strip())
+            for document in documents
+        ]
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO {} (user_id, document, names)
+                VALUES (%s,
+                        setweight(to_tsvector('simple', %s || ' ' || %s), 'A') ||
+                        setweight(to_tsvector('simple', %s), 'B') ||
+                        setweight(to_tsvector('simple', %s), 'C') ||
+                        setweight(to_tsvector('simple', %s), 'D'),
+                        %s)
+                ON CONFLICT (user_id) DO UPDATE SET document = EXCLUDED.document, names = EXCLUDED.names
+            '''.format(SEARCH_TABLE), rows)
+
+    def remove(self, user_ids: Iterable[int]) -> None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE user_id = ANY(%s)'.format(SEARCH_TABLE), [user_ids])
+
+    def search(self, query: str, limit: int) -> List[int]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        ts_query = ' & '.join(tokens[:-1] + ['{}:*'.format(tokens[-1])])
+        with self.connection.cursor() as cursor:
+            cursor.execute('''
+                SELECT user_id FROM {}, to_tsquery('simple', %s) query
+                WHERE document @@ query OR names %% %s
+                ORDER BY ts_rank(document, query) + similarity(names, %s) DESC, user_id
+                LIMIT %s
+            '''.format(SEARCH_TABLE), [ts_query, query, query, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+def get_search_backend(connection=None) -> ProfileSearchBackend:
+    connection = connection or default_connection
+    if connection.vendor == 'sqlite':
+        return SqliteProfileSearchBackend(connection)
+    if connection.vendor == 'postgresql':
+        return PostgresProfileSearchBackend(connection)
+    return ProfileSearchBackend(connection)
+
+
+def search_profiles(query: str, limit: int) -> List[int]:
+    """Returns the user ids of the verified profiles best matching `query`, best first."""
+    return get_search_backend().search(query, limit)
+
+
+def update_search_index(profiles: Iterable) -> None:
+    """Re-indexes `profiles`, dropping any that aren't verified from the index."""
+    profiles = list(profiles)
+    backend = get_search_backend()
+    backend.remove(profile.user_id for profile in profiles if not profile.is_verified_by_admin)
+    backend.index(build_documents(profile for profile in profiles if profile.is_verified_by_admin))
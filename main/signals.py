@@ -0,0 +1,176 @@
+from typing import Optional, Tuple
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from main.models import (AttendanceProfile,
+                         DailyHeadcount,
+                         FoodRestriction,
+                         Skill,
+                         Team,
+                         TeamMembership,
+                         TransportationMethod,
+                         UserProfile)
+from main.models import reference_data
+from main.models.event_day import EventDay
+from main.search import get_search_backend, update_search_index
+
+
+def reindex_profiles(profiles) -> None:
+    update_search_index(profiles.select_related('user').prefetch_related('skills'))
+
+
+@receiver(post_save, sender=UserProfile)
+def index_saved_profile(sender, instance: UserProfile, raw: bool=False, **kwargs) -> None:
+    if raw:
+        return
+    reindex_profiles(UserProfile.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=UserProfile)
+def unindex_deleted_profile(sender, instance: UserProfile, **kwargs) -> None:
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def index_saved_user(sender, instance: User, raw: bool=False, created: bool=False, update_fields=None,
+                     **kwargs) -> None:
+    # Logging in only updates `last_login`, which isn't searchable.
+    if raw or created or update_fields == frozenset(['last_login']):
+        return
+    reindex_profiles(UserProfile.objects.filter(user=instance))
+
+
+@receiver(post_save, sender=Skill)
+def index_profiles_with_saved_skill(sender, instance: Skill, raw: bool=False, created: bool=False,
+                                    **kwargs) -> None:
+    if raw or created:
+        return
+    reindex_profiles(UserProfile.objects.filter(skills=instance))
+
+
+@receiver(pre_delete, sender=Skill)
+def load_profiles_with_deleted_skill(sender, instance: Skill, **kwargs) -> None:
+    # Deleting a skill deletes its through rows without `m2m_changed`, so look up the
+    # affected profiles before they go, as for `pre_clear` below.
+    instance.deleted_profile_ids = list(instance.userprofile_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Skill)
+def index_profiles_with_deleted_skill(sender, instance: Skill, **kwargs) -> None:
+    reindex_profiles(UserProfile.objects.filter(pk__in=getattr(instance, 'deleted_profile_ids', [])))
+
+
+@receiver(m2m_changed, sender=UserProfile.skills.through)
+def index_profile_skills(sender, instance, action: str, reverse: bool, pk_set, **kwargs) -> None:
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            reindex_profiles(UserProfile.objects.filter(pk=instance.pk))
+        return
+
+    # `instance` is a Skill and `pk_set` holds the affected profiles, except when clearing
+    # where we have to look them up before they are removed.
+    if action == 'pre_clear':
+        instance.cleared_profile_ids = list(instance.userprofile_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        reindex_profiles(UserProfile.objects.filter(pk__in=instance.cleared_profile_ids))
+    elif action in ('post_add', 'post_remove'):
+        reindex_profiles(UserProfile.objects.filter(pk__in=pk_set))
+
+
+def apply_headcount_change(old_stay: Optional[Tuple[int, EventDay, EventDay]],
+                           new_stay: Optional[Tuple[int, EventDay, EventDay]]) -> None:
+    if old_stay == new_stay:
+        return
+    with transaction.atomic():
+        if old_stay is not None:
+            DailyHeadcount.apply_stay(*old_stay, delta=-1)
+        if new_stay is not None:
+            DailyHeadcount.apply_stay(*new_stay, delta=1)
+
+
+@receiver(pre_save, sender=AttendanceProfile)
+@receiver(pre_delete, sender=AttendanceProfile)
+def load_headcount_stay(sender, instance: AttendanceProfile, raw: bool=False, **kwargs) -> None:
+    # Read the stay as it's stored right now, rather than snapshotting every attendance as
+    # it's loaded, which would cost every row of every listing and go stale after
+    # `refresh_from_db()`.
+    if raw:
+        return
+    saved = None
+    if instance.pk is not None:
+        saved = AttendanceProfile.objects.filter(pk=instance.pk)\
+            .values_list('year', 'arrival_date', 'departure_date', 'deleted_at')\
+            .first()
+    instance._headcount_stay = AttendanceProfile.stay_for(*saved) if saved is not None else None
+
+
+@receiver(post_save, sender=AttendanceProfile)
+def update_headcounts_for_saved_attendance(sender, instance: AttendanceProfile, raw: bool=False,
+                                           created: bool=False, **kwargs) -> None:
+    if raw:
+        return
+    old_stay = None if created else getattr(instance, '_headcount_stay', None)
+    new_stay = instance.headcount_stay()
+    apply_headcount_change(old_stay, new_stay)
+
+
+@receiver(post_delete, sender=AttendanceProfile)
+def update_headcounts_for_deleted_attendance(sender, instance: AttendanceProfile, **kwargs) -> None:
+    apply_headcount_change(getattr(instance, '_headcount_stay', None), None)
+
+
+# The profile summary and team list item templates are fragment cached on `updated_at`,
+# so bump it on everything those fragments show that lives in other tables.
+def touch_teams_led_by(user_id: int) -> None:
+    Team.objects.filter(teammembership__member_id=user_id, teammembership__is_lead=True)\
+        .update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def touch_fragments_for_saved_user(sender, instance: User, raw: bool=False, created: bool=False,
+                                   update_fields=None, **kwargs) -> None:
+    # Logging in only updates `last_login`, which no fragment shows.
+    if raw or created or update_fields == frozenset(['last_login']):
+        return
+    UserProfile.objects.filter(user=instance).update(updated_at=timezone.now())
+    touch_teams_led_by(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+def touch_fragments_for_saved_profile(sender, instance: UserProfile, raw: bool=False, created: bool=False,
+                                      **kwargs) -> None:
+    if raw or created:
+        return
+    touch_teams_led_by(instance.user_id)
+
+
+@receiver(post_save, sender=TeamMembership)
+@receiver(post_delete, sender=TeamMembership)
+def touch_fragments_for_membership(sender, instance: TeamMembership, raw: bool=False, **kwargs) -> None:
+    if raw:
+        return
+    Team.objects.filter(pk=instance.team_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Skill)
+@receiver(post_save, sender=FoodRestriction)
+@receiver(post_delete, sender=FoodRestriction)
+@receiver(post_save, sender=TransportationMethod)
+@receiver(post_delete, sender=TransportationMethod)
+def invalidate_reference_data(sender, **kwargs) -> None:
+    reference_data.invalidate(sender)
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+@receiver(post_save, sender=TeamMembership)
+@receiver(post_delete, sender=TeamMembership)
+def forget_open_teams(sender, raw: bool=False, **kwargs) -> None:
+    if raw:
+        return
+    Team.forget_open_teams()
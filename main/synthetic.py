@@ -0,0 +1,146 @@
+"""
+Helpers for generating a synthetic camp to benchmark against.
+
+Everything here is meant to run inside `rolled_back()` so that benchmarks never leave
+fake campers behind in a real database.
+"""
+import random
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional, Sequence
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from main.models import AttendanceProfile, Skill, Team, TeamMembership, UserProfile, reference_data
+from main.search import update_search_index
+
+FIRST_NAMES = ('Alice', 'Bob', 'Carol', 'Dave', 'Erin', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy')
+LAST_NAMES = ('Smith', 'Jones', 'Garcia', 'Nguyen', 'Kim', 'Patel', 'Brown', 'Lee', 'Lopez', 'Chen')
+SKILL_NAMES = ('Welding', 'Cooking', 'Carpentry', 'Electrical', 'LEDs', 'First Aid', 'Driving', 'Sewing')
+BIOGRAPHY_WORDS = ('dinosaur', 'desert', 'dust', 'music', 'art', 'build', 'lights', 'bikes', 'sunrise', 'camp')
+# Small enough for the `__in` lookups to stay under SQLite's 999 parameters.
+CHUNK_SIZE = 500
+
+
+@contextmanager
+def rolled_back() -> Iterator[None]:
+    """Runs the enclosed block in a transaction that is always rolled back."""
+    try:
+        with transaction.atomic():
+            yield
+            transaction.set_rollback(True)
+    finally:
+        # The reference data read inside the block may include rows that are gone now.
+        for model in reference_data.TABLES_BY_MODEL:
+            reference_data.invalidate(model)
+
+
+def create_users(count: int, prefix: str='synthetic', seed: int=0) -> List[User]:
+    rng = random.Random(seed)
+    password = make_password(None)
+    users = [
+        User(username='{}{}@example.com'.format(prefix, i),
+             email='{}{}@example.com'.format(prefix, i),
+             first_name=rng.choice(FIRST_NAMES),
+             last_name=rng.choice(LAST_NAMES),
+             password=password)
+        for i in range(count)
+    ]
+    User.objects.bulk_create(users, batch_size=500)
+    # SQLite doesn't hand back primary keys from `bulk_create`, so re-read them, by the exact
+    # usernames so as not to pick up real users whose names happen to share the prefix.
+    usernames = [user.username for user in users]
+    return [user
+            for start in range(0, len(usernames), CHUNK_SIZE)
+            for user in User.objects.filter(username__in=usernames[start:start + CHUNK_SIZE]).order_by('pk')]
+
+
+def create_profiles(users: Sequence[User],
+                    zipcodes: Optional[Sequence[str]]=None,
+                    seed: int=0) -> List[UserProfile]:
+    rng = random.Random(seed)
+    profiles = [
+        UserProfile(user=user,
+                    zipcode=rng.choice(zipcodes) if zipcodes else None,
+                    playa_name='Dino {}'.format(user.pk),
+                    biography=' '.join(rng.choice(BIOGRAPHY_WORDS) for _ in range(12)),
+                    years_on_playa=rng.randint(0, 10),
+                    is_verified_by_admin=True)
+        for user in users
+    ]
+    UserProfile.objects.bulk_create(profiles, batch_size=500)
+    return profiles
+
+
+def create_skills() -> List[Skill]:
+    existing_ids = list(Skill.objects.filter(name__in=SKILL_NAMES).values_list('pk', flat=True))
+    skills = [Skill(name=name, description=name) for name in SKILL_NAMES]
+    Skill.objects.bulk_create(skills)
+    # `bulk_create` skips the signal handler that would drop the cached skills.
+    reference_data.invalidate(Skill)
+    return list(Skill.objects.filter(name__in=SKILL_NAMES).exclude(pk__in=existing_ids))
+
+
+def assign_skills(profiles: Sequence[UserProfile], skills: Sequence[Skill], seed: int=0) -> None:
+    rng = random.Random(seed)
+    through = UserProfile.skills.through
+    through.objects.bulk_create([
+        through(userprofile_id=profile.pk, skill_id=skill.pk)
+        for profile in profiles
+        for skill in rng.sample(list(skills), rng.randint(0, 3))
+    ], batch_size=500)
+
+
+def create_attendances(users: Sequence[User], year: int, attending_ratio: float=0.6,
+                       seed: int=0) -> List[AttendanceProfile]:
+    rng = random.Random(seed)
+    attendances = [
+        AttendanceProfile(user=user,
+                          year=year,
+                          arrival_date=rng.choice(AttendanceProfile.ARRIVAL_CHOICES)[0],
+                          departure_date=rng.choice(AttendanceProfile.DEPARTURE_CHOICES)[0],
+                          paid_dues=rng.random() < 0.5)
+        for user in users
+        if rng.random() < attending_ratio
+    ]
+    AttendanceProfile.objects.bulk_create(attendances, batch_size=500)
+    return attendances
+
+
+def create_teams(count: int, max_size: int=20) -> List[Team]:
+    names = ['Synthetic Team {}'.format(i) for i in range(count)]
+    Team.objects.bulk_create([Team(name=name, description=name, max_size=max_size) for name in names])
+    return list(Team.objects.filter(name__in=names).order_by('pk'))
+
+
+def assign_teams(users: Sequence[User], teams: Sequence[Team], seed: int=0) -> None:
+    rng = random.Random(seed)
+    TeamMembership.objects.bulk_create([
+        TeamMembership(team=team, member=user, is_lead=rng.random() < 0.05)
+        for user in users
+        for team in rng.sample(list(teams), rng.randint(0, min(2, len(teams))))
+    ], batch_size=500)
+
+
+class SyntheticCamp(NamedTuple):
+    users: List[User]
+    teams: List[Team]
+    year: int
+
+
+def create_camp(user_count: int, team_count: int, year: int, prefix: str='synthetic', seed: int=0) -> SyntheticCamp:
+    """
+    A whole camp: verified, searchable profiles with skills, attendances for `year`
+    and team memberships, with room left on every team for new signups.
+    """
+    users = create_users(user_count, prefix=prefix, seed=seed)
+    profiles = create_profiles(users, seed=seed)
+    assign_skills(profiles, create_skills(), seed=seed)
+    for start in range(0, len(users), CHUNK_SIZE):
+        chunk = UserProfile.objects.filter(user__in=users[start:start + CHUNK_SIZE])
+        update_search_index(chunk.select_related('user').prefetch_related('skills'))
+    create_attendances(users, year, seed=seed)
+    teams = create_teams(team_count, max_size=user_count + 100)
+    assign_teams(users, teams, seed=seed)
+    return SyntheticCamp(users=users, teams=teams, year=year)
@@ -0,0 +1,80 @@
+import csv
+import io
+from typing import List
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from main.models import AttendanceProfile, FoodRestriction, Skill, TransportationMethod, UserProfile
+from main.models.util import get_next_event_year, iterate_in_chunks
+
+
+class TestExportCsv(TestCase):
+    def setUp(self) -> None:
+        self.admin = User.objects.create_superuser('admin', 'admin@foobar.com', 'foobarbaz')
+        UserProfile(user=self.admin).save()
+
+        self.vegan = FoodRestriction(name='Vegan', description='No animal products.')
+        self.vegan.save()
+        self.welding = Skill(name='Welding', description='Sparks')
+        self.welding.save()
+        self.car = TransportationMethod(name='Car', description='Vroom')
+        self.car.save()
+
+        for i in range(5):
+            user = User.objects.create_user('camper{}'.format(i), 'camper{}@foobar.com'.format(i), 'passwd',
+                                            first_name='Camper', last_name=str(i))
+            profile = UserProfile(user=user, zipcode='94103', years_on_playa=i)
+            profile.save()
+            profile.food_restrictions.add(self.vegan)
+            profile.skills.add(self.welding)
+            AttendanceProfile(user=user,
+                              year=get_next_event_year(),
+                              arrival_date='sunday',
+                              departure_date='monday',
+                              to_transportation_method=self.car,
+                              from_transportation_method=self.car).save()
+
+        self.client.login(username='admin', password='foobarbaz')
+
+    def export(self, model_name: str, ids: List[int]) -> List[List[str]]:
+        response = self.client.post(reverse('admin:main_{}_changelist'.format(model_name)), {
+            'action': 'export_csv',
+            '_selected_action': ids,
+        }, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Disposition'].startswith('attachment; filename='))
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_export_user_profiles(self) -> None:
+        profiles = UserProfile.objects.filter(user__username__startswith='camper')
+        rows = self.export('userprofile', [profile.pk for profile in profiles])
+        self.assertEqual(rows[0], UserProfile.csv_columns())
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1], ['Camper', '0', 'camper0@foobar.com', 'True', 'False', 'San Francisco, CA',
+                                   'Vegan', 'Welding', '0', ''])
+
+    def test_export_attendance_profiles(self) -> None:
+        attendances = AttendanceProfile.objects.all()
+        rows = self.export('attendanceprofile', [attendance.pk for attendance in attendances])
+        self.assertEqual(rows[0], AttendanceProfile.csv_columns())
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1], ['Camper', '0', 'camper0@foobar.com', 'Unknown', 'Unknown', 'Unknown', 'False',
+                                   'Sunday', 'Monday (Late Crew)', 'Car', 'Car'])
+
+    def test_export_attendance_without_transportation(self) -> None:
+        attendance = AttendanceProfile.objects.first()
+        attendance.from_transportation_method = None
+        attendance.save()
+        rows = self.export('attendanceprofile', [attendance.pk])
+        self.assertEqual(rows[1][-2:], ['Car', 'Unknown'])
+
+    def test_iterate_in_chunks(self) -> None:
+        profiles = UserProfile.objects.select_related('user').prefetch_related('skills')
+        with self.assertNumQueries(3 * 2 + 1):
+            chunked = [(profile.pk, profile.user.username, list(profile.skills.all()))
+                       for profile in iterate_in_chunks(profiles, chunk_size=2)]
+        self.assertEqual([pk for pk, _, _ in chunked], sorted(profile.pk for profile in profiles))
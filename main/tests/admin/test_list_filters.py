@@ -0,0 +1,94 @@
+from typing import Dict, Set
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from main.models import AttendanceProfile, Team, TeamMembership, UserProfile
+from main.models.util import get_next_event_year
+
+
+class TestUserProfileListFilters(TestCase):
+    def setUp(self) -> None:
+        admin = User.objects.create_superuser('admin', 'admin@foobar.com', 'foobarbaz')
+        UserProfile(user=admin).save()
+
+        self.kitchen = Team(name='Kitchen', description='Cook stuff', max_size=10)
+        self.kitchen.save()
+        self.lights = Team(name='Lights', description='Blink stuff', max_size=10)
+        self.lights.save()
+
+        self.paid = self.create_camper('paid')
+        AttendanceProfile(user=self.paid, year=get_next_event_year(), paid_dues=True).save()
+        TeamMembership(team=self.kitchen, member=self.paid).save()
+
+        self.unpaid = self.create_camper('unpaid')
+        AttendanceProfile(user=self.unpaid, year=get_next_event_year()).save()
+        TeamMembership(team=self.lights, member=self.unpaid).save()
+
+        self.last_year = self.create_camper('lastyear')
+        AttendanceProfile(user=self.last_year, year=get_next_event_year() - 1, paid_dues=True).save()
+
+        self.client.login(username='admin', password='foobarbaz')
+
+    @staticmethod
+    def create_camper(username: str) -> User:
+        user = User.objects.create_user(username, '{}@foobar.com'.format(username), 'passwd')
+        UserProfile(user=user).save()
+        return user
+
+    def filtered_usernames(self, params: Dict[str, str]) -> Set[str]:
+        response = self.client.get(reverse('admin:main_userprofile_changelist'), params, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return {profile.user.username for profile in response.context['cl'].result_list}
+
+    def test_is_attending(self) -> None:
+        self.assertEqual(self.filtered_usernames({'is_attending': 'yes'}), {'paid', 'unpaid'})
+        self.assertEqual(self.filtered_usernames({'is_attending': 'no'}), {'admin', 'lastyear'})
+
+    def test_paid_dues(self) -> None:
+        self.assertEqual(self.filtered_usernames({'paid_dues': 'yes'}), {'paid'})
+        self.assertEqual(self.filtered_usernames({'paid_dues': 'no'}), {'unpaid'})
+
+    def test_teams(self) -> None:
+        self.assertEqual(self.filtered_usernames({'teams': 'Kitchen'}), {'paid'})
+        self.assertEqual(self.filtered_usernames({'teams': 'Lights'}), {'unpaid'})
+        self.assertEqual(self.filtered_usernames({'teams': 'None'}), {'admin', 'lastyear'})
+        self.assertEqual(self.filtered_usernames({'teams': 'No such team'}),
+                         {'admin', 'paid', 'unpaid', 'lastyear'})
+
+    def test_filters_run_in_one_statement(self) -> None:
+        for params in ({'is_attending': 'yes'}, {'paid_dues': 'no'}, {'teams': 'Kitchen'}):
+            response = self.client.get(reverse('admin:main_userprofile_changelist'), params, secure=True)
+            queryset = response.context['cl'].queryset
+            self.assertIn('EXISTS', str(queryset.query))
+
+
+class TestAttendanceProfileListFilters(TestCase):
+    def setUp(self) -> None:
+        User.objects.create_superuser('admin', 'admin@foobar.com', 'foobarbaz')
+        for username, arrival_date, departure_date in (('early', 'friday1', 'sunday'),
+                                                       ('late', 'monday', 'tuesday'),
+                                                       ('both', 'saturday', 'monday'),
+                                                       ('unknown', None, None)):
+            user = User.objects.create_user(username, '{}@foobar.com'.format(username), 'passwd')
+            AttendanceProfile(user=user, year=2018, arrival_date=arrival_date, departure_date=departure_date).save()
+        self.client.login(username='admin', password='foobarbaz')
+
+    def filtered_usernames(self, params: Dict[str, str]) -> Set[str]:
+        response = self.client.get(reverse('admin:main_attendanceprofile_changelist'), params, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return {attendance.user.username for attendance in response.context['cl'].result_list}
+
+    def test_arrives_early(self) -> None:
+        self.assertEqual(self.filtered_usernames({'arrives_early': 'yes'}), {'early', 'both'})
+        self.assertEqual(self.filtered_usernames({'arrives_early': 'no'}), {'late', 'unknown'})
+
+    def test_departs_late(self) -> None:
+        self.assertEqual(self.filtered_usernames({'departs_late': 'yes'}), {'late', 'both'})
+        self.assertEqual(self.filtered_usernames({'departs_late': 'no'}), {'early', 'unknown'})
+
+    def test_annotations_match_properties(self) -> None:
+        for attendance in AttendanceProfile.objects.with_travel_flags():
+            self.assertEqual(attendance.is_early_arrival, attendance.arrives_early)
+            self.assertEqual(attendance.is_late_departure, attendance.departs_late)
@@ -1,7 +1,17 @@
+import json
+from io import StringIO
+
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
 
 from main.models import HousingGroup, AttendanceProfile
+from main.models.event_day import (EVENT_DAY_BY_ARRIVAL_CHOICES,
+                                   EVENT_DAY_BY_DEPARTURE_CHOICES,
+                                   EventDay,
+                                   count_by_day,
+                                   days_between)
 
 
 class AttendanceProfileTest(TestCase):
@@ -10,8 +20,81 @@ class AttendanceProfileTest(TestCase):
         self.alice.save()
 
     def test_housing_types(self):
-        for value, verbose in HousingGroup.HOUSING_CHOICES:
+        for i, (value, verbose) in enumerate(HousingGroup.HOUSING_CHOICES):
+            # A camper attends each year at most once.
             attendance_profile = AttendanceProfile(user=self.alice,
-                                                   year=2018)
+                                                   year=2018 + i)
             attendance_profile.full_clean()
             attendance_profile.save()
+
+    def create_attendance(self, username: str, year: int, arrival_date: str, departure_date: str,
+                          **kwargs) -> AttendanceProfile:
+        user = User.objects.create_user(username, '{}@foobar.com'.format(username), 'passwd')
+        attendance = AttendanceProfile(user=user, year=year, arrival_date=arrival_date,
+                                       departure_date=departure_date, **kwargs)
+        attendance.save()
+        return attendance
+
+    def test_count_by_day(self):
+        stays = [
+            (EventDay.Wednesday1, EventDay.Tuesday2, 2),
+            (EventDay.Sunday1, EventDay.Saturday2, 1),
+            (EventDay.Friday2, EventDay.Wednesday2, 5),
+        ]
+        expected = {day: 0 for day in EventDay}
+        for arrival, departure, count in stays:
+            for day in days_between(arrival, departure):
+                expected[day] += count
+        self.assertEqual(count_by_day(stays), expected)
+
+    def test_headcounts(self):
+        self.create_attendance('bob', 2018, 'wednesday1', 'monday')
+        self.create_attendance('carol', 2018, 'sunday', 'saturday')
+        self.create_attendance('dave', 2018, 'sunday', 'saturday')
+        self.create_attendance('erin', 2018, 'sunday', None)
+        self.create_attendance('frank', 2018, 'sunday', 'saturday', deleted_at=timezone.now())
+        self.create_attendance('grace', 2019, 'tuesday', 'wednesday')
+
+        with self.assertNumQueries(1):
+            headcounts = AttendanceProfile.headcounts([2019, 2017, 2018])
+        self.assertEqual([headcount.year for headcount in headcounts], [2017, 2018, 2019])
+        self.assertEqual([headcount.total for headcount in headcounts], [0, 3, 1])
+        self.assertEqual(headcounts[1].by_day[EventDay.Wednesday1], 1)
+        self.assertEqual(headcounts[1].by_day[EventDay.Sunday1], 3)
+        self.assertEqual(headcounts[1].by_day[EventDay.Saturday2], 1)
+        self.assertEqual(headcounts[1].by_day[EventDay.Monday2], 0)
+        self.assertEqual(headcounts[2].by_day[EventDay.Tuesday1], 1)
+        self.assertEqual(headcounts[2].by_day[EventDay.Wednesday2], 0)
+
+    def test_dailycounts_command(self):
+        self.create_attendance('bob', 2018, 'sunday', 'saturday')
+        self.create_attendance('carol', 2019, 'sunday', 'saturday')
+
+        output = StringIO()
+        call_command('dailycounts', '2017-2019', '--format=json', stdout=output)
+        counts = json.loads(output.getvalue())
+        self.assertEqual([(count['year'], count['total']) for count in counts], [(2017, 0), (2018, 1), (2019, 1)])
+        self.assertEqual(counts[1]['days']['Sunday1'], 1)
+
+        output = StringIO()
+        call_command('dailycounts', '2018', '--format=csv', stdout=output)
+        header, row = output.getvalue().splitlines()
+        self.assertEqual(header.split(',')[0], 'Year')
+        self.assertEqual(row.split(',')[-1], '1')
+
+        output = StringIO()
+        call_command('dailycounts', '2018', stdout=output)
+        self.assertIn('Sunday1: 1\n', output.getvalue())
+        self.assertIn('Total attendees: 1\n', output.getvalue())
+
+    def test_choice_lookups_match_event_days(self):
+        self.assertEqual(set(AttendanceProfile.ARRIVAL_LABELS), set(EVENT_DAY_BY_ARRIVAL_CHOICES))
+        self.assertEqual(set(AttendanceProfile.DEPARTURE_LABELS), set(EVENT_DAY_BY_DEPARTURE_CHOICES))
+        self.assertEqual(AttendanceProfile.EARLY_ARRIVAL_DATES,
+                         {value for value, day in EVENT_DAY_BY_ARRIVAL_CHOICES.items()
+                          if day.value <= EventDay.Saturday1.value})
+        self.assertEqual(AttendanceProfile.LATE_DEPARTURE_DATES,
+                         {value for value, day in EVENT_DAY_BY_DEPARTURE_CHOICES.items()
+                          if day.value >= EventDay.Monday2.value})
+        with self.assertRaises(TypeError):
+            AttendanceProfile.ARRIVAL_LABELS['sunday'] = 'Sunday'
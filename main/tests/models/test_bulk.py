@@ -0,0 +1,140 @@
+import json
+from io import StringIO
+
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from main.bulk import InvalidRecord, export_campers, hash_passwords, import_campers, read_records, write_records
+from main.models import (AttendanceProfile,
+                         DailyHeadcount,
+                         FoodRestriction,
+                         Skill,
+                         Team,
+                         TeamMembership,
+                         TransportationMethod,
+                         UserProfile)
+from main.search import search_profiles
+
+
+class BulkCampersTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.welding = Skill.objects.create(name='Welding', description='')
+        self.cooking = Skill.objects.create(name='Cooking', description='')
+        self.vegan = FoodRestriction.objects.create(name='Vegan', description='')
+        self.bus = TransportationMethod.objects.create(name='Bus', description='')
+        self.kitchen = Team.objects.create(name='Kitchen', description='', max_size=10)
+        self.art = Team.objects.create(name='Art', description='', max_size=10)
+
+        alice = User.objects.create_user('alice@foobar.com', 'alice@foobar.com', 'passwd', first_name='Alice',
+                                         last_name='Smith')
+        profile = UserProfile.objects.create(user=alice, playa_name='Stego', zipcode='94110',
+                                             phone_number='415-555-0123', years_on_playa=3,
+                                             is_verified_by_admin=True, biography='Builds things')
+        profile.skills.set([self.welding, self.cooking])
+        profile.food_restrictions.set([self.vegan])
+        TeamMembership.objects.create(team=self.kitchen, member=alice, is_lead=True)
+        TeamMembership.objects.create(team=self.art, member=alice)
+        AttendanceProfile.objects.create(user=alice, year=2018, arrival_date='saturday', departure_date='monday',
+                                         to_transportation_method=self.bus, has_ticket=True, paid_dues=True)
+
+        bob = User.objects.create_user('bob@foobar.com', 'bob@foobar.com', 'passwd', first_name='Bob')
+        UserProfile.objects.create(user=bob)
+
+    def export(self, file_format: str) -> str:
+        file = StringIO()
+        write_records(export_campers(UserProfile.objects.all(), 2018, include_password_hashes=True),
+                      file,
+                      file_format)
+        return file.getvalue()
+
+    def test_round_trip(self):
+        for file_format in ('csv', 'jsonl'):
+            exported = self.export(file_format)
+            User.objects.all().delete()
+            DailyHeadcount.objects.all().delete()
+
+            summary = import_campers(read_records(StringIO(exported), file_format))
+            self.assertEqual((summary.created, summary.skipped), (2, 0))
+            self.assertEqual(self.export(file_format), exported)
+
+            alice = User.objects.get(username='alice@foobar.com')
+            self.assertTrue(alice.check_password('passwd'))
+            self.assertTrue(TeamMembership.objects.get(member=alice, team=self.kitchen).is_lead)
+            self.assertEqual(search_profiles('stego', 10), [alice.pk])
+            headcount, = AttendanceProfile.headcounts([2018])
+            self.assertEqual(DailyHeadcount.for_year(2018), headcount.by_day)
+
+    def test_export_queries_per_chunk(self):
+        def count_queries() -> int:
+            with CaptureQueriesContext(connection) as queries:
+                list(export_campers(UserProfile.objects.all(), 2018))
+            return len(queries)
+
+        # The first export loads the reference tables.
+        count_queries()
+        before = count_queries()
+        for i in range(5):
+            user = User.objects.create_user('camper{}@foobar.com'.format(i), 'camper{}@foobar.com'.format(i), 'passwd')
+            UserProfile.objects.create(user=user).skills.set([self.welding])
+            AttendanceProfile.objects.create(user=user, year=2018, to_transportation_method=self.bus,
+                                             from_transportation_method=self.bus)
+        self.assertEqual(count_queries(), before)
+
+    def test_existing_campers_are_skipped(self):
+        records = [(1, {'email': 'alice@foobar.com'}),
+                   (2, {'email': 'carol@foobar.com', 'teams': ['Art']}),
+                   (3, {'email': 'dave@foobar.com', 'password': 'dave-secret', 'is_verified_by_admin': 'yes',
+                        'playa_name': 'Raptor', 'skills': 'Welding'})]
+        before = Team.objects.get(pk=self.art.pk).updated_at
+        summary = import_campers(records)
+        self.assertEqual((summary.created, summary.skipped), (2, 1))
+
+        carol = User.objects.get(username='carol@foobar.com')
+        self.assertFalse(carol.has_usable_password())
+        self.assertEqual(carol.profile.invited_by, None)
+        self.assertGreater(Team.objects.get(pk=self.art.pk).updated_at, before)
+
+        dave = User.objects.get(username='dave@foobar.com')
+        self.assertTrue(dave.check_password('dave-secret'))
+        self.assertEqual(search_profiles('raptor welding', 10), [dave.pk])
+
+    def test_invalid_records_write_nothing(self):
+        records = [
+            (1, {'email': 'carol@foobar.com', 'password': 'secret123'}),
+            (2, {'email': 'dave@foobar.com', 'skills': 'Welding;Juggling'}),
+        ]
+        with self.assertRaisesRegex(InvalidRecord, "line 2: unknown skills 'Juggling'"):
+            import_campers(records)
+        self.assertFalse(User.objects.filter(username__in=['carol@foobar.com', 'dave@foobar.com']).exists())
+
+        for raw, message in (({'email': 'nope'}, 'invalid email'),
+                             ({'email': 'dave@foobar.com', 'arrival_date': 'someday'}, 'unknown arrival_date'),
+                             ({'email': 'dave@foobar.com', 'paid_dues': 'maybe'}, 'must be true or false'),
+                             ({'email': 'dave@foobar.com', 'year': 'soon'}, 'must be a whole number')):
+            with self.assertRaisesRegex(InvalidRecord, message):
+                import_campers([(1, raw)])
+
+        with self.assertRaisesRegex(InvalidRecord, 'already on line 1'):
+            import_campers([(1, {'email': 'dave@foobar.com'}), (2, {'email': 'dave@foobar.com'})])
+
+    def test_hash_passwords_in_pool(self):
+        hashes = hash_passwords(['first-secret', 'second-secret'], workers=2)
+        self.assertTrue(check_password('first-secret', hashes[0]))
+        self.assertTrue(check_password('second-secret', hashes[1]))
+
+    def test_commands(self):
+        out = StringIO()
+        call_command('exportcampers', '-', format='jsonl', year=2018, stdout=out, stderr=StringIO())
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([record['email'] for record in records], ['alice@foobar.com', 'bob@foobar.com'])
+        self.assertIsNone(records[0]['password_hash'])
+        self.assertEqual(records[0]['led_teams'], ['Kitchen'])
+
+        with self.assertRaisesRegex(CommandError, 'format'):
+            call_command('importcampers', 'campers.txt')
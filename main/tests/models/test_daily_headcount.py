@@ -0,0 +1,107 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from main.models import AttendanceProfile, DailyHeadcount
+from main.models.event_day import EventDay
+
+
+class DailyHeadcountTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@foobar.com', 'passwd')
+        self.bob = User.objects.create_user('bob', 'bob@foobar.com', 'passwd')
+
+    def assertHeadcountsMatch(self, year: int) -> None:
+        headcount, = AttendanceProfile.headcounts([year])
+        self.assertEqual(DailyHeadcount.for_year(year), headcount.by_day)
+
+    def test_incremental_updates(self):
+        attendance = AttendanceProfile(user=self.alice, year=2018)
+        attendance.save()
+        self.assertEqual(DailyHeadcount.objects.count(), 0)
+
+        attendance.arrival_date = 'sunday'
+        attendance.departure_date = 'saturday'
+        attendance.save()
+        self.assertEqual(DailyHeadcount.for_year(2018)[EventDay.Sunday1], 1)
+        self.assertHeadcountsMatch(2018)
+
+        AttendanceProfile(user=self.bob, year=2018, arrival_date='wednesday1', departure_date='monday').save()
+        self.assertEqual(DailyHeadcount.for_year(2018)[EventDay.Sunday1], 2)
+        self.assertHeadcountsMatch(2018)
+
+        attendance = AttendanceProfile.objects.get(user=self.alice)
+        attendance.departure_date = 'wednesday'
+        attendance.save()
+        self.assertHeadcountsMatch(2018)
+
+        attendance.deleted_at = timezone.now()
+        attendance.save()
+        self.assertEqual(DailyHeadcount.for_year(2018)[EventDay.Sunday1], 1)
+        self.assertHeadcountsMatch(2018)
+
+        attendance.deleted_at = None
+        attendance.year = 2019
+        attendance.save()
+        self.assertHeadcountsMatch(2018)
+        self.assertHeadcountsMatch(2019)
+
+        AttendanceProfile.objects.only('pk').get(user=self.alice).delete()
+        AttendanceProfile.objects.filter(user=self.bob).delete()
+        self.assertEqual(set(DailyHeadcount.objects.values_list('count', flat=True)), {0})
+
+    def test_deferred_fields(self):
+        AttendanceProfile(user=self.alice, year=2018, arrival_date='sunday', departure_date='saturday').save()
+        attendance = AttendanceProfile.objects.defer('arrival_date').get(user=self.alice)
+        attendance.arrival_date = 'monday'
+        attendance.save()
+        self.assertHeadcountsMatch(2018)
+
+    def test_changed_behind_a_loaded_instance(self):
+        AttendanceProfile(user=self.alice, year=2018, arrival_date='sunday', departure_date='saturday').save()
+        attendance = AttendanceProfile.objects.get(user=self.alice)
+        AttendanceProfile.objects.get(user=self.alice).delete()
+        AttendanceProfile(user=self.alice, year=2018, arrival_date='friday1', departure_date='saturday').save()
+        attendance.pk = AttendanceProfile.objects.get(user=self.alice).pk
+        attendance.refresh_from_db()
+        attendance.arrival_date = 'monday'
+        attendance.save()
+        self.assertHeadcountsMatch(2018)
+
+    def test_unknown_dates(self):
+        AttendanceProfile(user=self.alice, year=2018).save()
+        # Neither before nor after this counts towards any day, so the headcounts still hold.
+        AttendanceProfile.objects.update(arrival_date='someday', departure_date='saturday')
+
+        attendance = AttendanceProfile.objects.get(user=self.alice)
+        self.assertIsNone(attendance.headcount_stay())
+        self.assertHeadcountsMatch(2018)
+        attendance.arrival_date = 'sunday'
+        attendance.save()
+        self.assertEqual(DailyHeadcount.for_year(2018)[EventDay.Sunday1], 1)
+        self.assertHeadcountsMatch(2018)
+
+        AttendanceProfile.objects.update(arrival_date='someday')
+        DailyHeadcount.objects.update(count=0)
+        AttendanceProfile.objects.get(user=self.alice).delete()
+        self.assertEqual(set(DailyHeadcount.objects.values_list('count', flat=True)), {0})
+
+    def test_reconcile(self):
+        AttendanceProfile(user=self.alice, year=2018, arrival_date='sunday', departure_date='saturday').save()
+        # Bulk updates skip the signals, so the headcounts drift.
+        AttendanceProfile.objects.update(arrival_date='friday1')
+
+        output = StringIO()
+        call_command('reconcileheadcounts', stdout=output)
+        self.assertIn('2018 Friday1: stored 0, expected 1', output.getvalue())
+        self.assertEqual(DailyHeadcount.for_year(2018)[EventDay.Friday1], 0)
+
+        call_command('reconcileheadcounts', '--fix', stdout=StringIO())
+        self.assertHeadcountsMatch(2018)
+
+        output = StringIO()
+        call_command('reconcileheadcounts', '2018', stdout=output)
+        self.assertEqual(output.getvalue(), '2018: OK\n')
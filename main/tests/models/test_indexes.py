@@ -0,0 +1,75 @@
+import re
+from typing import List, Optional
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Exists, OuterRef, QuerySet
+from django.test import TestCase
+
+from main.models import AttendanceProfile, Team, TeamMembership, UserProfile
+
+
+def query_plan(queryset: QuerySet) -> List[str]:
+    """The database's plan for `queryset`, one line per step."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are always cheapest to scan, so make scans a last resort.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTestCase(TestCase):
+    def assertUsesIndex(self, queryset: QuerySet, table: str, index: Optional[str]=None) -> None:
+        """Fails if the plan for `queryset` reads all of `table`, or doesn't use `index`."""
+        plan = query_plan(queryset)
+        full_scan = re.compile(r'^(SCAN {0}( AS \w+)?$|SCAN {0} USING COVERING INDEX)|Seq Scan on {0}\b'
+                               .format(re.escape(table)))
+        scans = [step for step in plan if full_scan.search(step.strip(' ->'))]
+        self.assertFalse(scans, 'Full scan of {} in:\n{}'.format(table, '\n'.join(plan)))
+        if index is not None:
+            self.assertTrue(any(index in step for step in plan),
+                            '{} not used in:\n{}'.format(index, '\n'.join(plan)))
+
+
+class IndexTest(QueryPlanTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@foobar.com', 'passwd')
+        self.team = Team.objects.create(name='Kitchen', description='', max_size=10)
+
+    def test_current_attendance(self):
+        self.assertUsesIndex(AttendanceProfile.objects.filter(user_id=self.alice.pk, year=2018),
+                             'main_attendanceprofile')
+
+    def test_live_attendances_by_year(self):
+        stays = AttendanceProfile.objects.filter(year__in=[2017, 2018],
+                                                 deleted_at__isnull=True,
+                                                 arrival_date__isnull=False,
+                                                 departure_date__isnull=False)
+        self.assertUsesIndex(stays.values_list('year', 'arrival_date', 'departure_date'),
+                             'main_attendanceprofile',
+                             'main_attendance_live_stays_idx')
+
+    def test_attending_filter(self):
+        attendances = AttendanceProfile.objects.filter(user=OuterRef('user'), year=2018)
+        profiles = UserProfile.objects.annotate(is_attending=Exists(attendances)).filter(is_attending=True)
+        self.assertUsesIndex(profiles, 'main_attendanceprofile')
+
+    def test_memberships(self):
+        self.assertUsesIndex(TeamMembership.objects.filter(member_id=self.alice.pk), 'main_teammembership')
+        self.assertUsesIndex(TeamMembership.objects.filter(team_id=self.team.pk, member_id=self.alice.pk),
+                             'main_teammembership')
+        self.assertUsesIndex(TeamMembership.objects.filter(team_id__in=[self.team.pk], is_lead=True),
+                             'main_teammembership')
+
+    def test_unique_constraints(self):
+        AttendanceProfile.objects.create(user=self.alice, year=2018)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AttendanceProfile.objects.create(user=self.alice, year=2018, deleted_at='2018-01-01T00:00:00Z')
+
+        TeamMembership.objects.create(team=self.team, member=self.alice)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TeamMembership.objects.create(team=self.team, member=self.alice, is_lead=True)
@@ -0,0 +1,117 @@
+import os
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+
+from main.checks import check_shared_cache
+from main.models import FoodRestriction, Skill, TransportationMethod, reference_data
+from main.models.attendance_profile import AttendanceProfileForm
+
+
+class ReferenceDataTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.welding = Skill.objects.create(name='Welding', description='Hot metal')
+        self.cooking = Skill.objects.create(name='Cooking', description='Hot food')
+
+    def test_rows_are_loaded_once(self):
+        self.assertEqual(reference_data.skills.all(), [self.welding, self.cooking])
+        with self.assertNumQueries(0):
+            self.assertEqual(reference_data.skills.all(), [self.welding, self.cooking])
+            self.assertEqual(reference_data.skills.get(self.cooking.pk), self.cooking)
+            self.assertIsNone(reference_data.skills.get(self.cooking.pk + 100))
+
+    def test_existing_ids(self):
+        ids = reference_data.skills.existing_ids([self.welding.pk, self.cooking.pk + 100])
+        self.assertEqual(ids, [self.welding.pk])
+
+    def test_saves_and_deletes_invalidate(self):
+        reference_data.skills.all()
+        self.welding.name = 'Metalwork'
+        self.welding.save()
+        self.assertEqual([skill.name for skill in reference_data.skills.all()], ['Metalwork', 'Cooking'])
+
+        self.cooking.delete()
+        self.assertEqual([skill.name for skill in reference_data.skills.all()], ['Metalwork'])
+
+        FoodRestriction.objects.create(name='Vegan', description='No animal products')
+        reference_data.food_restrictions.all()
+        Skill.objects.create(name='Rigging', description='Ropes')
+        with self.assertNumQueries(0):
+            reference_data.food_restrictions.all()
+
+    def test_version_is_checked_every_few_seconds(self):
+        reference_data.skills.all()
+        # Another worker renames a skill.
+        Skill.objects.filter(pk=self.welding.pk).update(name='Metalwork')
+        cache.incr(reference_data.skills.version_key)
+
+        with mock.patch('main.models.reference_data.cache') as shared, self.assertNumQueries(0):
+            reference_data.skills.all()
+            reference_data.skills.get(self.cooking.pk)
+        shared.get.assert_not_called()
+
+        later = time.monotonic() + reference_data.VERSION_CHECK_SECONDS
+        with mock.patch('time.monotonic', return_value=later):
+            self.assertEqual([skill.name for skill in reference_data.skills.all()], ['Metalwork', 'Cooking'])
+
+    def test_rolled_back_saves_keep_the_version(self):
+        reference_data.skills.all()
+        version = cache.get(reference_data.skills.version_key)
+        pending = list(connection.run_on_commit)
+        with transaction.atomic():
+            Skill.objects.create(name='Rigging', description='Ropes')
+            self.assertEqual(len(reference_data.skills.all()), 3)
+            transaction.set_rollback(True)
+        self.assertEqual(cache.get(reference_data.skills.version_key), version)
+        # Nor is anything left to bump it once the outer transaction commits.
+        self.assertEqual(connection.run_on_commit, pending)
+
+
+class ReferenceChoiceFieldTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bike = TransportationMethod.objects.create(name='Bike', description='Pedal')
+        self.bus = TransportationMethod.objects.create(name='Bus', description='Burner Express')
+
+    def test_choices(self):
+        form = AttendanceProfileForm()
+        choices = list(form.fields['to_transportation_method'].choices)
+        self.assertEqual(choices, [('', '---------'), (self.bike.pk, 'Bike'), (self.bus.pk, 'Bus')])
+
+    def test_validates_against_cache(self):
+        reference_data.transportation_methods.all()
+        # Only the model's own foreign key validation is left to query.
+        with self.assertNumQueries(1):
+            form = AttendanceProfileForm({'to_transportation_method': str(self.bus.pk),
+                                          'from_transportation_method': ''})
+            self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['to_transportation_method'], self.bus)
+        self.assertIsNone(form.cleaned_data['from_transportation_method'])
+
+    def test_cleaned_rows_are_copies(self):
+        form = AttendanceProfileForm({'to_transportation_method': str(self.bus.pk)})
+        self.assertTrue(form.is_valid(), form.errors)
+        bus = form.cleaned_data['to_transportation_method']
+        self.assertIsNot(bus, reference_data.transportation_methods.get(self.bus.pk))
+        bus.name = 'Party bus'
+        self.assertEqual(reference_data.transportation_methods.get(self.bus.pk).name, self.bus.name)
+        self.assertFalse(bus._state.adding)
+
+    def test_rejects_unknown_ids(self):
+        for value in (str(self.bus.pk + 100), 'bus'):
+            form = AttendanceProfileForm({'to_transportation_method': value})
+            self.assertFalse(form.is_valid())
+            self.assertIn('to_transportation_method', form.errors)
+
+    def test_production_cache_must_be_shared(self):
+        with mock.patch.dict(os.environ, {'DATABASE_URL': 'postgres://camp@localhost/camp'}):
+            errors = check_shared_cache(None)
+            self.assertEqual([error.id for error in errors], ['main.E001'])
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                                       'LOCATION': 'playacamp_cache'}}):
+                self.assertEqual(check_shared_cache(None), [])
+        self.assertEqual(check_shared_cache(None), [])
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
 
 from main.models import Team, TeamMembership
@@ -24,3 +25,22 @@ class TeamTest(TestCase):
 
         self.assertEqual(set(team.members.all()), {alice, bob})
         self.assertEqual(list(team.leads), [alice])
+
+    def test_open_teams_snapshot(self):
+        cache.clear()
+        kitchen = Team.objects.create(name='Kitchen', description='', max_size=1)
+        art = Team.objects.create(name='Art', description='', max_size=3)
+        alice = User.objects.create_user('alice', 'alice@foobar.com', 'passwd')
+
+        self.assertEqual([str(team) for team in Team.open_teams()], ['Art (0/3)', 'Kitchen (0/1)'])
+        with self.assertNumQueries(0):
+            Team.open_teams()
+
+        kitchen.join(alice)
+        self.assertEqual([str(team) for team in Team.open_teams()], ['Art (0/3)'])
+        kitchen.leave(alice)
+        art.join(alice)
+        self.assertEqual([str(team) for team in Team.open_teams()], ['Art (1/3)', 'Kitchen (0/1)'])
+        art.max_size = 1
+        art.save()
+        self.assertEqual([team.id for team in Team.open_teams()], [kitchen.id])
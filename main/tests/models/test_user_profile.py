@@ -1,7 +1,17 @@
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 from django.contrib.auth.models import User
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
-from main.models import UserProfile, FoodRestriction
+from main.images import media_url
+from main.models import AttendanceProfile, UserProfile, FoodRestriction, Skill
+from main.models.util import get_next_event_year
+from playacamp.custom_storages import MediaStorage
 
 
 class UserProfileTest(TestCase):
@@ -48,3 +58,105 @@ class UserProfileTest(TestCase):
             assert len(parsed_number) == 12
 
         self.assertTrue(True)
+
+    def create_campers(self, count: int) -> None:
+        vegan = FoodRestriction.objects.get_or_create(name='Vegan', description='No animal products.')[0]
+        welding = Skill.objects.get_or_create(name='Welding', description='Sparks')[0]
+        start = User.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user('camper{}'.format(i), 'camper{}@foobar.com'.format(i), 'passwd')
+            profile = UserProfile(user=user, zipcode='94103')
+            profile.save()
+            profile.food_restrictions.add(vegan)
+            profile.skills.add(welding)
+            if i % 2 == 0:
+                AttendanceProfile(user=user, year=get_next_event_year(), paid_dues=i % 4 == 0).save()
+
+    def test_csv_rows(self):
+        self.create_campers(3)
+        with self.assertNumQueries(4):
+            rows = list(UserProfile.csv_rows(UserProfile.objects.all()))
+        expected_rows = [profile.to_csv() for profile in UserProfile.objects.order_by('pk')]
+        self.assertEqual(rows, expected_rows)
+
+        self.create_campers(10)
+        with self.assertNumQueries(4):
+            rows = list(UserProfile.csv_rows(UserProfile.objects.all()))
+        expected_rows = [profile.to_csv() for profile in UserProfile.objects.order_by('pk')]
+        self.assertEqual(rows, expected_rows)
+
+    def test_current_attendance_is_memoized(self):
+        alice = User.objects.create_user('alice', 'alice@foobar.com', 'passwd')
+        profile = UserProfile(user=alice)
+        profile.save()
+        attendance = AttendanceProfile(user=alice, year=get_next_event_year(), paid_dues=True)
+        attendance.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(profile.try_fetch_current_attendance(), attendance)
+            self.assertTrue(profile.is_attending)
+            self.assertTrue(profile.paid_dues)
+            self.assertEqual(profile.try_fetch_current_attendance(include_soft_deleted=True), attendance)
+
+        attendance.deleted_at = timezone.now()
+        attendance.save()
+        profile.clear_cached_attendance()
+        with self.assertNumQueries(1):
+            self.assertIsNone(profile.try_fetch_current_attendance())
+            self.assertFalse(profile.is_attending)
+            self.assertEqual(profile.try_fetch_current_attendance(include_soft_deleted=True), attendance)
+
+        attendance.delete()
+        profile.save()
+        self.assertIsNone(profile.try_fetch_current_attendance(include_soft_deleted=True))
+
+    def test_skill_updates_write_only_the_difference(self):
+        cache.clear()
+        alice = User.objects.create_user('alice', 'alice@foobar.com', 'passwd')
+        profile = UserProfile(user=alice)
+        profile.save()
+        welding, cooking, rigging = [Skill.objects.create(name=name, description='') for name in
+                                     ('Welding', 'Cooking', 'Rigging')]
+
+        self.assertTrue(profile.update_skills([welding.id, cooking.id, rigging.id + 100]))
+        self.assertEqual({skill.id for skill in profile.skills.all()}, {welding.id, cooking.id})
+        self.assertEqual(profile.other_skills(), [rigging])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(profile.update_skills([cooking.id, rigging.id]))
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].startswith(('INSERT INTO "main_userprofile_skills"',
+                                              'DELETE FROM "main_userprofile_skills"'))]
+        self.assertEqual(len(writes), 2)
+        self.assertEqual({skill.id for skill in profile.skills.all()}, {cooking.id, rigging.id})
+
+        with self.assertNumQueries(1):
+            self.assertFalse(profile.update_skills([rigging.id, cooking.id]))
+
+    def test_food_restriction_updates(self):
+        cache.clear()
+        alice = User.objects.create_user('alice', 'alice@foobar.com', 'passwd')
+        profile = UserProfile(user=alice)
+        profile.save()
+        vegan = FoodRestriction.objects.create(name='Vegan', description='')
+        kosher = FoodRestriction.objects.create(name='Kosher', description='')
+
+        self.assertTrue(profile.update_food_restrictions([kosher.id]))
+        self.assertEqual(list(profile.food_restrictions.all()), [kosher])
+        self.assertEqual(profile.other_food_restrictions(), [vegan])
+        self.assertTrue(profile.update_food_restrictions([]))
+        self.assertEqual(profile.other_food_restrictions(), [vegan, kosher])
+
+    def test_media_url_matches_storage(self):
+        storage = MediaStorage()
+        for name in ('profile_pictures/photo-0123abcd-512.webp', 'profile_pictures/my photo \u00fc.png'):
+            self.assertEqual(media_url(name), storage.url(name))
+
+    def test_picture_urls_skip_storage(self):
+        alice = User.objects.create_user('alice', 'alice@foobar.com', 'passwd')
+        profile = UserProfile(user=alice, profile_picture='profile_pictures/photo-0123abcd-512.webp')
+        profile.save()
+        with mock.patch.object(MediaStorage, 'url', side_effect=AssertionError('storage was asked for a URL')):
+            self.assertEqual(profile.profile_pic_url(), settings.MEDIA_URL + profile.profile_picture.name)
+            self.assertIn(settings.MEDIA_URL + 'profile_pictures/photo-0123abcd-64.webp 64w',
+                          profile.profile_pic_srcset())
@@ -0,0 +1,61 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from main.models import UserProfile
+from main.models.zipcode_index import (ZipcodeInfo,
+                                       ZipcodeIndex,
+                                       get_zipcode_index,
+                                       read_timezone_table,
+                                       write_timezone_table)
+
+CAMBRIDGE = ZipcodeInfo(zipcode='02139', city='Cambridge', state='MA', latitude=42.36, longitude=-71.1)
+
+
+class ZipcodeIndexTest(TestCase):
+    def test_shared_index(self):
+        self.assertIs(get_zipcode_index(), get_zipcode_index())
+
+    def test_lookup(self):
+        index = ZipcodeIndex({'02139': CAMBRIDGE})
+        self.assertEqual(index.get('02139').city, 'Cambridge')
+        self.assertEqual(index.get('2139').city, 'Cambridge')
+        self.assertIsNone(index.get('99999'))
+        self.assertIsNone(index.get(None))
+        self.assertIsNone(index.get(''))
+
+    def test_timezone_table(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'timezones.txt.gz')
+            write_timezone_table(path, [('02139', 'America/New_York'), ('94103', 'America/Los_Angeles')])
+            self.assertEqual(read_timezone_table(path), {
+                '02139': 'America/New_York',
+                '94103': 'America/Los_Angeles',
+            })
+
+            index = ZipcodeIndex({'02139': CAMBRIDGE}, timezone_table_path=path)
+            with mock.patch.object(index, 'find_timezone_name') as find_timezone_name:
+                self.assertEqual(index.timezone_name('02139'), 'America/New_York')
+                self.assertFalse(find_timezone_name.called)
+
+    def test_timezone_fallback(self):
+        index = ZipcodeIndex({'02139': CAMBRIDGE})
+        with mock.patch.object(index, 'find_timezone_name', return_value='America/New_York') as find_timezone_name:
+            self.assertEqual(index.timezone_name('02139'), 'America/New_York')
+            self.assertEqual(index.timezone_name('02139'), 'America/New_York')
+            self.assertEqual(find_timezone_name.call_count, 1)
+
+    def test_user_profile_location(self):
+        alice = User.objects.create_user('alice', 'alice@foobar.com', 'passwd')
+        profile = UserProfile(user=alice, zipcode='94103')
+        profile.save()
+
+        self.assertEqual(profile.city_and_state(), 'San Francisco, CA')
+        self.assertIn(profile.get_timezone_offset(), ('-0700', '-0800'))
+
+        profile.zipcode = '99999'
+        self.assertIsNone(profile.city_and_state())
+        self.assertIsNone(profile.get_timezone_offset())
@@ -0,0 +1,48 @@
+import json
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from main.models import Skill, UserProfile, reference_data
+
+
+class TestBenchCommand(TestCase):
+    def test_bench(self) -> None:
+        # Real data that looks like the synthetic camp's is left alone.
+        benchwarmer = User.objects.create_user('benchwarmer', 'benchwarmer@example.com', 'passwd')
+        UserProfile.objects.create(user=benchwarmer)
+        welding = Skill.objects.create(name='Welding', description='Sparks')
+        out = StringIO()
+        call_command('bench', users=30, teams=3, repeat=1, stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual((report['users'], report['database']), (30, 'sqlite'))
+
+        results = report['results']
+        for name in ('list_profiles', 'user_profile.get', 'team.list', 'team.get', 'signup.post',
+                     'admin userprofile', 'admin userprofile paid_dues=yes', 'admin attendanceprofile departs_late=no',
+                     'admin userprofile export_csv', 'admin attendanceprofile export_csv', 'dailycounts'):
+            self.assertIn(name, results)
+        statuses = {name: result['status'] for name, result in results.items()}
+        self.assertEqual({name: status for name, status in statuses.items() if status not in (0, 200, 302)}, {})
+        self.assertEqual(statuses['signup.post'], 302)
+
+        # Everything it made was rolled back.
+        self.assertEqual(list(UserProfile.objects.all()), [benchwarmer.profile])
+        self.assertEqual(reference_data.skills.all(), [welding])
+
+    def test_comparisons(self) -> None:
+        for comparison in ('admin', 'dailycounts', 'search', 'signup', 'zipcodes'):
+            out = StringIO()
+            call_command('bench', comparison, users=30, teams=3, repeat=1, stdout=out, stderr=StringIO())
+            report = json.loads(out.getvalue())
+            self.assertEqual(report['comparison'], comparison)
+
+            results = report['results']
+            self.assertTrue(results, comparison)
+            befores = {name[len('before '):] for name in results if name.startswith('before ')}
+            afters = {name[len('after '):] for name in results if name.startswith('after ')}
+            self.assertEqual(befores, afters, comparison)
+            self.assertEqual(len(befores) * 2, len(results), comparison)
+        self.assertFalse(UserProfile.objects.exists())
@@ -0,0 +1,82 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from main.middleware import VIEW_BUDGETS, Budget
+from main.models import AttendanceProfile, Team, TeamMembership, UserProfile
+
+
+class TestRequestMetricsMiddleware(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create_superuser(username='foobar',
+                                                  email='foobar@gmail.com',
+                                                  password='foobarbaz')
+        # Verified, so that pages like the team page show everything they can.
+        UserProfile.objects.create(user=self.user, is_verified_by_admin=True)
+        self.team = Team.objects.create(name='Kitchen', description='Cook stuff', max_size=50)
+        for i in range(20):
+            user = User.objects.create_user(username='camper{}'.format(i), password='foobarbaz')
+            UserProfile.objects.create(user=user, playa_name='Camper {}'.format(i))
+            AttendanceProfile.objects.create(user=user, year=2018, arrival_date='saturday',
+                                             departure_date='monday')
+            TeamMembership.objects.create(team=self.team, member=user, is_lead=i == 0)
+        self.client.login(username='foobar', password='foobarbaz')
+
+    def test_metrics(self) -> None:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('team-detail', args=[self.team.id]), secure=True)
+        metrics = response.metrics
+        self.assertEqual(metrics.view_name, 'team-detail')
+        self.assertEqual(metrics.status, 200)
+        self.assertEqual(metrics.queries, len(queries))
+        self.assertGreater(metrics.template_ms, 0)
+        self.assertGreater(metrics.db_ms, 0)
+        # Lazy querysets run while rendering, so the two overlap.
+        self.assertLessEqual(metrics.db_ms, metrics.total_ms)
+        self.assertLessEqual(metrics.template_ms, metrics.total_ms)
+
+        # Nothing is left wrapped once the request is over.
+        self.assertNotIn('make_cursor', connection.__dict__)
+
+        response = self.client.get('/no/such/page/', secure=True)
+        self.assertEqual(response.metrics.view_name, 'unresolved')
+        self.assertEqual(response.metrics.status, 404)
+
+    def test_log_lines(self) -> None:
+        with self.assertLogs('main.middleware', 'INFO') as logs:
+            self.client.get(reverse('team-list'), secure=True)
+        self.assertRegex(logs.output[0], r'^INFO:.*view=team-list status=200 queries=\d+ .*over_budget=no$')
+
+        with mock.patch.dict(VIEW_BUDGETS, {'team-list': Budget(queries=0)}), \
+                self.assertLogs('main.middleware', 'INFO') as logs:
+            response = self.client.get(reverse('team-list'), secure=True)
+            self.assertEqual(response.metrics.over_budget(),
+                             ['{} queries, budget 0'.format(response.metrics.queries)])
+        self.assertRegex(logs.output[0], r'^WARNING:.*over_budget=yes \(\d+ queries, budget 0\)$')
+
+    def test_query_budgets(self) -> None:
+        # Timings depend on the machine running the tests, so only the query counts are checked.
+        pages = [
+            reverse('user-profile', args=[self.user.id]),
+            reverse('user-profile-me'),
+            reverse('user-profile-list'),
+            reverse('team-list'),
+            reverse('team-detail', args=[self.team.id]),
+            reverse('admin:main_userprofile_changelist'),
+            reverse('admin:main_attendanceprofile_changelist'),
+        ]
+        for page in pages:
+            metrics = self.client.get(page, secure=True).metrics
+            self.assertIn(metrics.view_name, VIEW_BUDGETS)
+            self.assertGreater(metrics.queries, 0)
+            self.assertLessEqual(metrics.queries, metrics.budget.queries, page)
+
+        self.client.logout()
+        metrics = self.client.get(reverse('signup'), secure=True).metrics
+        self.assertLessEqual(metrics.queries, metrics.budget.queries)
@@ -1,7 +1,11 @@
 import os
+from unittest import mock
 
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
 from main.models import Team, UserProfile, TeamMembership
 from main.views.signup import SignUpForm
@@ -9,6 +13,7 @@ from main.views.signup import SignUpForm
 
 class TestSignupView(TestCase):
     def setUp(self) -> None:
+        cache.clear()
         self.user = User.objects.create_user(username='foobar',
                                              email='foobar@gmail.com',
                                              password='foobarbaz')
@@ -40,3 +45,101 @@ class TestSignupView(TestCase):
         os.environ['RECAPTCHA_TESTING'] = 'True'
         form = SignUpForm(data)
         self.assertTrue(form.is_valid())
+
+    def signup_data(self, email: str='dino@gmail.com') -> dict:
+        return {
+            'first_name': 'Dino',
+            'last_name': 'Saur',
+            'years_on_playa': 2,
+            'invited_by': 'Baz Qux',
+            'email': email,
+            'password': 'rawr-rawr',
+            'duplicate_password': 'rawr-rawr',
+            'phone': '555-555-5555',
+            'zipcode': '12345',
+            'g-recaptcha-response': 'PASSED',
+            'interested_teams': [self.team.id],
+        }
+
+    def test_signup(self):
+        os.environ['RECAPTCHA_TESTING'] = 'True'
+        team_updated_at = self.team.updated_at
+        with mock.patch.object(PBKDF2PasswordHasher, 'encode', autospec=True,
+                               side_effect=PBKDF2PasswordHasher.encode) as encode:
+            response = self.client.post(reverse('signup-submit'), self.signup_data(), secure=True)
+        self.assertEqual(encode.call_count, 1)
+
+        user = User.objects.get(username='dino@gmail.com')
+        self.assertRedirects(response, user.profile.get_absolute_url(), fetch_redirect_response=False)
+        self.assertTrue(user.check_password('rawr-rawr'))
+        self.assertEqual(int(self.client.session['_auth_user_id']), user.pk)
+        self.assertEqual((user.profile.invited_by, user.profile.zipcode), ('Baz Qux', '12345'))
+        self.assertEqual(list(user.memberships.values_list('team_id', flat=True)), [self.team.id])
+        self.team.refresh_from_db()
+        self.assertGreater(self.team.updated_at, team_updated_at)
+
+    def test_signup_queries_dont_grow_with_teams(self):
+        os.environ['RECAPTCHA_TESTING'] = 'True'
+        teams = [Team.objects.create(name='Team {}'.format(i), description='', max_size=10) for i in range(4)]
+        data = dict(self.signup_data(), interested_teams=[teams[0].id])
+        one_team = self.client.post(reverse('signup-submit'), data, secure=True).metrics
+        self.client.logout()
+        data = dict(self.signup_data('raptor@gmail.com'), interested_teams=[team.id for team in teams])
+        all_teams = self.client.post(reverse('signup-submit'), data, secure=True).metrics
+        self.assertEqual(all_teams.status, 302)
+        self.assertEqual(all_teams.queries, one_team.queries)
+        self.assertLessEqual(all_teams.queries, all_teams.budget.queries)
+        self.assertEqual(TeamMembership.objects.filter(member__username='raptor@gmail.com').count(), 4)
+
+    def test_signup_existing_user(self):
+        os.environ['RECAPTCHA_TESTING'] = 'True'
+        Team.objects.filter(pk=self.team.pk).update(max_size=10)
+        response = self.client.post(reverse('signup-submit'), self.signup_data('foobar'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('email', response.context['form'].errors)
+
+        self.client.post(reverse('signup-submit'), self.signup_data(), secure=True)
+        self.client.logout()
+        response = self.client.post(reverse('signup-submit'), self.signup_data(), secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(User.objects.filter(username='dino@gmail.com').count(), 1)
+
+    def test_team_choices_are_cached(self):
+        os.environ['RECAPTCHA_TESTING'] = 'True'
+        self.assertEqual(list(SignUpForm().fields['interested_teams'].choices), [(self.team.id, 'Kitchen (1/2)')])
+        with self.assertNumQueries(0):
+            self.assertEqual(len(list(SignUpForm().fields['interested_teams'].choices)), 1)
+
+        # Only the picked teams are counted when checking that they still have room.
+        with self.assertNumQueries(1):
+            self.assertTrue(SignUpForm(self.signup_data()).is_valid())
+
+    def test_full_team_is_rejected_at_submit(self):
+        os.environ['RECAPTCHA_TESTING'] = 'True'
+        self.assertEqual(len(list(SignUpForm().fields['interested_teams'].choices)), 1)
+        # Bulk writes skip the signal that would have dropped the snapshot.
+        other = User.objects.create_user('other', 'other@gmail.com', 'foobarbaz')
+        TeamMembership.objects.bulk_create([TeamMembership(team=self.team, member=other)])
+
+        form = SignUpForm(self.signup_data())
+        self.assertFalse(form.is_valid())
+        self.assertIn('Kitchen filled up', form.errors['interested_teams'][0])
+        self.assertEqual(list(SignUpForm().fields['interested_teams'].choices), [])
+
+    def test_team_filling_up_after_validation(self):
+        os.environ['RECAPTCHA_TESTING'] = 'True'
+        clean_interested_teams = SignUpForm.clean_interested_teams
+
+        def clean_then_fill_team(form):
+            teams = clean_interested_teams(form)
+            # Somebody else takes the last spot between validation and the signup.
+            other = User.objects.create_user('other', 'other@gmail.com', 'foobarbaz')
+            TeamMembership.objects.create(team=self.team, member=other)
+            return teams
+
+        with mock.patch.object(SignUpForm, 'clean_interested_teams', clean_then_fill_team):
+            response = self.client.post(reverse('signup-submit'), self.signup_data(), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Kitchen filled up', response.context['form'].errors['interested_teams'][0])
+        self.assertFalse(User.objects.filter(username='dino@gmail.com').exists())
+        self.assertEqual(self.team.members.count(), 2)
@@ -1,5 +1,11 @@
+import threading
+from typing import List, Tuple
+
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from main.models import Team, UserProfile, TeamMembership
@@ -30,7 +36,8 @@ class TestTeamGetDetailView(TestTeamView):
         membership1.save()
 
         membership2 = TeamMembership(team=self.team, member=self.user)
-        membership2.save()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            membership2.save()
 
         self.client.login(username='foobar', password='foobarbaz')
 
@@ -38,12 +45,129 @@ class TestTeamGetDetailView(TestTeamView):
         self.assertEqual(response.status_code, 200)
 
 
+class TestTeamDetailQueries(TestTeamView):
+    def add_members(self, count: int) -> None:
+        start = self.team.members.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(username='member{}'.format(i), first_name='Member', password='foobarbaz')
+            UserProfile(user=user, playa_name='Dino {}'.format(i)).save()
+            TeamMembership(team=self.team, member=user, is_lead=i == 0).save()
+
+    def get_detail(self) -> Tuple[int, str]:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('team-detail', args=[self.team.id]), secure=True)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.content.decode()
+
+    def test_query_count_is_constant(self) -> None:
+        self.user_profile.is_verified_by_admin = True
+        self.user_profile.save()
+        self.client.login(username='foobar', password='foobarbaz')
+
+        self.add_members(2)
+        few_members_queries, _ = self.get_detail()
+
+        self.add_members(10)
+        many_members_queries, content = self.get_detail()
+
+        self.assertEqual(few_members_queries, many_members_queries)
+        self.assertIn('Member (Dino 0)', content)
+        self.assertIn('Member (Dino 11)', content)
+        self.assertIn('mailto:member0;member1;', content)
+
+
 class TestTeamListView(TestTeamView):
     def test_get(self) -> None:
         self.client.login(username='foobar', password='foobarbaz')
         response = self.client.get(reverse('team-list'), secure=True)
         self.assertEqual(response.status_code, 200)
 
+    def add_teams(self, count: int) -> None:
+        start = Team.objects.count()
+        for i in range(start, start + count):
+            team = Team(name='Team {}'.format(i), description='Do stuff', max_size=2)
+            team.save()
+            for j in range(3):
+                user = User.objects.create_user(username='member{}-{}'.format(i, j), password='foobarbaz')
+                UserProfile(user=user, playa_name='Member').save()
+                TeamMembership(team=team, member=user, is_lead=j == 0).save()
+
+    def count_list_queries(self) -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('team-list'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_is_constant(self) -> None:
+        self.client.login(username='foobar', password='foobarbaz')
+
+        self.add_teams(1)
+        few_teams_queries = self.count_list_queries()
+
+        self.add_teams(5)
+        many_teams_queries = self.count_list_queries()
+
+        self.assertEqual(few_teams_queries, many_teams_queries)
+
+    def test_member_stats(self) -> None:
+        self.add_teams(1)
+        team = Team.objects_with_member_stats().get(name='Team 1')
+        with self.assertNumQueries(0):
+            self.assertEqual(team.member_count, 3)
+            self.assertTrue(team.is_full)
+            self.assertEqual([user.username for user in team.leads], ['member1-0'])
+            self.assertEqual(str(team), 'Team 1 (3/2)')
+
+
+class TestTeamListItemCache(TestTeamView):
+    def setUp(self) -> None:
+        super(TestTeamListItemCache, self).setUp()
+        cache.clear()
+        self.lead = User.objects.create_user(username='lead', first_name='Lena', password='foobarbaz')
+        UserProfile(user=self.lead).save()
+        self.client.login(username='foobar', password='foobarbaz')
+
+    def get_list(self) -> str:
+        response = self.client.get(reverse('team-list'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_details_are_cached_until_saved(self) -> None:
+        self.assertIn('Cook stuff', self.get_list())
+
+        Team.objects.filter(pk=self.team.pk).update(description='Bake stuff')
+        self.assertIn('Cook stuff', self.get_list())
+
+        self.team.description = 'Bake stuff'
+        self.team.save()
+        self.assertIn('Bake stuff', self.get_list())
+
+    def test_lead_changes_invalidate_details(self) -> None:
+        self.assertNotIn('Lena', self.get_list())
+
+        membership = TeamMembership(team=self.team, member=self.lead, is_lead=True)
+        membership.save()
+        self.assertIn('Lena', self.get_list())
+
+        self.lead.first_name = 'Lina'
+        self.lead.save()
+        self.assertIn('Lina', self.get_list())
+
+        profile = self.lead.profile
+        profile.playa_name = 'Spark'
+        profile.save()
+        self.assertIn('Lina (Spark)', self.get_list())
+
+        membership.delete()
+        self.assertNotIn('Lina', self.get_list())
+
+    def test_membership_counts_are_not_cached(self) -> None:
+        self.team.max_size = 5
+        self.team.save()
+        self.assertIn('0/5 dinos', self.get_list())
+        Team.objects.filter(pk=self.team.pk).update(max_size=6)
+        self.assertIn('0/6 dinos', self.get_list())
+
 
 class TestTeamToggleMembershipView(TestTeamView):
     def test_toggle(self) -> None:
@@ -62,3 +186,41 @@ class TestTeamToggleMembershipView(TestTeamView):
                                     follow=True)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(list(self.user.teams.all())), 0)
+
+
+class TestTeamConcurrentJoinView(TransactionTestCase):
+    NUM_CLIENTS = 12
+
+    def setUp(self) -> None:
+        self.team = Team(name='Kitchen', description='Cook stuff', max_size=3)
+        self.team.save()
+
+        self.clients = []  # type: List[Client]
+        for i in range(self.NUM_CLIENTS):
+            user = User.objects.create_user(username='camper{}'.format(i), password='foobarbaz')
+            UserProfile(user=user).save()
+            client = Client()
+            client.login(username=user.username, password='foobarbaz')
+            self.clients.append(client)
+
+    def test_concurrent_joins_respect_max_size(self) -> None:
+        barrier = threading.Barrier(self.NUM_CLIENTS)
+        status_codes = []  # type: List[int]
+
+        def join(client: Client) -> None:
+            try:
+                barrier.wait()
+                response = client.post(reverse('join-leave-team', args=[self.team.id]), secure=True)
+                status_codes.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=join, args=(client,)) for client in self.clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(TeamMembership.objects.filter(team=self.team).count(), self.team.max_size)
+        self.assertEqual(status_codes.count(302), self.team.max_size)
+        self.assertEqual(status_codes.count(400), self.NUM_CLIENTS - self.team.max_size)
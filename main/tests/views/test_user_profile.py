@@ -1,16 +1,27 @@
 import os
-from typing import Dict
+import tempfile
+from io import BytesIO, StringIO
+from typing import Dict, List, Tuple
+from unittest import mock
 
 import boto3
 from django.contrib.auth.models import User
+from django.contrib.staticfiles.templatetags.staticfiles import static
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, RequestFactory
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from moto import mock_s3
 from moto import mock_s3_deprecated as mock_s3_b2
+from PIL import Image
 
+from main.images import process_picture, resize_image, upload_original
 from main.models import UserProfile, FoodRestriction, Skill, Team
 from main.models.attendance_profile import AttendanceProfileForm, AttendanceProfile
+from main.views.user_profile import PROFILES_PER_PAGE
 from playacamp import settings
 
 
@@ -63,6 +74,176 @@ class TestUserProfileGetView(TestUserProfileView):
         self.assertEqual(response.status_code, 200)
 
 
+class TestUserProfileListView(TestUserProfileView):
+    def setUp(self) -> None:
+        super(TestUserProfileListView, self).setUp()
+        self.user_profile.is_verified_by_admin = True
+        self.user_profile.save()
+
+    def add_verified_profiles(self, count: int) -> None:
+        start = User.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(username='camper{}'.format(i),
+                                            email='camper{}@gmail.com'.format(i),
+                                            first_name='Camper',
+                                            password='foobarbaz')
+            UserProfile(user=user, is_verified_by_admin=True).save()
+
+    def count_list_queries(self) -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('user-profile-list'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_is_constant(self) -> None:
+        self.client.login(username='foobar', password='foobarbaz')
+
+        self.add_verified_profiles(3)
+        few_profiles_queries = self.count_list_queries()
+
+        self.add_verified_profiles(PROFILES_PER_PAGE + 10)
+        many_profiles_queries = self.count_list_queries()
+
+        self.assertEqual(few_profiles_queries, many_profiles_queries)
+
+    def test_pagination(self) -> None:
+        self.client.login(username='foobar', password='foobarbaz')
+        self.add_verified_profiles(PROFILES_PER_PAGE + 10)
+        expected_ids = set(UserProfile.objects.filter(is_verified_by_admin=True).values_list('pk', flat=True))
+
+        seen_ids = []
+        url = reverse('user-profile-list')
+        while url:
+            response = self.client.get(url, secure=True)
+            self.assertEqual(response.status_code, 200)
+            seen_ids.extend(profile.pk for profile in response.context['profiles'])
+            next_page_url = response.context['next_page_url']
+            url = reverse('user-profile-list') + next_page_url if next_page_url else None
+
+        self.assertEqual(len(seen_ids), len(expected_ids))
+        self.assertEqual(set(seen_ids), expected_ids)
+
+    def test_invalid_cursor(self) -> None:
+        self.client.login(username='foobar', password='foobarbaz')
+        response = self.client.get(reverse('user-profile-list'), {'after': 'foo'}, secure=True)
+        self.assertEqual(response.status_code, 400)
+
+
+class TestUserProfileSummaryCache(TestUserProfileView):
+    def setUp(self) -> None:
+        super(TestUserProfileSummaryCache, self).setUp()
+        cache.clear()
+        self.user_profile.is_verified_by_admin = True
+        self.user_profile.save()
+        self.user_profile2.is_verified_by_admin = True
+        self.user_profile2.playa_name = 'Rex'
+        self.user_profile2.save()
+        self.client.login(username='foobar', password='foobarbaz')
+
+    def get_list(self) -> str:
+        response = self.client.get(reverse('user-profile-list'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_summary_is_cached_until_saved(self) -> None:
+        self.assertIn('(Rex)', self.get_list())
+
+        # Bypassing the model doesn't bump `updated_at`, so the cached fragment is served.
+        UserProfile.objects.filter(pk=self.user_profile2.pk).update(playa_name='Trex')
+        self.assertIn('(Rex)', self.get_list())
+
+        self.user_profile2.playa_name = 'Trex'
+        self.user_profile2.save()
+        self.assertIn('(Trex)', self.get_list())
+
+    def test_user_changes_invalidate_summary(self) -> None:
+        self.get_list()
+        user = self.user_profile2.user
+        user.email = 'newaddress@gmail.com'
+        user.save()
+        self.assertIn('newaddress@gmail.com', self.get_list())
+
+    def test_login_keeps_summary_cached(self) -> None:
+        before = UserProfile.objects.get(pk=self.user_profile2.pk).updated_at
+        self.client.login(username='bazqux', password='foobarbaz')
+        self.assertEqual(UserProfile.objects.get(pk=self.user_profile2.pk).updated_at, before)
+
+
+class TestUserProfileSearchView(TestUserProfileView):
+    def setUp(self) -> None:
+        super(TestUserProfileSearchView, self).setUp()
+        self.user_profile.is_verified_by_admin = True
+        self.user_profile.save()
+
+        self.welding = Skill(name='Welding', description='Sparks')
+        self.welding.save()
+
+        self.alice = self.create_profile('alice', first_name='Alice', last_name='Welder', playa_name='Sparky')
+        self.bob = self.create_profile('bob', first_name='Bob', biography='I once met a welder.')
+        self.carol = self.create_profile('carol', first_name='Carol')
+        self.carol.skills.add(self.welding)
+        self.dave = self.create_profile('dave', first_name='Dave', last_name='Welder', verified=False)
+
+    def create_profile(self, username: str, verified: bool=True, first_name: str='', last_name: str='',
+                       **kwargs) -> UserProfile:
+        user = User.objects.create_user(username=username,
+                                        email='{}@gmail.com'.format(username),
+                                        first_name=first_name,
+                                        last_name=last_name,
+                                        password='foobarbaz')
+        profile = UserProfile(user=user, is_verified_by_admin=verified, **kwargs)
+        profile.save()
+        return profile
+
+    def search(self, query: str) -> List[UserProfile]:
+        response = self.client.get(reverse('user-profile-list'), {'search': query}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['profiles'])
+
+    def test_search_ranking(self) -> None:
+        self.client.login(username='foobar', password='foobarbaz')
+        results = self.search('weld')
+        self.assertEqual(results, [self.alice, self.carol, self.bob])
+
+    def test_search_playa_name_and_email(self) -> None:
+        self.client.login(username='foobar', password='foobarbaz')
+        self.assertEqual(self.search('sparky'), [self.alice])
+        self.assertEqual(self.search('bob@gmail'), [self.bob])
+        self.assertEqual(self.search('"'), [])
+
+    def test_search_index_follows_updates(self) -> None:
+        self.client.login(username='foobar', password='foobarbaz')
+
+        self.carol.user.last_name = 'Glassblower'
+        self.carol.user.save()
+        self.assertEqual(self.search('glassblower'), [self.carol])
+
+        self.carol.skills.remove(self.welding)
+        self.assertEqual(self.search('welding'), [])
+
+        self.dave.is_verified_by_admin = True
+        self.dave.save()
+        self.assertIn(self.dave, self.search('welder'))
+
+        self.alice.is_verified_by_admin = False
+        self.alice.save()
+        self.assertNotIn(self.alice, self.search('welder'))
+
+    def test_deleted_skill_leaves_the_index(self) -> None:
+        self.client.login(username='foobar', password='foobarbaz')
+        self.welding.name = 'Brazing'
+        self.welding.save()
+        self.assertEqual(self.search('brazing'), [self.carol])
+
+        self.welding.delete()
+        self.assertEqual(self.search('brazing'), [])
+
+    def test_login_does_not_reindex(self) -> None:
+        with CaptureQueriesContext(connection) as context:
+            self.assertTrue(self.client.login(username='alice', password='foobarbaz'))
+        self.assertFalse([query for query in context.captured_queries if 'main_profilesearch' in query['sql']])
+
+
 class TestUserProfileUpdateBasicsView(TestUserProfileView):
     def build_basics_data(self, **kwargs) -> Dict[str, str]:
         data = {
@@ -376,6 +557,17 @@ class TestUpdatedSkillsView(TestUserProfileView):
         self.user_profile.refresh_from_db()
         self.assertEqual({s.id for s in self.user_profile.skills.all()}, set())
 
+    def test_updated_skills_ignores_unknown_ids(self) -> None:
+        self.client.login(username='foobar', password='foobarbaz')
+
+        response = self.client.post(reverse('updated-skills'),
+                                    data={'skills[]': [self.coding.id, self.coding.id + 100]},
+                                    secure=True,
+                                    follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({s.id for s in self.user_profile.skills.all()}, {self.coding.id})
+        self.assertEqual([s.id for s in response.context['other_skills']], [self.heavy_lifting.id])
+
 
 class TestUpdatedFoodRestrictionsView(TestUserProfileView):
     def setUp(self) -> None:
@@ -458,9 +650,114 @@ class TestUpdateProfilePictureView(TestUserProfileView):
                                         follow=True)
         self.assertEqual(response.status_code, 200)
         bucket = self.s3_conn.Bucket(settings.AWS_STORAGE_BUCKET_NAME)
-        objects = list(bucket.objects.all())
-        self.assertEqual(len(objects), 1)
-        self.assertEqual(objects[0].key,
-                         os.path.join(settings.MEDIAFILES_LOCATION,
-                                      'profile_pictures',
-                                      'photo.png'))
+        keys = sorted(obj.key for obj in bucket.objects.all())
+        self.assertEqual(len(keys), 1 + len(UserProfile.PROFILE_PICTURE.sizes))
+        self.assertIn(os.path.join(settings.MEDIAFILES_LOCATION, 'profile_pictures', 'originals', 'photo.png'), keys)
+        self.user_profile.refresh_from_db()
+        self.assertIn(os.path.join(settings.MEDIAFILES_LOCATION, self.user_profile.profile_picture.name), keys)
+
+
+class TestProfilePicturePipeline(TestUserProfileView):
+    def setUp(self) -> None:
+        self.media_root = tempfile.TemporaryDirectory()
+        self.storage_settings = override_settings(
+            DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+            MEDIA_ROOT=self.media_root.name,
+            IMAGE_PROCESSING_EAGER=False,
+        )
+        self.storage_settings.enable()
+        super(TestProfilePicturePipeline, self).setUp()
+
+    def tearDown(self) -> None:
+        super(TestProfilePicturePipeline, self).tearDown()
+        self.storage_settings.disable()
+        self.media_root.cleanup()
+
+    @staticmethod
+    def make_upload(name: str='photo.png', size: Tuple[int, int]=(1024, 768)) -> SimpleUploadedFile:
+        buffer = BytesIO()
+        Image.new('RGB', size, 'orange').save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+    def test_upload_returns_before_processing(self) -> None:
+        self.client.login(username='foobar', password='foobarbaz')
+        with mock.patch('main.images.resize_image') as resize_image:
+            response = self.client.post(reverse('profile-pic-form-submit'), data={'file': self.make_upload()},
+                                        secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(resize_image.called)
+
+        profile = UserProfile.objects.get(pk=self.user_profile.pk)
+        self.assertTrue(profile.profile_picture_processing)
+        self.assertEqual(profile.profile_picture_original.name, 'profile_pictures/originals/photo.png')
+        self.assertFalse(profile.profile_picture)
+        self.assertEqual(profile.profile_pic_url(), static('default-profile-pic.png'))
+
+        self.assertEqual(profile.profile_pic_srcset(), '')
+
+        process_picture(UserProfile, profile.pk, UserProfile.PROFILE_PICTURE)
+        profile.refresh_from_db()
+        self.assertFalse(profile.profile_picture_processing)
+        self.assertRegex(profile.profile_picture.name, r'^profile_pictures/photo-[0-9a-f]{8}-512\.webp$')
+        self.assertEqual(profile.profile_pic_url(), settings.MEDIA_URL + profile.profile_picture.name)
+        with Image.open(profile.profile_picture.path) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (512, 384)))
+
+    def test_variants(self) -> None:
+        self.user_profile.is_verified_by_admin = True
+        self.user_profile.save()
+        upload_original(self.user_profile, UserProfile.PROFILE_PICTURE, self.make_upload())
+        process_picture(UserProfile, self.user_profile.pk, UserProfile.PROFILE_PICTURE)
+        profile = UserProfile.objects.get(pk=self.user_profile.pk)
+        base_url = profile.profile_pic_url()[:-len('512.webp')]
+
+        self.assertEqual(profile.profile_pic_url(75), base_url + '128.webp')
+        self.assertEqual(profile.profile_pic_url(64), base_url + '64.webp')
+        self.assertEqual(profile.profile_pic_url(1000), base_url + '512.webp')
+        self.assertEqual(profile.profile_pic_srcset(),
+                         ', '.join('{}{}.webp {}w'.format(base_url, size, size) for size in (64, 128, 256, 512)))
+        for size in (64, 128, 256, 512):
+            path = os.path.join(self.media_root.name, profile.profile_picture.name.replace('512', str(size)))
+            with Image.open(path) as image:
+                self.assertEqual(image.size, (size, size * 3 // 4))
+
+        self.client.login(username='foobar', password='foobarbaz')
+        response = self.client.get(reverse('user-profile-list'), secure=True)
+        self.assertContains(response, 'srcset="{}"'.format(profile.profile_pic_srcset()))
+
+    def test_pictures_without_variants(self) -> None:
+        UserProfile.objects.filter(pk=self.user_profile.pk).update(profile_picture='profile_pictures/photo.png')
+        profile = UserProfile.objects.get(pk=self.user_profile.pk)
+        self.assertEqual(profile.profile_pic_url(64), settings.MEDIA_URL + 'profile_pictures/photo.png')
+        self.assertEqual(profile.profile_pic_srcset(), '')
+
+        profile.profile_picture.storage.save('profile_pictures/photo.png', self.make_upload())
+        call_command('reprocesspictures', stdout=StringIO())
+        profile.refresh_from_db()
+        self.assertEqual(profile.profile_picture_original.name, 'profile_pictures/photo.png')
+        self.assertEqual(profile.profile_pic_url(64), profile.profile_pic_url()[:-len('512.webp')] + '64.webp')
+
+    def test_superseded_original_is_discarded(self) -> None:
+        upload_original(self.user_profile, UserProfile.PROFILE_PICTURE, self.make_upload('first.png'))
+
+        def upload_newer_while_resizing(*args):
+            UserProfile.objects.filter(pk=self.user_profile.pk)\
+                .update(profile_picture_original='profile_pictures/originals/second.png')
+            return resize_image(*args)
+
+        with mock.patch('main.images.resize_image', side_effect=upload_newer_while_resizing):
+            process_picture(UserProfile, self.user_profile.pk, UserProfile.PROFILE_PICTURE)
+
+        profile = UserProfile.objects.get(pk=self.user_profile.pk)
+        self.assertTrue(profile.profile_picture_processing)
+        self.assertFalse(profile.profile_picture)
+        self.assertEqual(os.listdir(os.path.join(self.media_root.name, 'profile_pictures')), ['originals'])
+
+    def test_invalid_image(self) -> None:
+        upload = SimpleUploadedFile('notes.png', b'not an image', 'image/png')
+        upload_original(self.user_profile, UserProfile.PROFILE_PICTURE, upload)
+        with self.assertLogs('main.images', level='ERROR'):
+            process_picture(UserProfile, self.user_profile.pk, UserProfile.PROFILE_PICTURE)
+        profile = UserProfile.objects.get(pk=self.user_profile.pk)
+        self.assertFalse(profile.profile_picture_processing)
+        self.assertFalse(profile.profile_picture)
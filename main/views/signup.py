@@ -1,12 +1,15 @@
+from typing import Any, Dict, List, Tuple
+
 from captcha.fields import ReCaptchaField
 from django import forms
-from django.contrib.auth import authenticate, login
+from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError, transaction
-from django.db.models import F
+from django.db.models import Count
 from django.http import HttpResponseBadRequest, HttpResponse, HttpRequest
 from django.shortcuts import render, redirect
+from django.utils import timezone
 
 from main.models import UserProfile, Team, TeamMembership
 
@@ -16,14 +19,19 @@ from main.models import UserProfile, Team, TeamMembership
 from playacamp import settings
 
 
+def open_team_choices() -> List[Tuple[int, str]]:
+    return [(team.id, str(team)) for team in Team.open_teams()]
+
+
 class SignUpForm(forms.Form):
     first_name = forms.CharField(label="What's your first name, little dino?", max_length=30)
     last_name = forms.CharField(label="And your last name?", max_length=30)
     years_on_playa = forms.IntegerField(label="Nice to meet you! So how many years have you gone to Burning Man?")
-    interested_teams = forms.ModelMultipleChoiceField(
+    interested_teams = forms.TypedMultipleChoiceField(
         label='Which teams are you interested in joining? (you can always change it later)',
         widget=forms.CheckboxSelectMultiple,
-        queryset=Team.objects_ordered_by_remaining_space().filter(num_members__lt=F('max_size')))
+        coerce=int,
+        choices=open_team_choices)
     invited_by = forms.CharField(label="Who invited you to LED Dinosaur?", max_length=64)
     email = forms.EmailField(label="Cool! What's your email so we can keep you up to date?")
     password = forms.CharField(label="And a password so we can identify you!",
@@ -45,10 +53,28 @@ class SignUpForm(forms.Form):
         if password != duplicate_password:
             raise ValidationError('Passwords must match!')
 
+    def clean_interested_teams(self) -> List[Team]:
+        # The choices come from a cached snapshot, so make sure the picked teams still
+        # have room, counting only their own memberships.
+        team_ids = set(self.cleaned_data['interested_teams'])
+        teams = list(Team.objects.filter(pk__in=team_ids).annotate(num_members=Count('members')))
+        unavailable = [team.name for team in teams if team.is_full]
+        if unavailable or len(teams) != len(team_ids):
+            Team.forget_open_teams()
+            raise ValidationError('{} filled up in the meantime, please pick again.'.format(
+                ', '.join(unavailable) or 'A team'))
+        return teams
+
     def clean_phone(self) -> str:
         return UserProfile.parse_phone_number(self.cleaned_data['phone'])
 
 
+class TeamFilledUp(Exception):
+    def __init__(self, team: Team) -> None:
+        super().__init__(team.name)
+        self.team = team
+
+
 def registration_closed(request: HttpRequest) -> HttpResponse:
     return render(request, 'registration/closed.html')
 
@@ -77,33 +103,62 @@ def post(request: HttpRequest) -> HttpResponse:
             'form': form,
         })
 
+    try:
+        user = create_camper(form.cleaned_data)
+    except TeamFilledUp as e:
+        Team.forget_open_teams()
+        form.add_error('interested_teams', '{} filled up in the meantime, please pick again.'.format(e.team.name))
+        return render(request, 'registration/signup.html', context={
+            'form': form,
+        })
+    except IntegrityError as e:
+        if str(e) == 'UNIQUE constraint failed: auth_user.username':
+            return HttpResponseBadRequest('User already exists.')
+        raise
+
+    # The password was just checked by the form, so there's no need for `authenticate()`
+    # to hash it again.
+    login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+    return redirect(user.profile)
+
+
+def create_camper(data: Dict[str, Any]) -> User:
+    """
+    Creates the user, profile and team memberships for the cleaned data of a
+    `SignUpForm` in a single transaction, hashing the password exactly once. Raises
+    `TeamFilledUp`, creating nothing, if one of the teams has no room left.
+    """
     with transaction.atomic():
-        try:
-            User.objects.create_user(username=form.cleaned_data['email'],
-                                     email=form.cleaned_data['email'],
-                                     password=form.cleaned_data['password'],
-                                     first_name=form.cleaned_data['first_name'],
-                                     last_name=form.cleaned_data['last_name'])
-        except IntegrityError as e:
-            if str(e) == 'UNIQUE constraint failed: auth_user.username':
-                return HttpResponseBadRequest('User already exists.')
-            raise
-
-        user = authenticate(username=form.cleaned_data['email'],
-                            password=form.cleaned_data['password'])
-        assert user is not None
-
-        user_profile = UserProfile()
-        user_profile.years_on_playa = form.cleaned_data['years_on_playa']
-        user_profile.invited_by = form.cleaned_data['invited_by']
-        user_profile.phone_number = form.cleaned_data['phone']
-        user_profile.zipcode = form.cleaned_data['zipcode']
-        user_profile.user = user
-        user_profile.save()
-
-        for team in form.cleaned_data['interested_teams']:
-            membership = TeamMembership(member=user, team=team)
-            membership.save()
-
-        login(request, user)
-        return redirect(user_profile)
+        user = User(username=data['email'],
+                    email=data['email'],
+                    first_name=data['first_name'],
+                    last_name=data['last_name'])
+        user.set_password(data['password'])
+        user.save()
+
+        # The profile isn't indexed or shown in a cached fragment yet, so skipping its
+        # signal handlers with `bulk_create` loses nothing but queries.
+        profile = UserProfile(user=user,
+                              years_on_playa=data['years_on_playa'],
+                              invited_by=data['invited_by'],
+                              phone_number=data['phone'],
+                              zipcode=data['zipcode'])
+        UserProfile.objects.bulk_create([profile])
+        # `clean_interested_teams` checked for room without any lock, so check again with
+        # all of the picked teams locked, as `Team.join` does for one.
+        teams = sorted(data['interested_teams'], key=lambda team: team.pk)
+        if teams:
+            team_ids = [team.pk for team in teams]
+            max_sizes = Team.lock_for_joining(team_ids)
+            member_counts = dict(TeamMembership.objects.filter(team_id__in=team_ids)
+                                 .values_list('team_id').annotate(Count('id')).order_by())
+            for team in teams:
+                if member_counts.get(team.pk, 0) >= max_sizes.get(team.pk, 0):
+                    raise TeamFilledUp(team)
+            TeamMembership.objects.bulk_create([TeamMembership(team=team, member=user) for team in teams])
+            # What the membership signal handlers would have done for each team.
+            Team.objects.filter(pk__in=team_ids).update(updated_at=timezone.now())
+    if teams:
+        Team.forget_open_teams()
+    user.profile = profile
+    return user
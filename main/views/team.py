@@ -8,13 +8,8 @@ from main.models import Team
 @login_required
 def get(request: HttpRequest, team_id: int) -> HttpResponse:
     is_allowed_to_view_members = request.user.profile.is_verified_by_admin
-    team = Team.objects.get(pk=team_id)
-    try:
-        my_team = request.user.teams.filter(pk=team_id).first()
-    except Team.DoesNotExist:
-        my_team = None
-
-    is_member = my_team is not None
+    team = Team.objects_with_members().get(pk=team_id)
+    is_member = any(membership.member_id == request.user.pk for membership in team.all_memberships)
 
     return render(request, 'team/detail.html', context={
         'profile': request.user.profile,
@@ -26,8 +21,8 @@ def get(request: HttpRequest, team_id: int) -> HttpResponse:
 
 @login_required
 def list(request: HttpRequest) -> HttpResponse:
-    teams = Team.objects_ordered_by_remaining_space().all()
-    my_team_ids = [team.id for team in request.user.teams.all()]
+    teams = Team.objects_with_member_stats()
+    my_team_ids = set(request.user.memberships.values_list('team_id', flat=True))
     return render(request, 'team/list.html', context={
         'profile': request.user.profile,
         'my_team_ids': my_team_ids,
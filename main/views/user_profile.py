@@ -1,11 +1,11 @@
 import sys
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 
 import phonenumbers
 from django import forms
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q
+from django.db.models import Q, prefetch_related_objects
 from django.db.models.functions import Lower
 from django.http import Http404, HttpResponseBadRequest, HttpResponse, HttpRequest
 from django.shortcuts import render, redirect
@@ -13,29 +13,67 @@ from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.http import urlencode
 
-from main.models import Skill, FoodRestriction, UserProfile, SocialMediaLink, Team, TeamMembership
+from main.images import upload_original
+from main.models import UserProfile, SocialMediaLink, Team, TeamMembership
 from main.models.attendance_profile import AttendanceProfile, AttendanceProfileForm
 from main.models.user_profile import requires_verified_by_admin
 from main.models.util import find_labor_day_for_year, get_next_event_year
+from main.search import search_profiles
 from main.views.notification import Notification
 
 
+PROFILES_PER_PAGE = 48
+
+
+def parse_profile_cursor(cursor: str) -> Tuple[str, int]:
+    """Splits an `after` cursor of the form `<lowercased first name>:<pk>`."""
+    sort_name, _, pk = cursor.rpartition(':')
+    return sort_name, int(pk)
+
+
 @requires_verified_by_admin
 def list_profiles(request: HttpRequest) -> HttpResponse:
     search_query = request.GET.get('search')
-    if search_query is None:
-        profiles = UserProfile.objects
-    else:
-        profiles = UserProfile.objects.filter(Q(playa_name__contains=search_query) |
-                                              Q(user__email__contains=search_query) |
-                                              Q(user__first_name__contains=search_query) |
-                                              Q(user__last_name__contains=search_query))
-    profiles = profiles.filter(is_verified_by_admin=True).order_by(Lower('user__first_name'))
+    profiles = UserProfile.objects.select_related('user').filter(is_verified_by_admin=True)
+
+    if search_query:
+        # Search results come back ranked from the search index, so there's a single page
+        # of the best matches rather than an alphabetical listing.
+        user_ids = search_profiles(search_query, limit=PROFILES_PER_PAGE)
+        profiles_by_id = profiles.in_bulk(user_ids)
+        return render(request, 'user_profile/list.html', context={
+            'profile': request.user.profile,
+            'profiles': [profiles_by_id[user_id] for user_id in user_ids if user_id in profiles_by_id],
+            'search_query': search_query,
+            'next_page_url': None,
+        })
+
+    profiles = profiles.annotate(sort_name=Lower('user__first_name')).order_by('sort_name', 'pk')
+
+    # Keyset pagination: each page picks up strictly after the last (name, pk) of the
+    # previous one, so the cost of a page doesn't depend on how deep into the list it is.
+    cursor = request.GET.get('after')
+    if cursor:
+        try:
+            sort_name, pk = parse_profile_cursor(cursor)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid page')
+        profiles = profiles.filter(Q(sort_name__gt=sort_name) | Q(sort_name=sort_name, pk__gt=pk))
+
+    page = list(profiles[:PROFILES_PER_PAGE + 1])
+    next_page_url = None
+    if len(page) > PROFILES_PER_PAGE:
+        page = page[:PROFILES_PER_PAGE]
+        last = page[-1]
+        next_page_url = '?' + urlencode({'after': '{}:{}'.format(last.sort_name, last.pk)})
+
     return render(request, 'user_profile/list.html', context={
         'profile': request.user.profile,
-        'profiles': profiles.all(),
-        'search_query': search_query or '',
+        'profiles': page,
+        'search_query': '',
+        'next_page_url': next_page_url,
     })
 
 
@@ -56,21 +94,8 @@ def get(request: HttpRequest, user_id: Optional[int]=None) -> HttpResponse:
         # editable we don't want to display a form.
         attendance_form = None
 
-    all_skills_by_name = {s.name: s for s in Skill.objects.all()}
-    my_skills_by_name = {s.name: s for s in user.profile.skills.all()}
-    other_skills_by_name = {}
-    for skill_name in all_skills_by_name:
-        if skill_name in my_skills_by_name:
-            continue
-        other_skills_by_name[skill_name] = all_skills_by_name[skill_name]
-
-    all_food_restrictions_by_name = {fr.name: fr for fr in FoodRestriction.objects.all()}
-    my_food_restrictions_by_name = {fr.name: fr for fr in user.profile.food_restrictions.all()}
-    other_food_restrictions_by_name = {}
-    for fr_name in all_food_restrictions_by_name:
-        if fr_name in my_food_restrictions_by_name:
-            continue
-        other_food_restrictions_by_name[fr_name] = all_food_restrictions_by_name[fr_name]
+    # Prefetched so that the templates listing them reuse the same rows.
+    prefetch_related_objects([user.profile], 'skills', 'food_restrictions')
 
     notifications = []
     if is_logged_in_user:
@@ -87,8 +112,8 @@ def get(request: HttpRequest, user_id: Optional[int]=None) -> HttpResponse:
         'is_editable': is_logged_in_user,
         'attendance_form': attendance_form,
         'messages': messages.get_messages(request),
-        'other_skills': other_skills_by_name.values(),
-        'other_food_restrictions': other_food_restrictions_by_name.values(),
+        'other_skills': user.profile.other_skills(),
+        'other_food_restrictions': user.profile.other_food_restrictions(),
         'notifications': notifications,
     })
 
@@ -167,6 +192,7 @@ def changed_attending(request: HttpRequest) -> HttpResponse:
         if attendance.deleted_at is not None:
             attendance.deleted_at = None
             attendance.save()
+            request.user.profile.clear_cached_attendance()
             return redirect('user-profile-me')
 
         return update_attendance_record(request, attendance)
@@ -182,6 +208,7 @@ def create_attendance_record(request: HttpRequest, year: int) -> HttpResponse:
 
     attendance = AttendanceProfile(user=request.user, year=year)
     attendance.save()
+    request.user.profile.clear_cached_attendance()
     return redirect('user-profile-me')
 
 
@@ -191,6 +218,7 @@ def delete_attendance_record(request: HttpRequest, attendance: AttendanceProfile
 
     attendance.deleted_at = timezone.now()
     attendance.save()
+    request.user.profile.clear_cached_attendance()
 
     return redirect('user-profile-me')
 
@@ -202,6 +230,7 @@ def update_attendance_record(request: HttpRequest, attendance: AttendanceProfile
     form = AttendanceProfileForm(request.POST, instance=attendance)
     if form.is_valid():
         form.save()
+        request.user.profile.clear_cached_attendance()
 
         ensure_early_crew(attendance.user, member=attendance.arrives_early)
         ensure_late_crew(attendance.user, member=attendance.departs_late)
@@ -233,10 +262,9 @@ def updated_skills(request: HttpRequest) -> HttpResponse:
 
     profile = request.user.profile
     current_skill_ids = {int(skill_id) for skill_id in request.POST.getlist('skills[]', [])}
-    all_skills = Skill.objects.all()
-
-    profile.skills.set([s for s in all_skills if s.id in current_skill_ids])
-    profile.save()
+    if profile.update_skills(current_skill_ids):
+        # Bumps the stamp of the cached profile fragments.
+        profile.save()
 
     return redirect('user-profile-me')
 
@@ -248,10 +276,8 @@ def updated_food_restrictions(request: HttpRequest) -> HttpResponse:
 
     profile = request.user.profile
     current_restriction_ids = {int(rid) for rid in request.POST.getlist('food_restrictions[]', [])}
-    all_food_restrictions = FoodRestriction.objects.all()
-
-    profile.food_restrictions.set([fr for fr in all_food_restrictions if fr.id in current_restriction_ids])
-    profile.save()
+    if profile.update_food_restrictions(current_restriction_ids):
+        profile.save()
 
     return redirect('user-profile-me')
 
@@ -274,7 +300,5 @@ def submit_profile_picture_form(request: HttpRequest) -> HttpResponse:
     if request.method != 'POST':
         raise Http404
     sys.stdout.flush()
-    profile = request.user.profile
-    profile.profile_picture = request.FILES['file']
-    profile.save()
+    upload_original(request.user.profile, UserProfile.PROFILE_PICTURE, request.FILES['file'])
     return redirect('user-profile-me')
@@ -52,6 +52,8 @@ MIDDLEWARE_CLASSES = (
     # Simplified static file serving.
     # https://warehouse.python.org/project/whitenoise/
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Query counts and timings for every request, checked against per-view budgets.
+    'main.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -102,6 +104,23 @@ if 'test' in sys.argv:
         'NAME': os.path.join(BASE_DIR, 'test_db'),
     }
 
+# Caches rendered template fragments, the reference data versions and the open teams
+# snapshot. Every worker has to see the same versions and snapshot, so in production
+# (where Heroku sets DATABASE_URL) the default is the database cache, whose table the
+# release step creates with `createcachetable`; `main.checks` refuses a process-local
+# cache there. Development and tests keep to process memory. CACHE_BACKEND and
+# CACHE_LOCATION override either.
+if 'DATABASE_URL' in os.environ and 'test' not in sys.argv:
+    DEFAULT_CACHE_BACKEND, DEFAULT_CACHE_LOCATION = 'django.core.cache.backends.db.DatabaseCache', 'playacamp_cache'
+else:
+    DEFAULT_CACHE_BACKEND, DEFAULT_CACHE_LOCATION = 'django.core.cache.backends.locmem.LocMemCache', 'playacamp'
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', DEFAULT_CACHE_BACKEND),
+        'LOCATION': os.environ.get('CACHE_LOCATION', DEFAULT_CACHE_LOCATION),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
 
@@ -148,6 +167,10 @@ LOGGING = {
     },
 }
 
+if 'test' in sys.argv:
+    # Keep the per-request metrics out of the test output; going over budget still shows.
+    LOGGING['loggers']['main.middleware'] = {'level': 'WARNING'}
+
 # We want to propagate exceptions so that they get logged to stdout.
 DEBUG_PROPAGATE_EXCEPTIONS = True
 
@@ -206,6 +229,11 @@ MEDIAFILES_LOCATION = 'media'
 MEDIA_URL = "https://%s/%s/" % (AWS_S3_CUSTOM_DOMAIN, MEDIAFILES_LOCATION)
 DEFAULT_FILE_STORAGE = 'playacamp.custom_storages.MediaStorage'
 
+# Uploaded pictures are resized by a pool of background threads (see main.images). Tests
+# can't see work committed from other threads, so they process pictures inline.
+IMAGE_PROCESSING_WORKERS = int(os.environ.get('IMAGE_PROCESSING_WORKERS', 2))
+IMAGE_PROCESSING_EAGER = 'test' in sys.argv
+
 LOGIN_URL = "/login"
 LOGIN_REDIRECT_URL = "/profile/me"
 